@@ -0,0 +1,306 @@
+from array import array
+from typing import Dict, List, Optional
+from operatorplus.operator_info import OperatorInfo
+from operatorplus.operator_manager import OperatorManager
+from expression.base_converter import BaseConverter
+from expression.expression_base_converter import ExpressionBaseConverter
+from expression.expression_node import (
+    NUMBER_NODE,
+    VARIABLE_NODE,
+    BINARY_NODE,
+    UNARY_NODE,
+)
+
+NO_CHILD = -1
+
+# Position of a node relative to its parent, see ExpressionNode.position
+POSITIONS = (None, "left", "right", "unary")
+POSITION_CODES = {position: code for code, position in enumerate(POSITIONS)}
+
+
+class OperatorTable:
+    """
+    Maps operators to small integer indices so trees can store an index instead of an `OperatorInfo` reference.
+
+    A table is shared by all trees built by the same generator.
+    """
+
+    __slots__ = ("operators", "indices")
+
+    def __init__(self, operators: Optional[List[OperatorInfo]] = None):
+        """
+        Initializes the table.
+
+        Parameters:
+            operators (List[OperatorInfo], optional): Operators to register up front.
+        """
+        self.operators: List[OperatorInfo] = []
+        self.indices: Dict[str, int] = {}
+        for operator in operators or []:
+            self.index_of(operator)
+
+    @classmethod
+    def from_manager(cls, operator_manager: OperatorManager) -> "OperatorTable":
+        """
+        Creates the table of a manager's operators, in the order of its operators file.
+
+        The indices only depend on the operators file, so trees encoded with one such table (see
+        `tree_codec.encode_tree`) can be decoded in any other process loading the same file.
+
+        Parameters:
+            operator_manager (OperatorManager): The operator manager.
+
+        Returns:
+            OperatorTable: The table.
+        """
+        return cls(list(operator_manager.operators.values()))
+
+    def index_of(self, operator: OperatorInfo) -> int:
+        """
+        Returns the index of an operator, registering it on first use.
+
+        Parameters:
+            operator (OperatorInfo): The operator.
+
+        Returns:
+            int: The operator's index in the table.
+        """
+        index = self.indices.get(operator.func_id)
+        if index is None:
+            index = len(self.operators)
+            self.operators.append(operator)
+            self.indices[operator.func_id] = index
+        return index
+
+    def __getitem__(self, index: int) -> OperatorInfo:
+        return self.operators[index]
+
+    def __len__(self) -> int:
+        return len(self.operators)
+
+
+class ExpressionArrayTree:
+    """
+    Struct-of-arrays representation of an expression tree.
+
+    Every node is an index into parallel arrays holding its kind, operator index, child indices,
+    leaf value and base, so a tree costs a handful of arrays instead of one object (with a
+    `__dict__`) per node. Nodes are stored in prefix order and the root is node 0.
+
+    The tree implements the builder methods of `ExpressionNodeBuilder`, so the expression
+    generator can fill it directly, and `root` returns an `ArrayNodeView` exposing the same
+    attributes as the object nodes, so the evaluator can run on it unchanged.
+    """
+
+    __slots__ = (
+        "operator_table",
+        "variables",
+        "kinds",
+        "op_indices",
+        "lefts",
+        "rights",
+        "values",
+        "bases",
+        "positions",
+    )
+
+    def __init__(self, operator_table: OperatorTable, variables: Optional[List[str]] = None):
+        """
+        Initializes an empty tree.
+
+        Parameters:
+            operator_table (OperatorTable): The table operator indices refer to.
+            variables (List[str], optional): The variable names variable nodes refer to.
+        """
+        self.operator_table = operator_table
+        self.variables = list(variables or [])
+        self.kinds = array("b")
+        # For variable nodes `values` holds the index into `variables`
+        self.op_indices = array("i")
+        self.lefts = array("i")
+        self.rights = array("i")
+        self.values = array("q")
+        self.bases = array("b")
+        self.positions = array("b")
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    @property
+    def root(self) -> "ArrayNodeView":
+        """
+        Returns a view on the root node.
+        """
+        return ArrayNodeView(self, 0)
+
+    def _append(self, kind: int, op_index: int, value: int, base: int) -> int:
+        self.kinds.append(kind)
+        self.op_indices.append(op_index)
+        self.lefts.append(NO_CHILD)
+        self.rights.append(NO_CHILD)
+        self.values.append(value)
+        self.bases.append(base)
+        self.positions.append(0)
+        return len(self.kinds) - 1
+
+    # Builder interface, see ExpressionNodeBuilder
+
+    def new_number(self, value: int, base: int) -> int:
+        return self._append(NUMBER_NODE, NO_CHILD, value, base)
+
+    def new_variable(self, variable: str) -> int:
+        if variable not in self.variables:
+            self.variables.append(variable)
+        return self._append(VARIABLE_NODE, NO_CHILD, self.variables.index(variable), 0)
+
+    def new_binary(self, operator: OperatorInfo) -> int:
+        return self._append(BINARY_NODE, self.operator_table.index_of(operator), 0, 0)
+
+    def new_unary(self, operator: OperatorInfo) -> int:
+        return self._append(UNARY_NODE, self.operator_table.index_of(operator), 0, 0)
+
+    def attach_binary(self, node: int, left: int, right: int) -> None:
+        self.lefts[node] = left
+        self.positions[left] = POSITION_CODES["left"]
+        self.rights[node] = right
+        self.positions[right] = POSITION_CODES["right"]
+
+    def attach_unary(self, node: int, operand: int) -> None:
+        self.lefts[node] = operand
+        self.positions[operand] = POSITION_CODES["unary"]
+
+    def to_dict(self, index: int = 0) -> dict:
+        """
+        Converts the subtree rooted at `index` to the same nested dictionary as `ExpressionNode.to_dict`.
+
+        Parameters:
+            index (int): The node to start from, the root by default.
+
+        Returns:
+            dict: The nested dictionary representation.
+        """
+        kind = self.kinds[index]
+        if kind == NUMBER_NODE:
+            return {"type": "numeric_atoms", "value": self.values[index], "base": self.bases[index]}
+        elif kind == VARIABLE_NODE:
+            return {"type": "variable", "variable": self.variables[self.values[index]]}
+        elif kind == BINARY_NODE:
+            return {
+                "type": "binary",
+                "operator": self.operator_table[self.op_indices[index]].symbol,
+                "left_expr": self.to_dict(self.lefts[index]),
+                "right_expr": self.to_dict(self.rights[index]),
+            }
+        else:
+            return {
+                "type": "unary",
+                "operator": self.operator_table[self.op_indices[index]].symbol,
+                "unary_expr": self.to_dict(self.lefts[index]),
+            }
+
+    def to_arrays(self) -> dict:
+        """
+        Converts the tree to a flat dictionary of lists, one entry per array.
+
+        Operators are stored by func_id so the result does not depend on the operator table.
+
+        Returns:
+            dict: The flat representation.
+        """
+        return {
+            "kinds": self.kinds.tolist(),
+            "operators": [
+                self.operator_table[op_index].func_id if op_index != NO_CHILD else None
+                for op_index in self.op_indices
+            ],
+            "lefts": self.lefts.tolist(),
+            "rights": self.rights.tolist(),
+            "values": self.values.tolist(),
+            "bases": self.bases.tolist(),
+            "variables": list(self.variables),
+        }
+
+
+class ArrayNodeView:
+    """
+    Lightweight view on one node of an `ExpressionArrayTree`.
+
+    It exposes the attributes of the object nodes (`kind`, `position`, `value`, `base`, `v`,
+    `operator`, `left_expr`, `right_expr`, `unary_expr`), reading them from the tree's arrays.
+    """
+
+    __slots__ = ("tree", "index")
+
+    def __init__(self, tree: ExpressionArrayTree, index: int):
+        self.tree = tree
+        self.index = index
+
+    @property
+    def kind(self) -> int:
+        return self.tree.kinds[self.index]
+
+    @property
+    def position(self) -> Optional[str]:
+        return POSITIONS[self.tree.positions[self.index]]
+
+    @property
+    def value(self) -> int:
+        return self.tree.values[self.index]
+
+    @value.setter
+    def value(self, value: int) -> None:
+        self.tree.values[self.index] = value
+
+    @property
+    def base(self) -> int:
+        return self.tree.bases[self.index]
+
+    @property
+    def v(self) -> str:
+        return self.tree.variables[self.tree.values[self.index]]
+
+    @property
+    def operator(self) -> OperatorInfo:
+        return self.tree.operator_table[self.tree.op_indices[self.index]]
+
+    @operator.setter
+    def operator(self, operator: OperatorInfo) -> None:
+        self.tree.op_indices[self.index] = self.tree.operator_table.index_of(operator)
+
+    @property
+    def left_expr(self) -> "ArrayNodeView":
+        return ArrayNodeView(self.tree, self.tree.lefts[self.index])
+
+    @property
+    def right_expr(self) -> "ArrayNodeView":
+        return ArrayNodeView(self.tree, self.tree.rights[self.index])
+
+    @property
+    def unary_expr(self) -> "ArrayNodeView":
+        return ArrayNodeView(self.tree, self.tree.lefts[self.index])
+
+    def to_dict(self) -> dict:
+        """
+        Converts the subtree rooted at this node to a dictionary, see `ExpressionNode.to_dict`.
+        """
+        return self.tree.to_dict(self.index)
+
+    def to_str_no_base_symbol(self, surround_symbol: str = None) -> str:
+        """
+        Converts a number node's value to a string without base symbols, see `NumberNode.to_str_no_base_symbol`.
+        """
+        if surround_symbol:
+            return f"{surround_symbol}{self.value}{surround_symbol}"
+        else:
+            return f"{self.value}"
+
+    def to_str(self, operator_manager: OperatorManager, base_converter: BaseConverter) -> str:
+        """
+        Converts a number node's value to a string with base symbols, see `NumberNode.to_str`.
+        """
+        return ExpressionBaseConverter.convert_int_to_targetbase(
+            input=self.value,
+            output_base=self.base,
+            base_converter=base_converter,
+            operator_manager=operator_manager,
+        )
@@ -0,0 +1,193 @@
+from dataclasses import dataclass, asdict
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+@dataclass
+class ExpressionConstraints:
+    """
+    Target constraints on generated expression records.
+
+    Every field is optional; None means the property is not constrained. The fields mirror
+    the record properties downstream filters look at.
+
+    Attributes:
+        highest_n_order (Optional[int]): Required `highest_n_order` of the expression.
+        min_normalized_expansion_degree (Optional[int]): Lower bound (inclusive) of `normalized_expansion_degree`.
+        max_normalized_expansion_degree (Optional[int]): Upper bound (inclusive) of `normalized_expansion_degree`.
+        longer_result_flag (Optional[bool]): Required value of `longer_result_info.flag`.
+        min_result_length (Optional[int]): Lower bound (inclusive) of the length of the `result` string.
+        max_result_length (Optional[int]): Upper bound (inclusive) of the length of the `result` string.
+    """
+    highest_n_order: Optional[int] = None
+    min_normalized_expansion_degree: Optional[int] = None
+    max_normalized_expansion_degree: Optional[int] = None
+    longer_result_flag: Optional[bool] = None
+    min_result_length: Optional[int] = None
+    max_result_length: Optional[int] = None
+
+    @staticmethod
+    def from_config(config: Optional[Dict[str, Any]]) -> Optional["ExpressionConstraints"]:
+        """
+        Creates constraints from the `expr_constraints` config section.
+
+        Args:
+            config (Optional[Dict[str, Any]]): The config section, may be None or empty.
+
+        Returns:
+            Optional[ExpressionConstraints]: The constraints, or None if nothing is constrained.
+        """
+        if not config:
+            return None
+        constraints = ExpressionConstraints(**config)
+        if all(value is None for value in asdict(constraints).values()):
+            return None
+        return constraints
+
+    def required_fields(self) -> List[str]:
+        """
+        Returns the record fields `accepts` reads.
+
+        Returns:
+            List[str]: Fields of `RECORD_FIELDS`, see `ExpressionEvaluator.set_record_profile`.
+        """
+        fields = []
+        if self.highest_n_order is not None:
+            fields.append("highest_n_order")
+        if self.min_normalized_expansion_degree is not None or self.max_normalized_expansion_degree is not None:
+            fields.append("normalized_expansion_degree")
+        if self.longer_result_flag is not None:
+            fields.append("longer_result_info")
+        if self.min_result_length is not None or self.max_result_length is not None:
+            fields.append("result")
+        return fields
+
+    def accepts(self, properties: Dict[str, Any]) -> bool:
+        """
+        Checks whether an evaluated expression satisfies the constraints.
+
+        Args:
+            properties (Dict[str, Any]): The record returned by `ExpressionEvaluator.evaluate`.
+
+        Returns:
+            bool: True if every set constraint is satisfied.
+        """
+        if self.highest_n_order is not None and properties["highest_n_order"] != self.highest_n_order:
+            return False
+        if self.min_normalized_expansion_degree is not None or self.max_normalized_expansion_degree is not None:
+            degree = properties["normalized_expansion_degree"]
+            # NaN/Inf are reported as symbols and never satisfy a numeric bound
+            if not isinstance(degree, (int, float)) or degree != degree:
+                return False
+            if self.min_normalized_expansion_degree is not None and degree < self.min_normalized_expansion_degree:
+                return False
+            if self.max_normalized_expansion_degree is not None and degree > self.max_normalized_expansion_degree:
+                return False
+        if self.longer_result_flag is not None:
+            longer_result_info = properties["longer_result_info"]
+            if longer_result_info is None or longer_result_info["flag"] != self.longer_result_flag:
+                return False
+        if self.min_result_length is not None or self.max_result_length is not None:
+            result_length = len(str(properties["result"]))
+            if self.min_result_length is not None and result_length < self.min_result_length:
+                return False
+            if self.max_result_length is not None and result_length > self.max_result_length:
+                return False
+        return True
+
+
+class ConstraintStatistics:
+    """
+    Acceptance statistics used to steer constrained generation.
+
+    For every operator it counts how often expressions using it were accepted, overall and
+    per leaf-value bucket of its operands. The Laplace-smoothed acceptance rates are used as
+    operator weights and to tilt the leaf value distribution towards ranges that tend to
+    satisfy the constraints.
+    """
+
+    def __init__(self, min_value: int, max_value: int, num_buckets: int = 8):
+        """
+        Initializes empty statistics.
+
+        Args:
+            min_value (int): Smallest leaf value.
+            max_value (int): Largest leaf value.
+            num_buckets (int): Number of equal-width leaf value buckets.
+        """
+        self.min_value = min_value
+        self.num_buckets = max(1, min(num_buckets, max_value - min_value + 1))
+        self.bucket_width = (max_value - min_value + 1) / self.num_buckets
+        # key: func_id, value: [accepted, tried]
+        self.operator_counts: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+        # key: func_id, value: per bucket [accepted, tried]
+        self.bucket_counts: Dict[str, List[List[int]]] = defaultdict(
+            lambda: [[0, 0] for _ in range(self.num_buckets)]
+        )
+        self.attempts = 0
+        self.accepted = 0
+
+    def bucket_of(self, value: int) -> int:
+        """
+        Returns the bucket index of a leaf value.
+        """
+        return min(int((value - self.min_value) / self.bucket_width), self.num_buckets - 1)
+
+    def operator_rate(self, func_id: str) -> float:
+        """
+        Returns the smoothed acceptance rate of expressions using the operator.
+        """
+        accepted, tried = self.operator_counts[func_id]
+        return (accepted + 1) / (tried + 2)
+
+    def bucket_rates(self, func_id: str) -> List[float]:
+        """
+        Returns the smoothed acceptance rates of the operator's leaf value buckets.
+        """
+        return [(accepted + 1) / (tried + 2) for accepted, tried in self.bucket_counts[func_id]]
+
+    def record(self, func_ids, leaf_buckets: List[Tuple[str, int]], accepted: bool) -> None:
+        """
+        Records the outcome of one attempt.
+
+        Args:
+            func_ids (Iterable[str]): The operators used by the expression.
+            leaf_buckets (List[Tuple[str, int]]): (parent func_id, bucket) of every number leaf.
+            accepted (bool): Whether the expression satisfied the constraints.
+        """
+        self.attempts += 1
+        self.accepted += int(accepted)
+        for func_id in func_ids:
+            counts = self.operator_counts[func_id]
+            counts[0] += int(accepted)
+            counts[1] += 1
+        for func_id, bucket in leaf_buckets:
+            counts = self.bucket_counts[func_id][bucket]
+            counts[0] += int(accepted)
+            counts[1] += 1
+
+    @property
+    def acceptance_rate(self) -> float:
+        return self.accepted / self.attempts if self.attempts else 0.0
+
+    def report(self, blind_acceptance_rate: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Summarizes the guided acceptance rate, optionally against blind sampling.
+
+        Args:
+            blind_acceptance_rate (Optional[float]): Acceptance rate of unguided sampling, see
+                `ExpressionGenerator.estimate_blind_acceptance_rate`.
+
+        Returns:
+            Dict[str, Any]: attempts, accepted, guided/blind acceptance rates and the improvement factor.
+        """
+        report = {
+            "attempts": self.attempts,
+            "accepted": self.accepted,
+            "guided_acceptance_rate": self.acceptance_rate,
+            "blind_acceptance_rate": blind_acceptance_rate,
+            "improvement": None,
+        }
+        if blind_acceptance_rate:
+            report["improvement"] = self.acceptance_rate / blind_acceptance_rate
+        return report
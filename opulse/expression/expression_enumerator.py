@@ -0,0 +1,215 @@
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+from operatorplus.operator_info import OperatorInfo
+from expression.expression_node import (
+    ExpressionNodeBuilder,
+    NUMBER_NODE,
+    VARIABLE_NODE,
+    BINARY_NODE,
+    UNARY_NODE,
+)
+
+# A leaf is either a number (int) or a variable name (str)
+Leaf = Union[int, str]
+
+
+class ExpressionEnumerator:
+    """
+    Enumerates every distinct expression tree up to a given depth.
+
+    The trees follow the same grammar as `ExpressionGenerator.generate_expression`: below the
+    maximum depth a node is a leaf, a unary operator or a binary operator; at the maximum depth
+    it is a leaf. With L leaves, U unary and B binary operators the number of trees is
+
+        T(0) = L
+        T(d) = L + U * T(d-1) + B * T(d-1)^2
+
+    Every tree has a rank in [0, T(d)): leaves come first, then unary trees ordered by
+    (operator, operand rank), then binary trees ordered by (operator, left rank, right rank).
+    `unrank` builds the tree of a rank directly, so the space can be split into contiguous
+    index ranges and streamed range by range without materializing it.
+    """
+
+    def __init__(
+        self,
+        binary_ops: List[OperatorInfo],
+        unary_ops: List[OperatorInfo],
+        leaves: Sequence[Leaf],
+        base: int = 10,
+    ):
+        """
+        Initializes the enumerator.
+
+        Args:
+            binary_ops (List[OperatorInfo]): The binary operators.
+            unary_ops (List[OperatorInfo]): The unary (prefix and postfix) operators.
+            leaves (Sequence[Leaf]): The leaf set; ints become number leaves, strs variable leaves.
+            base (int): The base of the number leaves.
+        """
+        if not leaves:
+            raise ValueError("The leaf set of an ExpressionEnumerator must not be empty.")
+        self.binary_ops = list(binary_ops)
+        self.unary_ops = list(unary_ops)
+        self.leaves = list(leaves)
+        self.base = base
+        self.binary_index = {opinfo.func_id: i for i, opinfo in enumerate(self.binary_ops)}
+        self.unary_index = {opinfo.func_id: i for i, opinfo in enumerate(self.unary_ops)}
+        self.leaf_index = {leaf_key(leaf): i for i, leaf in enumerate(self.leaves)}
+        # counts[d] = T(d), extended on demand
+        self.counts: List[int] = [len(self.leaves)]
+
+    def count(self, depth: int) -> int:
+        """
+        Returns the number of distinct trees of depth at most `depth`.
+
+        Args:
+            depth (int): The maximum depth.
+
+        Returns:
+            int: T(depth).
+        """
+        num_leaves, num_unary, num_binary = len(self.leaves), len(self.unary_ops), len(self.binary_ops)
+        while len(self.counts) <= depth:
+            sub_count = self.counts[-1]
+            self.counts.append(num_leaves + num_unary * sub_count + num_binary * sub_count * sub_count)
+        return self.counts[depth]
+
+    def unrank(self, rank: int, depth: int, builder=None):
+        """
+        Builds the tree with the given rank.
+
+        Args:
+            rank (int): The rank, in [0, count(depth)).
+            depth (int): The maximum depth.
+            builder (optional): The tree builder, an `ExpressionNodeBuilder` by default. Pass a
+                fresh `ExpressionArrayTree` per tree to build array-backed trees.
+
+        Returns:
+            The root node (or node index) created by the builder.
+        """
+        if not 0 <= rank < self.count(depth):
+            raise IndexError(f"Rank {rank} is out of range for depth {depth}.")
+        if builder is None:
+            builder = ExpressionNodeBuilder()
+        return self._unrank(rank, depth, builder)
+
+    def _unrank(self, rank: int, depth: int, builder):
+        num_leaves = len(self.leaves)
+        if rank < num_leaves:
+            leaf = self.leaves[rank]
+            if isinstance(leaf, str):
+                return builder.new_variable(leaf)
+            return builder.new_number(leaf, self.base)
+        rank -= num_leaves
+        sub_count = self.counts[depth - 1]
+        unary_count = len(self.unary_ops) * sub_count
+        if rank < unary_count:
+            op_rank, operand_rank = divmod(rank, sub_count)
+            node = builder.new_unary(self.unary_ops[op_rank])
+            builder.attach_unary(node, self._unrank(operand_rank, depth - 1, builder))
+            return node
+        rank -= unary_count
+        op_rank, rank = divmod(rank, sub_count * sub_count)
+        left_rank, right_rank = divmod(rank, sub_count)
+        # Create the operator node first so array trees stay in prefix order
+        node = builder.new_binary(self.binary_ops[op_rank])
+        left_expr = self._unrank(left_rank, depth - 1, builder)
+        right_expr = self._unrank(right_rank, depth - 1, builder)
+        builder.attach_binary(node, left_expr, right_expr)
+        return node
+
+    def rank(self, node, depth: int) -> int:
+        """
+        Returns the rank of a tree, the inverse of `unrank`.
+
+        Args:
+            node: The root of the tree (an `ExpressionNode` or an `ArrayNodeView`).
+            depth (int): The maximum depth the rank refers to.
+
+        Returns:
+            int: The rank of the tree.
+
+        Raises:
+            ValueError: If the tree uses a leaf or operator unknown to the enumerator or is too deep.
+        """
+        self.count(depth)
+        return self._rank(node, depth)
+
+    def _rank(self, node, depth: int) -> int:
+        kind = node.kind
+        if kind == NUMBER_NODE or kind == VARIABLE_NODE:
+            key = leaf_key(node.value if kind == NUMBER_NODE else node.v)
+            if key not in self.leaf_index:
+                raise ValueError(f"Leaf {key[1]!r} is not in the leaf set.")
+            return self.leaf_index[key]
+        if depth == 0:
+            raise ValueError("The tree is deeper than the enumerated depth.")
+        num_leaves = len(self.leaves)
+        sub_count = self.counts[depth - 1]
+        func_id = node.operator.func_id
+        if kind == UNARY_NODE:
+            if func_id not in self.unary_index:
+                raise ValueError(f"Unary operator {func_id} is not enumerated.")
+            return num_leaves + self.unary_index[func_id] * sub_count + self._rank(node.unary_expr, depth - 1)
+        if func_id not in self.binary_index:
+            raise ValueError(f"Binary operator {func_id} is not enumerated.")
+        return (
+            num_leaves
+            + len(self.unary_ops) * sub_count
+            + self.binary_index[func_id] * sub_count * sub_count
+            + self._rank(node.left_expr, depth - 1) * sub_count
+            + self._rank(node.right_expr, depth - 1)
+        )
+
+    def iter_range(self, depth: int, start: int = 0, stop: Optional[int] = None, builder_factory=None) -> Iterator:
+        """
+        Streams the trees with ranks in [start, stop), one at a time.
+
+        Args:
+            depth (int): The maximum depth.
+            start (int): First rank (inclusive).
+            stop (Optional[int]): Last rank (exclusive), `count(depth)` if None.
+            builder_factory (optional): Called once per tree to get its builder, e.g. to build
+                `ExpressionArrayTree`s. A shared `ExpressionNodeBuilder` is used if None.
+
+        Yields:
+            Tuple[int, Any]: The rank and the root node (or the builder, if `builder_factory` is given).
+        """
+        total = self.count(depth)
+        stop = total if stop is None else min(stop, total)
+        node_builder = ExpressionNodeBuilder()
+        for rank in range(start, stop):
+            if builder_factory is None:
+                yield rank, self._unrank(rank, depth, node_builder)
+            else:
+                builder = builder_factory()
+                self._unrank(rank, depth, builder)
+                yield rank, builder
+
+    def split(self, depth: int, num_parts: int) -> List[Tuple[int, int]]:
+        """
+        Splits the rank space into contiguous, nearly equal ranges, e.g. one per worker.
+
+        Args:
+            depth (int): The maximum depth.
+            num_parts (int): Number of ranges.
+
+        Returns:
+            List[Tuple[int, int]]: Non-empty (start, stop) ranges covering [0, count(depth)).
+        """
+        total = self.count(depth)
+        num_parts = max(1, min(num_parts, total))
+        size, extra = divmod(total, num_parts)
+        ranges = []
+        start = 0
+        for part in range(num_parts):
+            stop = start + size + (1 if part < extra else 0)
+            ranges.append((start, stop))
+            start = stop
+        return ranges
+
+
+def leaf_key(leaf: Leaf) -> Tuple[int, Leaf]:
+    """
+    Returns the lookup key of a leaf, keeping the number 1 and the variable "1" apart.
+    """
+    return (1 if isinstance(leaf, str) else 0, leaf)
@@ -1,4 +1,4 @@
-from typing import Tuple, Optional, Union, Dict, List
+from typing import Tuple, Optional, Union, Dict, List, Iterable
 from operatorplus.operator_manager import OperatorManager
 from collections import defaultdict
 from expression.expression_node import (
@@ -7,6 +7,10 @@ from expression.expression_node import (
     BinaryExpressionNode,
     UnaryExpressionNode,
     VariableNode,
+    NUMBER_NODE,
+    VARIABLE_NODE,
+    BINARY_NODE,
+    UNARY_NODE,
 )
 from expression.expression_base_converter import ExpressionBaseConverter
 from typing import cast
@@ -16,6 +20,8 @@ from config import ParamConfig, LogConfig
 from dataclasses import dataclass, asdict
 import os
 from operatorplus.compiler import CythonCompiler
+from expression.expression_array_tree import OperatorTable
+from expression.tree_codec import TREE_ENCODINGS, encode_tree, tree_to_text
 
 @dataclass
 class LongerResultInfo:
@@ -23,6 +29,72 @@ class LongerResultInfo:
     flag: bool
 
 
+# Fields of an evaluated expression record, in output order
+RECORD_FIELDS = (
+    "id",
+    "expression_no_base_symbol",
+    "expression",
+    "highest_n_order",
+    "priority_hierarchical_complexity",
+    "normalized_expansion_degree",
+    "operation_count",
+    "complexity_ratio",
+    "tree",
+    "used_operators",
+    "dependent_operators",
+    "result",
+    "longer_result_info",
+    "cot_info",
+    "base",
+    "result_base",
+    "text",
+    "cot",
+)
+
+# Named record profiles; "compact" leaves out the fields that need extra passes over the tree
+RECORD_PROFILES = {
+    "full": RECORD_FIELDS,
+    "compact": (
+        "id",
+        "expression",
+        "highest_n_order",
+        "priority_hierarchical_complexity",
+        "normalized_expansion_degree",
+        "operation_count",
+        "complexity_ratio",
+        "used_operators",
+        "result",
+        "longer_result_info",
+        "base",
+        "result_base",
+    ),
+}
+
+
+def resolve_record_fields(profile: Union[str, Iterable[str]]) -> Tuple[str, ...]:
+    """
+    Resolves a record profile to the fields it contains.
+
+    Args:
+        profile (Union[str, Iterable[str]]): A profile name of `RECORD_PROFILES` or a list of fields of `RECORD_FIELDS`.
+
+    Returns:
+        Tuple[str, ...]: The fields, in `RECORD_FIELDS` order.
+
+    Raises:
+        ValueError: If the profile or one of the fields is unknown.
+    """
+    if isinstance(profile, str):
+        if profile not in RECORD_PROFILES:
+            raise ValueError(f"Unknown record profile {profile}, expected one of {list(RECORD_PROFILES)} or a list of fields.")
+        return RECORD_PROFILES[profile]
+    fields = set(profile)
+    unknown = fields.difference(RECORD_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown record fields {sorted(unknown)}, expected fields of {list(RECORD_FIELDS)}.")
+    return tuple(field for field in RECORD_FIELDS if field in fields)
+
+
 class ExpressionEvaluator:
 
     def __init__(
@@ -63,6 +135,10 @@ class ExpressionEvaluator:
         self.cython_cache_dir = cython_cache_dir
         # Used to replace meta words in expression strings
         self.load_atoms()
+        # Fields computed by evaluate(), see set_record_profile
+        self.set_record_profile("full")
+        # Form of the "tree" field, see set_tree_encoding
+        self.set_tree_encoding("dict")
 
     def set_with_all_brackets(self, with_all_brackets: bool) -> None:
         """
@@ -77,6 +153,50 @@ class ExpressionEvaluator:
         """
         self.with_all_brackets = with_all_brackets
 
+    def set_record_profile(self, profile: Union[str, Iterable[str]]) -> None:
+        """
+        Sets the fields of the records returned by `evaluate`.
+
+        Fields outside the profile are not computed at all: the second expression string is only built
+        for `expression_no_base_symbol`, the CoT steps only for `cot`/`cot_info`, and so on.
+
+        Args:
+            profile (Union[str, Iterable[str]]): A profile name ("full" or "compact") or a list of fields, see `resolve_record_fields`.
+        """
+        self.record_fields = resolve_record_fields(profile)
+        getters = self.record_field_getters()
+        self.record_getters = [(field, getters[field]) for field in self.record_fields]
+        self.record_cot = "cot" in self.record_fields
+        self.record_cot_info = "cot_info" in self.record_fields
+
+    def set_tree_encoding(
+        self, tree_encoding: str, operator_table: OperatorTable = None, variables: List[str] = None
+    ) -> None:
+        """
+        Sets the form of the "tree" field of the records returned by `evaluate`.
+
+        Args:
+            tree_encoding (str): "compact" for the base64 text of `tree_codec.encode_tree`, "dict" for the nested `to_dict` form.
+            operator_table (OperatorTable, optional): The table compact trees are encoded with, required for "compact".
+            variables (List[str], optional): The variable names compact trees are encoded with.
+        """
+        if tree_encoding not in TREE_ENCODINGS:
+            raise ValueError(f"Unknown tree encoding {tree_encoding}, expected one of {list(TREE_ENCODINGS)}.")
+        if tree_encoding == "compact" and operator_table is None:
+            raise ValueError("The compact tree encoding needs an operator table.")
+        self.tree_encoding = tree_encoding
+        self.tree_operator_table = operator_table
+        self.tree_variables = list(variables or [])
+
+    def require_fields(self, fields: Iterable[str]) -> None:
+        """
+        Adds fields to the record profile, e.g. the properties a constraint check reads.
+
+        Args:
+            fields (Iterable[str]): Fields of `RECORD_FIELDS`.
+        """
+        self.set_record_profile(set(self.record_fields).union(fields))
+
     def load_atoms(self) -> None:
         """
         Loads atomic symbols from the parameter configuration.
@@ -111,7 +231,7 @@ class ExpressionEvaluator:
         of the expression based on the provided tree structure and optional parameters.
 
         Parameters:
-            expression_tree (ExpressionNode): The root node of the expression tree to initialize.
+            expression_tree (ExpressionNode): The root node of the expression tree to initialize, either an object node or the root view of an ExpressionArrayTree.
             id (any): An identifier for the expression, which can be any type that uniquely identifies the expression.
             op_mode (bool, optional): A flag indicating whether the expression should be processed in operator mode. Defaults to False.
         """
@@ -125,6 +245,7 @@ class ExpressionEvaluator:
         self.variable_count = 0
         self.highest_n_order = 0
         self.expr_result = None
+        self.formatted_result = None
         self.normalized_expansion_degree = None
         self.all_operators: Dict[str, int] = defaultdict(int)
         self.expr_result_base = expr_result_base
@@ -133,23 +254,25 @@ class ExpressionEvaluator:
             self.expression_str = self.tree_to_str(self.expression_tree, op_mode=True)
         else:
             self.expression_str = self.tree_to_str(self.expression_tree, statistic_analysis=True)
-            self.expression_str_no_base_symbol = self.tree_to_str(
-                self.expression_tree, with_base_symbol=False
-            )
+            self.expression_str_no_base_symbol = None
+            if "expression_no_base_symbol" in self.record_fields:
+                self.expression_str_no_base_symbol = self.tree_to_str(
+                    self.expression_tree, with_base_symbol=False
+                )
 
     def op_info_sub_tree(self, node) -> None:
-        if isinstance(node, NumberNode):
+        if node.kind == NUMBER_NODE:
             return
-        if isinstance(node, BinaryExpressionNode):
+        if node.kind == BINARY_NODE:
             self.op_info_sub_tree(node.left_expr)
             self.op_info_sub_tree(node.right_expr)
             self.all_operators[node.operator.func_id] += 1
             return
-        elif isinstance(node, UnaryExpressionNode):
+        elif node.kind == UNARY_NODE:
             self.op_info_sub_tree(node.unary_expr)
             self.all_operators[node.operator.func_id] += 1
             return
-        elif isinstance(node, VariableNode):
+        elif node.kind == VARIABLE_NODE:
             return
         else:
             raise NotImplementedError("ExpressionEvaluator.op_info_sub_tree")
@@ -190,7 +313,7 @@ class ExpressionEvaluator:
         """
 
         # Requires the priority of the parent node's operator for determining whether to add brackets
-        if isinstance(node, NumberNode):
+        if node.kind == NUMBER_NODE:
             node = cast(NumberNode, node)
             if op_mode:
                 # when op_mode, we don't generate any base-related symbol
@@ -202,9 +325,9 @@ class ExpressionEvaluator:
                     return f"{node.to_str(self.operator_manager,self.base_converter)}"
                 else:
                     return f"{node.to_str_no_base_symbol(surround_symbol='$')}"
-        elif isinstance(node, VariableNode):
+        elif node.kind == VARIABLE_NODE:
             return f"{node.v}"
-        elif isinstance(node, BinaryExpressionNode):
+        elif node.kind == BINARY_NODE:
             node = cast(BinaryExpressionNode, node)
             if not op_mode:
                 if statistic_analysis:
@@ -260,7 +383,7 @@ class ExpressionEvaluator:
                     return f"{left_str}{node.operator.symbol}{right_str}"
             else:
                 return f"{left_str}{node.operator.symbol}{right_str}"
-        elif isinstance(node, UnaryExpressionNode):
+        elif node.kind == UNARY_NODE:
             node = cast(UnaryExpressionNode, node)
             if not op_mode:
                 if statistic_analysis:
@@ -357,6 +480,9 @@ class ExpressionEvaluator:
         Returns:
             (Union[int, str]): The normalized expansion degree or "NaN".s an integer or "NaN" if it cannot be calculated.
         """
+        if self.formatted_result is not None:
+            # Already computed for this expression, e.g. for "result" before "text"
+            return self.formatted_result
         expr_result = None
         if self.expr_result is not None:
             expr_result = self.expr_result
@@ -371,20 +497,22 @@ class ExpressionEvaluator:
             # return self.expr_result if self.expr_result != "NaN" else self.atoms["NaN"]
 
         if self.expr_result_base != None and type(expr_result) == int:
-            return ExpressionBaseConverter.convert_int_to_targetbase(
+            formatted_result = ExpressionBaseConverter.convert_int_to_targetbase(
                 input=expr_result,
                 output_base=self.expr_result_base,
                 base_converter=self.base_converter,
                 operator_manager=self.operator_manager,
             )
         elif expr_result != expr_result:
-            return self.atoms["NaN"]
+            formatted_result = self.atoms["NaN"]
         elif expr_result == float("inf"):
-            return self.atoms["Inf"]
+            formatted_result = self.atoms["Inf"]
         elif expr_result == float("-inf"):
-            return self.atoms["-Inf"]
+            formatted_result = self.atoms["-Inf"]
         else:
-            return expr_result
+            formatted_result = expr_result
+        self.formatted_result = formatted_result
+        return formatted_result
 
     def get_compute_count_func(self, operator:OperatorInfo):
         if operator.module == None:
@@ -477,15 +605,16 @@ class ExpressionEvaluator:
             pass
         special_values = [float("inf"), float("-inf")]
         try:
-            if isinstance(node, NumberNode):
-                self.cot_info.append(
-                    {
-                        "info": f"number node, value={node.value}",
-                        "layer": cot_layer,
-                    }
-                )
+            if node.kind == NUMBER_NODE:
+                if self.record_cot_info:
+                    self.cot_info.append(
+                        {
+                            "info": f"number node, value={node.value}",
+                            "layer": cot_layer,
+                        }
+                    )
                 return 0, node.value
-            elif isinstance(node, UnaryExpressionNode):
+            elif node.kind == UNARY_NODE:
                 sub_degree, sub_result = (
                     self.calculate_normalized_expansion_degree_node(
                         node.unary_expr, cot_layer=cot_layer + 1
@@ -516,25 +645,27 @@ class ExpressionEvaluator:
                         if len(cur_result_str) > len(sub_result_str):
                             self.longer_result_info.flag = True
 
-                self.cot_info.append({
-                    "info":f"compute unary expreesion, input={sub_result}, op_id = {node.operator.func_id}, unary_op_definition = '{node.operator.definition}', output={cur_result}","layer":cot_layer}
-                )
+                if self.record_cot_info:
+                    self.cot_info.append({
+                        "info":f"compute unary expreesion, input={sub_result}, op_id = {node.operator.func_id}, unary_op_definition = '{node.operator.definition}', output={cur_result}","layer":cot_layer}
+                    )
                 
                 # prepare for cot
-                cur_result_str_with_base = self.get_target_base_str(value = cur_result,target_base = self.longer_result_info.target_base)
-                sub_result_str_with_base = self.get_target_base_str(value = sub_result,target_base = self.longer_result_info.target_base)
+                if self.record_cot:
+                    cur_result_str_with_base = self.get_target_base_str(value = cur_result,target_base = self.longer_result_info.target_base)
+                    sub_result_str_with_base = self.get_target_base_str(value = sub_result,target_base = self.longer_result_info.target_base)
 
-                if node.operator.unary_position=="prefix":
-                    self.cot.append({"info":f"{node.operator.symbol}{sub_result_str_with_base}={cur_result_str_with_base}","layer":cot_layer})
-                elif node.operator.unary_position=="postfix":
-                    self.cot.append({"info":f"{sub_result_str_with_base}{node.operator.symbol}={cur_result_str_with_base}","layer":cot_layer})
+                    if node.operator.unary_position=="prefix":
+                        self.cot.append({"info":f"{node.operator.symbol}{sub_result_str_with_base}={cur_result_str_with_base}","layer":cot_layer})
+                    elif node.operator.unary_position=="postfix":
+                        self.cot.append({"info":f"{sub_result_str_with_base}{node.operator.symbol}={cur_result_str_with_base}","layer":cot_layer})
 
                 if cur_result !=cur_result or cur_result in special_values:
                     pass
                 else:
                     cur_result = int(cur_result)
                 return cur_degree + sub_degree, cur_result
-            elif isinstance(node, BinaryExpressionNode):
+            elif node.kind == BINARY_NODE:
                 # 二元操作符，分别计算左右子树的归一展开度
                 left_degree, left_result = (
                     self.calculate_normalized_expansion_degree_node(
@@ -579,25 +710,27 @@ class ExpressionEvaluator:
                         ) > len(right_result_str):
                             self.longer_result_info.flag = True
 
-                self.cot_info.append(
-                    {
-                        "info": f"compute binary expreesion, left_input={left_result}, right_input={right_result}, op_id = {node.operator.func_id} binary_op_definition= '{node.operator.definition}', output={cur_result}",
-                        "layer": cot_layer,
-                    }
-                )
+                if self.record_cot_info:
+                    self.cot_info.append(
+                        {
+                            "info": f"compute binary expreesion, left_input={left_result}, right_input={right_result}, op_id = {node.operator.func_id} binary_op_definition= '{node.operator.definition}', output={cur_result}",
+                            "layer": cot_layer,
+                        }
+                    )
                 # prepare for cot
-                left_result_str_with_base = self.get_target_base_str(value = left_result,target_base = self.longer_result_info.target_base)
-                right_result_str_with_base = self.get_target_base_str(value = right_result,target_base = self.longer_result_info.target_base)
-                cur_result_str_with_base = self.get_target_base_str(value = cur_result,target_base = self.longer_result_info.target_base)
+                if self.record_cot:
+                    left_result_str_with_base = self.get_target_base_str(value = left_result,target_base = self.longer_result_info.target_base)
+                    right_result_str_with_base = self.get_target_base_str(value = right_result,target_base = self.longer_result_info.target_base)
+                    cur_result_str_with_base = self.get_target_base_str(value = cur_result,target_base = self.longer_result_info.target_base)
 
-                self.cot.append({ "info": f"{left_result_str_with_base}{node.operator.symbol}{right_result_str_with_base}={cur_result_str_with_base}","layer": cot_layer,})
+                    self.cot.append({ "info": f"{left_result_str_with_base}{node.operator.symbol}{right_result_str_with_base}={cur_result_str_with_base}","layer": cot_layer,})
                 
                 if cur_result !=cur_result or cur_result in special_values:
                     pass
                 else:
                     cur_result = int(cur_result)
                 return cur_degree + left_degree + right_degree, cur_result
-            elif isinstance(node, VariableNode):
+            elif node.kind == VARIABLE_NODE:
                 return float("nan"), float("nan")
             else:
                 raise NotImplementedError(
@@ -605,9 +738,9 @@ class ExpressionEvaluator:
                 )
         except Exception as e:
             # print(f"node: {node.operator.id}")
-            if isinstance(node, BinaryExpressionNode):
+            if node.kind == BINARY_NODE:
                 self.logger.error(f"Error in ExpressionEvaluator.tree_to_str: {e},cur_result={cur_result},left_result={left_result},right_result={right_result}")
-            elif isinstance(node,UnaryExpressionNode):
+            elif node.kind == UNARY_NODE:
                 self.logger.error(f"Error in ExpressionEvaluator.tree_to_str: {e},cur_result={cur_result},sub_result={sub_result}")
             else:
                 self.logger.error(f"Error in ExpressionEvaluator.tree_to_str: {e}")
@@ -669,37 +802,62 @@ class ExpressionEvaluator:
             return self.param_config.get("random_base")["base"]
         else:
             return None
+    def calculate_tree(self) -> Union[str, Dict]:
+        if self.tree_encoding == "compact":
+            return tree_to_text(encode_tree(self.expression_tree, self.tree_operator_table, self.tree_variables))
+        return self.expression_tree.to_dict()
+
+    def calculate_longer_result_info(self) -> Dict:
+        # The flag is only known once the tree has been computed
+        self.calculate_result()
+        return asdict(self.longer_result_info)
+
+    def calculate_cot_info(self) -> List:
+        self.calculate_result()
+        return self.cot_info
+
+    def calculate_cot(self) -> List:
+        self.calculate_result()
+        return self.cot
+
+    def record_field_getters(self) -> Dict:
+        """
+        Returns the function computing each field of `RECORD_FIELDS` for the current expression.
+        """
+        return {
+            "id": lambda: self.id,
+            "expression_no_base_symbol": lambda: self.expression_str_no_base_symbol,
+            "expression": lambda: self.expression_str,
+            "highest_n_order": self.calculate_highest_n_order,
+            "priority_hierarchical_complexity": self.calculate_priority_hierarchical_complexity,
+            "normalized_expansion_degree": self.calculate_normalized_expansion_degree,
+            "operation_count": self.calculate_operation_count,
+            "complexity_ratio": self.calculate_complexity_ratio,
+            # "max_digit_count": self.calculate_max_digit_count,
+            "tree": self.calculate_tree,
+            "used_operators": lambda: list(self.all_operators.keys()),
+            "dependent_operators": self.all_dependent_operators,
+            "result": self.calculate_result,
+            "longer_result_info": self.calculate_longer_result_info,
+            "cot_info": self.calculate_cot_info,
+            "base": self.get_base,
+            "result_base": lambda: self.expr_result_base,
+            "text": lambda: f"{self.expression_str}={self.calculate_result()}",
+            "cot": self.calculate_cot,
+        }
+
     def evaluate(self):
         """
         Evaluates the expression and returns its properties.
 
         This method aggregates various metrics about the expression, such as its highest n-order, hierarchical complexity,
         normalized expansion degree, operation count, complexity ratio, maximum digit count, and result.
+        Only the fields of the record profile are computed, see `set_record_profile`.
 
         Returns:
             (dict): A dictionary containing various properties of the evaluated expression.
         """
-        return {
-            "id": self.id,
-            "expression_no_base_symbol": self.expression_str_no_base_symbol,
-            "expression": self.expression_str,
-            "highest_n_order": self.calculate_highest_n_order(),
-            "priority_hierarchical_complexity": self.calculate_priority_hierarchical_complexity(),
-            "normalized_expansion_degree": self.calculate_normalized_expansion_degree(),
-            "operation_count": self.calculate_operation_count(),
-            "complexity_ratio": self.calculate_complexity_ratio(),
-            # "max_digit_count": self.calculate_max_digit_count(),
-            "tree": self.expression_tree.to_dict(),
-            "used_operators": list(self.all_operators.keys()),
-            "dependent_operators": self.all_dependent_operators(),
-            "result": self.calculate_result(),
-            "longer_result_info": asdict(self.longer_result_info),
-            "cot_info": self.cot_info,
-            "base": self.get_base(),
-            "result_base": self.expr_result_base,
-            "text": f"{self.expression_str}={self.calculate_result()}",
-            "cot": self.cot,
-        }
+        return {field: getter() for field, getter in self.record_getters}
 
 
 # if __name__ == "__main__":
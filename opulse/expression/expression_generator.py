@@ -1,5 +1,8 @@
 import random
-from typing import Dict, Any, List
+import bisect
+from itertools import accumulate
+from typing import Dict, Any, Iterator, List
+import numpy as np
 from expression.expression_evaluator import ExpressionEvaluator
 from operatorplus.operator_manager import OperatorManager
 from operatorplus.operator_info import OperatorInfo
@@ -11,12 +14,24 @@ from expression.expression_node import (
     BinaryExpressionNode,
     UnaryExpressionNode,
     VariableNode,
+    ExpressionNodeBuilder,
+    NUMBER_NODE,
+    BINARY_NODE,
+    UNARY_NODE,
 )
+from expression.expression_array_tree import ExpressionArrayTree, OperatorTable
 import time
 from expression.base_converter import BaseConverter
 from config import LogConfig, ParamConfig
 from expression.expression_evaluator import LongerResultInfo
 from operatorplus.compiler import CythonCompiler
+from expression.random_stream import RandomStream
+from expression.expression_constraints import ExpressionConstraints, ConstraintStatistics
+from expression.expression_enumerator import ExpressionEnumerator
+
+# Order of the node types drawn by the expression type stream
+EXPR_TYPES = ("binary", "unary_prefix", "unary_postfix", "atoms")
+ATOM_TYPES = ("variable", "number")
 
 class ExpressionGenerator:
 
@@ -71,6 +86,20 @@ class ExpressionGenerator:
 
         self.operators2expr: Dict[int, list[int]] = defaultdict(list)
 
+        # "object" builds ExpressionNode trees, "array" builds compact ExpressionArrayTree trees
+        self.tree_representation: str = self.param_config.get("expr_tree_representation", "object")
+        self.node_builder = ExpressionNodeBuilder()
+        # Indices follow the operators file, so they are also the indices of compact encoded trees
+        self.operator_table = OperatorTable.from_manager(operator_manager)
+
+        # Constraint-guided generation, see create_constrained_expression
+        self.constraints = ExpressionConstraints.from_config(self.param_config.get("expr_constraints"))
+        self.constraint_max_attempts: int = self.param_config.get("expr_constraint_max_attempts", 1000)
+        self.constraint_statistics = ConstraintStatistics(
+            self.min_value, self.max_value, self.param_config.get("expr_constraint_leaf_buckets", 8)
+        )
+        # func_id -> weight factor, only set while a constrained tree is being generated
+        self.operator_rate = None
 
         self.base_converter = BaseConverter(
             self.param_config.get("max_base"), self.param_config.get("custom_digits")
@@ -94,6 +123,99 @@ class ExpressionGenerator:
             operator_manager,
             base_converter=self.base_converter,
         )
+        # Only the fields of the record profile are computed; the generator itself needs id and used_operators,
+        # constrained generation the constrained properties
+        self.expr_evaluator.set_record_profile(self.param_config.get("expr_record_profile", "full"))
+        self.expr_evaluator.require_fields(["id", "used_operators"])
+        if self.constraints is not None:
+            self.expr_evaluator.require_fields(self.constraints.required_fields())
+        self.expr_evaluator.set_tree_encoding(
+            self.param_config.get("expr_tree_encoding", "compact"), self.operator_table, self.variables
+        )
+
+        self.random_stream = RandomStream(
+            np.random.default_rng(self.param_config.get("random_seed")),
+            block_size=self.param_config.get("random_block_size", RandomStream.DEFAULT_BLOCK_SIZE),
+        )
+        self.init_random_draws()
+
+    def init_random_draws(self) -> None:
+        """
+        (Re)creates the pre-drawn random blocks used during generation.
+
+        Leaf values, bases and node-type decisions are drawn in blocks from `self.random_stream`
+        with the same distributions as the per-call `random` based draws they replace.
+        """
+        min_value, max_value = self.min_value, self.max_value
+
+        def draw_values(rng, size):
+            # Same two-step distribution as before: value ~ U[min, U[min, max]]
+            mid_values = rng.integers(min_value, max_value, size, endpoint=True)
+            return rng.integers(min_value, mid_values, endpoint=True)
+
+        self._leaf_values = self.random_stream.block_iter(draw_values)
+        self._random_bases = self.random_stream.randint_iter(2, self.max_base)
+        self._uniforms = self.random_stream.uniform_iter()
+        self._expr_types = self.random_stream.weighted_index_iter(
+            [self.expr_type_weights[expr_type] for expr_type in EXPR_TYPES]
+        )
+        self._atom_types = self.random_stream.weighted_index_iter(
+            [self.atoms_type_weights[atom_type] for atom_type in ATOM_TYPES]
+        )
+
+    def seed_shard(self, global_seed: int, *shard_key: int) -> None:
+        """
+        Switches the generator to the deterministic random stream of one shard.
+
+        Everything generated afterwards only depends on `global_seed` and `shard_key`, not on the
+        process or on what was generated before. The Python `random` module, still used by the
+        less frequent draws, is reseeded from the same stream.
+
+        Args:
+            global_seed (int): The seed of the whole run.
+            *shard_key (int): Integers identifying the shard, e.g. (base, depth, shard_id).
+        """
+        self.random_stream = RandomStream.for_shard(
+            global_seed, *shard_key, block_size=self.random_stream.block_size
+        )
+        random.seed(int(self.random_stream.rng.integers(2**63)))
+        self.init_random_draws()
+        # The learned steering state must not leak between shards either
+        self.reset_constraint_statistics()
+
+    def select_operator(self, ops: List[OperatorInfo], is_op_weight: bool = False) -> OperatorInfo:
+        """
+        Picks an operator from `ops`, either uniformly or according to the operators' weights.
+
+        Args:
+            ops (List[OperatorInfo]): The candidate operators, must not be empty.
+            is_op_weight (bool): Whether to use `OperatorInfo.weight` as the selection weight.
+
+        Returns:
+            OperatorInfo: The selected operator.
+        """
+        if self.operator_rate is not None:
+            # Constrained generation: scale by the operators' acceptance rates
+            cum_weights = list(accumulate(
+                (opinfo.weight if is_op_weight else 1) * self.operator_rate(opinfo.func_id)
+                for opinfo in ops
+            ))
+        elif is_op_weight:
+            cum_weights = list(accumulate(opinfo.weight for opinfo in ops))
+        else:
+            return ops[int(next(self._uniforms) * len(ops))]
+        return ops[
+            bisect.bisect(cum_weights, next(self._uniforms) * cum_weights[-1], 0, len(ops) - 1)
+        ]
+
+    def select_variable(self) -> str:
+        """
+        Picks a variable name uniformly from the configured variables.
+
+        Returns:
+            str: The selected variable name.
+        """
+        return self.variables[int(next(self._uniforms) * len(self.variables))]
 
     def set_random_base(self, random_flag: bool, target_base: int = 10):
         self.random_base_flag = random_flag
@@ -108,6 +230,8 @@ class ExpressionGenerator:
             new_variables (List[str]): A list of variable names to be used in expressions.
         """
         self.variables = new_variables
+        # Compact encoded trees refer to variables by index
+        self.expr_evaluator.set_tree_encoding(self.expr_evaluator.tree_encoding, self.operator_table, new_variables)
 
     def set_max_depth(self, max_depth: int) -> None:
         """
@@ -125,10 +249,7 @@ class ExpressionGenerator:
         Returns:
             int: A randomly generated integer value.
         """
-        mid_value = random.randint(self.min_value, self.max_value)
-        value = random.randint(self.min_value, mid_value)
-        return value
-        # return random.randint(self.min_value, self.max_value)
+        return next(self._leaf_values)
 
     def generate_random_base(self) -> int:
         """
@@ -139,16 +260,17 @@ class ExpressionGenerator:
         """
         # self.logger.debug(f"current base: {self.current_base}")
         if self.random_base_flag:
-            return random.randint(2, self.max_base)
+            return next(self._random_bases)
         else:
             return self.current_base
 
-    def generate_atoms(self, atom_choice: str) -> ExpressionNode:
+    def generate_atoms(self, atom_choice: str, builder=None) -> ExpressionNode:
         """
         Generates an atomic node based on the specified type.
 
         Args:
             atom_choice (str): Specifies the type of atomic element to generate. Options are 'variable', 'number', or 'variable_and_number'.
+            builder (optional): The tree builder creating the node, `self.node_builder` by default.
 
         Returns:
             ExpressionNode: An atomic node representing either a variable or a number.
@@ -156,40 +278,36 @@ class ExpressionGenerator:
         Raises:
             ValueError: If the provided atom_choice is not recognized.
         """
+        if builder is None:
+            builder = self.node_builder
         atoms_node = None
         if atom_choice == "variable":
             
-            atoms_node = VariableNode(random.choice(self.variables))
+            atoms_node = builder.new_variable(self.select_variable())
         elif atom_choice == "number":
             
-            atoms_node = NumberNode(
+            atoms_node = builder.new_number(
                 self.generate_random_value(), self.generate_random_base()
             )
         elif atom_choice == "variable_and_number":
             
-            atoms_type = random.choices(
-                ["variable", "number"],
-                weights=[
-                    self.atoms_type_weights["variable"],
-                    self.atoms_type_weights["number"],
-                ],
-            )[0]
+            atoms_type = ATOM_TYPES[next(self._atom_types)]
             if atoms_type == "variable":
-                atoms_node = VariableNode(random.choice(self.variables))
+                atoms_node = builder.new_variable(self.select_variable())
             else:
-                atoms_node = NumberNode(
+                atoms_node = builder.new_number(
                     self.generate_random_value(), self.generate_random_base()
                 )
         else:
             raise ValueError(
                 f"Unknown atom_choice value: {atom_choice}. Valid options are 'variable', 'number', or 'variable_and_number'."
             )
-        if atoms_node == None:
+        if atoms_node is None:
             self.logger.error("atoms_node is None")
         return atoms_node
 
     def generate_expression(
-        self, cur_depth, max_depth, atom_choice: str, is_op_weight: bool = False, fixed_op: OperatorInfo = None
+        self, cur_depth, max_depth, atom_choice: str, is_op_weight: bool = False, fixed_op: OperatorInfo = None, builder=None
     ) -> Dict[str, Any]:
         """
         Recursively generates a random expression tree up to a specified depth.
@@ -198,165 +316,214 @@ class ExpressionGenerator:
             cur_depth (int): Current depth of recursion.
             max_depth (int): Maximum depth of the expression tree.
             atom_choice (str): Determines what type of atoms can be generated ('variable', 'number', 'variable_and_number').
+            builder (optional): The tree builder creating the nodes, `self.node_builder` by default.
+                Pass an `ExpressionArrayTree` to build an array-backed tree; node indices are returned then.
 
         Returns:
             ExpressionNode: A node representing part of the expression tree.
         """
+        if builder is None:
+            builder = self.node_builder
         if cur_depth >= max_depth:
-            expr_node = self.generate_atoms(atom_choice)
+            expr_node = self.generate_atoms(atom_choice, builder)
             return expr_node
 
         if fixed_op is not None:
-            available_type=["atoms","fixed_op"]
-            expr_type=random.choices(available_type,weights=[0.5,0.5])[0]
+            expr_type = "atoms" if next(self._uniforms) < 0.5 else "fixed_op"
             if expr_type=="atoms":
-                expr_node = expr_node = self.generate_atoms(atom_choice)
+                expr_node = self.generate_atoms(atom_choice, builder)
                 return expr_node
             elif expr_type=="fixed_op":
                 if fixed_op.n_ary==1:
-                    expr_node = UnaryExpressionNode(fixed_op)
-                    expr_node.unary_expr = self.generate_expression(
-                        cur_depth + 1, max_depth, atom_choice,fixed_op=fixed_op
+                    expr_node = builder.new_unary(fixed_op)
+                    builder.attach_unary(
+                        expr_node,
+                        self.generate_expression(
+                            cur_depth + 1, max_depth, atom_choice, fixed_op=fixed_op, builder=builder
+                        ),
                     )
-                    expr_node.unary_expr.position = "unary"
                     return expr_node
                 else:
-                    expr_node = BinaryExpressionNode(fixed_op)
-                    expr_node.left_expr = self.generate_expression(
-                        cur_depth + 1, max_depth, atom_choice,fixed_op=fixed_op
+                    expr_node = builder.new_binary(fixed_op)
+                    left_expr = self.generate_expression(
+                        cur_depth + 1, max_depth, atom_choice, fixed_op=fixed_op, builder=builder
                     )
-                    expr_node.left_expr.position = "left"
-                    expr_node.right_expr = self.generate_expression(
-                        cur_depth + 1, max_depth, atom_choice,fixed_op=fixed_op
+                    right_expr = self.generate_expression(
+                        cur_depth + 1, max_depth, atom_choice, fixed_op=fixed_op, builder=builder
                     )
-                    expr_node.right_expr.position = "right"
+                    builder.attach_binary(expr_node, left_expr, right_expr)
                     return expr_node
 
-        expr_type = random.choices(
-            ["binary", "unary_prefix", "unary_postfix", "atoms"],
-            weights=[
-                self.expr_type_weights["binary"],
-                self.expr_type_weights["unary_prefix"],
-                self.expr_type_weights["unary_postfix"],
-                self.expr_type_weights["atoms"],
-            ],
-        )[0]
+        expr_type = EXPR_TYPES[next(self._expr_types)]
 
         if expr_type == "binary":
             
             if not self.binary_ops:
                 
-                return self.generate_expression(cur_depth, max_depth, atom_choice)
-            binary_op_weights = [opinfo.weight for opinfo in self.binary_ops]
-            if is_op_weight:
-                select_op = random.choices(
-                    self.binary_ops,
-                    weights=binary_op_weights,
-                )[0]
-            else:
-                equal_weight = [1] * len(self.binary_ops)
-                select_op = random.choices(
-                    self.binary_ops,
-                    weights=equal_weight,
-                )[0]
+                return self.generate_expression(cur_depth, max_depth, atom_choice, builder=builder)
+            select_op = self.select_operator(self.binary_ops, is_op_weight)
 
             # select_op = random.choice(self.binary_ops)
-            expr_node = BinaryExpressionNode(select_op)
+            expr_node = builder.new_binary(select_op)
 
             # The reason for recording the position here is that when converting to an expression string, 
             # parentheses need to be added appropriately, especially considering associativity.
             # For example, in the expression tree: 1 + (2 + 3), after outputting 2 + 3, 
             # the recursive upper level needs to determine whether to add parentheses.
+            # The builder records the positions when attaching the operands.
 
-            expr_node.left_expr = self.generate_expression(
-                cur_depth + 1, max_depth, atom_choice
+            left_expr = self.generate_expression(
+                cur_depth + 1, max_depth, atom_choice, builder=builder
             )
-            expr_node.left_expr.position = "left"
-            expr_node.right_expr = self.generate_expression(
-                cur_depth + 1, max_depth, atom_choice
+            right_expr = self.generate_expression(
+                cur_depth + 1, max_depth, atom_choice, builder=builder
             )
-            expr_node.right_expr.position = "right"
+            builder.attach_binary(expr_node, left_expr, right_expr)
             return expr_node
         elif expr_type == "unary_prefix":
             if not self.unary_prefix_ops:
-                return self.generate_expression(cur_depth, max_depth, atom_choice)
-            unary_prefix_ops_weights = [
-                opinfo.weight for opinfo in self.unary_prefix_ops
-            ]
-            if is_op_weight:
-                select_op = random.choices(
-                    self.unary_prefix_ops,
-                    weights=unary_prefix_ops_weights,
-                )[0]
-            else:
-                equal_weight = [1] * len(self.unary_prefix_ops)
-                select_op = random.choices(
-                    self.unary_prefix_ops,
-                    weights=equal_weight,
-                )[0]
+                return self.generate_expression(cur_depth, max_depth, atom_choice, builder=builder)
+            select_op = self.select_operator(self.unary_prefix_ops, is_op_weight)
             # select_op = random.choice(self.unary_prefix_ops)
             # if select_op.is_base:
             #     print("error")
             #     exit(1)
-            expr_node = UnaryExpressionNode(select_op)
-            expr_node.unary_expr = self.generate_expression(
-                cur_depth + 1, max_depth, atom_choice
+            expr_node = builder.new_unary(select_op)
+            builder.attach_unary(
+                expr_node,
+                self.generate_expression(cur_depth + 1, max_depth, atom_choice, builder=builder),
             )
-            expr_node.unary_expr.position = "unary"
             return expr_node
         elif expr_type == "unary_postfix":
             if not self.unary_postfix_ops:
-                return self.generate_expression(cur_depth, max_depth, atom_choice)
-            unary_postfix_ops_weights = [
-                opinfo.weight for opinfo in self.unary_postfix_ops
-            ]
-            if is_op_weight:
-                select_op = random.choices(
-                    self.unary_postfix_ops,
-                    weights=unary_postfix_ops_weights,
-                )[0]
-            else:
-                equal_weight = [1] * len(self.unary_postfix_ops)
-                select_op = random.choices(
-                    self.unary_postfix_ops,
-                    weights=equal_weight,
-                )[0]
+                return self.generate_expression(cur_depth, max_depth, atom_choice, builder=builder)
+            select_op = self.select_operator(self.unary_postfix_ops, is_op_weight)
             # select_op = random.choice(self.unary_postfix_ops)
-            expr_node = UnaryExpressionNode(select_op)
-            expr_node.unary_expr = self.generate_expression(
-                cur_depth + 1, max_depth, atom_choice
+            expr_node = builder.new_unary(select_op)
+            builder.attach_unary(
+                expr_node,
+                self.generate_expression(cur_depth + 1, max_depth, atom_choice, builder=builder),
             )
-            expr_node.unary_expr.position = "unary"
             return expr_node
         elif expr_type == "atoms":
-            expr_node = expr_node = self.generate_atoms(atom_choice)
+            expr_node = self.generate_atoms(atom_choice, builder)
             return expr_node
 
+    def generate_expression_array(
+        self, max_depth: int, atom_choice: str, is_op_weight: bool = False, fixed_op: OperatorInfo = None
+    ) -> ExpressionArrayTree:
+        """
+        Generates a random expression tree in the compact array-backed representation.
+
+        Draws exactly the same random decisions as `generate_expression`, but stores the nodes
+        in the parallel arrays of an `ExpressionArrayTree` instead of allocating one object per node.
+
+        Args:
+            max_depth (int): Maximum depth of the expression tree.
+            atom_choice (str): Determines what type of atoms can be generated ('variable', 'number', 'variable_and_number').
+
+        Returns:
+            ExpressionArrayTree: The generated tree.
+        """
+        tree = ExpressionArrayTree(self.operator_table, self.variables)
+        self.generate_expression(
+            cur_depth=0, max_depth=max_depth, atom_choice=atom_choice,
+            is_op_weight=is_op_weight, fixed_op=fixed_op, builder=tree,
+        )
+        return tree
+
+    def create_expression_enumerator(self, atom_choice: str, leaves: List = None) -> ExpressionEnumerator:
+        """
+        Creates an enumerator over all trees buildable from the generator's operators.
+
+        Args:
+            atom_choice (str): Default leaf set if `leaves` is None: 'number' uses every value of
+                `expr_numeric_range`, 'variable' the configured variables, 'variable_and_number' both.
+            leaves (List, optional): Explicit leaf set; ints are number leaves, strs variable leaves.
+
+        Returns:
+            ExpressionEnumerator: The enumerator, with number leaves in the current base.
+        """
+        if leaves is None:
+            if atom_choice == "number":
+                leaves = list(range(self.min_value, self.max_value + 1))
+            elif atom_choice == "variable":
+                leaves = list(self.variables)
+            elif atom_choice == "variable_and_number":
+                leaves = list(self.variables) + list(range(self.min_value, self.max_value + 1))
+            else:
+                raise ValueError(
+                    f"Unknown atom_choice value: {atom_choice}. Valid options are 'variable', 'number', or 'variable_and_number'."
+                )
+        return ExpressionEnumerator(
+            self.binary_ops, self.unary_prefix_ops + self.unary_postfix_ops, leaves, base=self.current_base
+        )
+
+    def enumerate_expressions(
+        self, max_depth: int, atom_choice: str = "number", leaves: List = None, start: int = 0, stop: int = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Evaluates every distinct expression tree up to `max_depth` with rank in [start, stop), one at a time.
+
+        Unlike `create_expression`, nothing is random: the trees come from an `ExpressionEnumerator`,
+        so workers can each take a contiguous rank range (see `ExpressionEnumerator.split`) and
+        together cover the whole space exactly once. Results are streamed, never materialized.
+
+        Args:
+            max_depth (int): Maximum depth of the expression trees.
+            atom_choice (str): Default leaf set, see `create_expression_enumerator`.
+            leaves (List, optional): Explicit leaf set.
+            start (int): First rank (inclusive).
+            stop (int, optional): Last rank (exclusive), all trees if None.
+
+        Yields:
+            Dict[str, Any]: Properties of each evaluated expression, with its rank under "rank".
+        """
+        enumerator = self.create_expression_enumerator(atom_choice, leaves)
+        if self.tree_representation == "array":
+            builder_factory = lambda: ExpressionArrayTree(self.operator_table, self.variables)
+        else:
+            builder_factory = None
+        for rank, expression_tree in enumerator.iter_range(max_depth, start, stop, builder_factory):
+            if builder_factory is not None:
+                expression_tree = expression_tree.root
+            properties = self.evaluate_expression_tree(expression_tree)
+            properties["rank"] = rank
+            for op_id in properties["used_operators"]:
+                self.operators2expr[op_id].append(self.cur_expr_id)
+            self.cur_expr_id += 1
+            yield properties
+
 
     def create_single_operator_expression(self, func_id:str):
         opinfo=self.operator_manager.get_operator_by_func_id(func_id)
+        if self.tree_representation == "array":
+            builder = ExpressionArrayTree(self.operator_table, self.variables)
+        else:
+            builder = self.node_builder
         if opinfo.n_ary==1:
-            expr_node = UnaryExpressionNode(opinfo)
-            expr_node.unary_expr = NumberNode(
-                self.generate_random_value(), self.generate_random_base()
+            expr_node = builder.new_unary(opinfo)
+            builder.attach_unary(
+                expr_node,
+                builder.new_number(self.generate_random_value(), self.generate_random_base()),
             )
-            expr_node.unary_expr.position = "unary"
         elif opinfo.n_ary==2:
-            expr_node = BinaryExpressionNode(opinfo)
-            expr_node.left_expr = NumberNode(
+            expr_node = builder.new_binary(opinfo)
+            left_expr = builder.new_number(
                 self.generate_random_value(), self.generate_random_base()
             )
-            expr_node.left_expr.position = "left"
-            expr_node.right_expr = NumberNode(
+            right_expr = builder.new_number(
                 self.generate_random_value(), self.generate_random_base()
             )
-            expr_node.right_expr.position = "right"
+            builder.attach_binary(expr_node, left_expr, right_expr)
+        if self.tree_representation == "array":
+            expr_node = builder.root
         
 
         expr_result_base = None
         longer_result_info = None
         if self.result_base_random_flag:
-            expr_result_base = random.randint(2, self.max_base)
+            expr_result_base = next(self._random_bases)
         else:
             expr_result_base = self.result_base
         if self.longer_result_compute_flag:
@@ -392,20 +559,42 @@ class ExpressionGenerator:
             Dict[str, Any]: Properties of the evaluated expression, including used operators.
         """
         # self.logger.debug(f"Generating expression {self.cur_expr_id}")
-        if fix_func_id is None:
-            expression_tree = self.generate_expression(
-                cur_depth=0, max_depth=self.max_depth, atom_choice=atom_choice, 
-            )
+        fixed_op = None
+        if fix_func_id is not None:
+            fixed_op = self.operator_manager.get_operator_by_func_id(fix_func_id)
+        if self.tree_representation == "array":
+            expression_tree = self.generate_expression_array(
+                max_depth=self.max_depth, atom_choice=atom_choice, fixed_op=fixed_op
+            ).root
         else:
             expression_tree = self.generate_expression(
-                cur_depth=0, max_depth=self.max_depth, atom_choice=atom_choice, fixed_op=
-                self.operator_manager.get_operator_by_func_id(fix_func_id)
+                cur_depth=0, max_depth=self.max_depth, atom_choice=atom_choice, fixed_op=fixed_op
             )
 
+        properties = self.evaluate_expression_tree(expression_tree)
+        # print(properties["used_operators"])
+        for op_id in properties["used_operators"]:
+            self.operators2expr[op_id].append(self.cur_expr_id)
+
+        # return expression_tree
+        self.cur_expr_id += 1
+
+        return properties
+
+    def evaluate_expression_tree(self, expression_tree) -> Dict[str, Any]:
+        """
+        Evaluates a generated expression tree with the configured result base and longer result settings.
+
+        Args:
+            expression_tree: The root node of the tree (an `ExpressionNode` or an `ArrayNodeView`).
+
+        Returns:
+            Dict[str, Any]: Properties of the evaluated expression.
+        """
         expr_result_base = None
         longer_result_info = None
         if self.result_base_random_flag:
-            expr_result_base = random.randint(2, self.max_base)
+            expr_result_base = next(self._random_bases)
         else:
             expr_result_base = self.result_base
         if self.longer_result_compute_flag:
@@ -421,15 +610,208 @@ class ExpressionGenerator:
             longer_result_info=longer_result_info,
         )
         # self.logger.debug(f"Evaluating expression {self.cur_expr_id}")
-        properties = self.expr_evaluator.evaluate()
-        # print(properties["used_operators"])
-        for op_id in properties["used_operators"]:
-            self.operators2expr[op_id].append(self.cur_expr_id)
+        return self.expr_evaluator.evaluate()
 
-        # return expression_tree
-        self.cur_expr_id += 1
+    def reset_constraint_statistics(self) -> None:
+        """
+        Forgets the acceptance statistics learned by constrained generation.
+        """
+        self.constraint_statistics = ConstraintStatistics(
+            self.min_value, self.max_value, self.constraint_statistics.num_buckets
+        )
 
-        return properties
+    def generate_constrained_tree(
+        self, atom_choice: str, constraints: ExpressionConstraints, is_op_weight: bool = False
+    ):
+        """
+        Generates an expression tree steered towards the given constraints.
+
+        Operators are chosen by order: if `highest_n_order` is constrained, only operators up to
+        that order are eligible and the root is drawn from the operators of exactly that order,
+        so every tree has the required order. All operator choices are additionally weighted by
+        the operators' learned acceptance rates.
+
+        Args:
+            atom_choice (str): Determines what type of atoms can be generated ('variable', 'number', 'variable_and_number').
+            constraints (ExpressionConstraints): The target constraints.
+            is_op_weight (bool): Whether to also use `OperatorInfo.weight` as selection weight.
+
+        Returns:
+            The root of the generated tree (an `ExpressionNode` or an `ArrayNodeView`).
+
+        Raises:
+            ValueError: If no operator has the required order.
+        """
+        if self.tree_representation == "array":
+            builder = ExpressionArrayTree(self.operator_table, self.variables)
+        else:
+            builder = self.node_builder
+        op_pools = (self.binary_ops, self.unary_prefix_ops, self.unary_postfix_ops)
+        order = constraints.highest_n_order
+        self.operator_rate = self.constraint_statistics.operator_rate
+        try:
+            if order is None:
+                root = self.generate_expression(
+                    cur_depth=0, max_depth=self.max_depth, atom_choice=atom_choice,
+                    is_op_weight=is_op_weight, builder=builder,
+                )
+            else:
+                root_ops = [opinfo for ops in op_pools for opinfo in ops if opinfo.n_order == order]
+                if not root_ops or self.max_depth < 1:
+                    raise ValueError(f"No expression of highest_n_order {order} can be generated.")
+                self.binary_ops, self.unary_prefix_ops, self.unary_postfix_ops = (
+                    [opinfo for opinfo in ops if opinfo.n_order <= order] for ops in op_pools
+                )
+                root_op = self.select_operator(root_ops, is_op_weight)
+                if root_op.n_ary == 1:
+                    root = builder.new_unary(root_op)
+                    builder.attach_unary(
+                        root,
+                        self.generate_expression(1, self.max_depth, atom_choice, is_op_weight, builder=builder),
+                    )
+                else:
+                    root = builder.new_binary(root_op)
+                    left_expr = self.generate_expression(1, self.max_depth, atom_choice, is_op_weight, builder=builder)
+                    right_expr = self.generate_expression(1, self.max_depth, atom_choice, is_op_weight, builder=builder)
+                    builder.attach_binary(root, left_expr, right_expr)
+        finally:
+            self.binary_ops, self.unary_prefix_ops, self.unary_postfix_ops = op_pools
+            self.operator_rate = None
+        if self.tree_representation == "array":
+            root = builder.root
+        return root
+
+    def bias_leaf_values(self, node, parent_func_id: str = None, leaf_buckets: List = None) -> List:
+        """
+        Redraws the number leaves of a tree, tilted towards the value ranges that were accepted
+        most often under their parent operator.
+
+        A value is drawn from the usual leaf distribution and kept with probability proportional
+        to the acceptance rate of its bucket, so the result is the usual distribution reweighted
+        by the learned per-operator bucket statistics.
+
+        Args:
+            node: The root of the (sub)tree.
+            parent_func_id (str): The func_id of the node's parent operator, None for the root.
+            leaf_buckets (List): Collects (parent func_id, bucket) of every number leaf.
+
+        Returns:
+            List[Tuple[str, int]]: `leaf_buckets`.
+        """
+        if leaf_buckets is None:
+            leaf_buckets = []
+        kind = node.kind
+        if kind == NUMBER_NODE:
+            if parent_func_id is not None:
+                statistics = self.constraint_statistics
+                rates = statistics.bucket_rates(parent_func_id)
+                max_rate = max(rates)
+                while True:
+                    value = next(self._leaf_values)
+                    bucket = statistics.bucket_of(value)
+                    if next(self._uniforms) * max_rate < rates[bucket]:
+                        break
+                node.value = value
+                leaf_buckets.append((parent_func_id, bucket))
+        elif kind == BINARY_NODE:
+            self.bias_leaf_values(node.left_expr, node.operator.func_id, leaf_buckets)
+            self.bias_leaf_values(node.right_expr, node.operator.func_id, leaf_buckets)
+        elif kind == UNARY_NODE:
+            self.bias_leaf_values(node.unary_expr, node.operator.func_id, leaf_buckets)
+        return leaf_buckets
+
+    def create_constrained_expression(
+        self, atom_choice: str, constraints: ExpressionConstraints = None, max_attempts: int = None
+    ) -> Dict[str, Any]:
+        """
+        Creates a new expression satisfying the constraints, steering the sampling towards them
+        instead of generating blindly and filtering afterwards.
+
+        Every attempt generates a tree with `generate_constrained_tree`, biases its leaves with
+        `bias_leaf_values`, evaluates it and feeds the outcome back into
+        `self.constraint_statistics`, so later attempts favor the operators and leaf ranges that
+        satisfied the constraints so far. Only the accepted expression gets an id.
+
+        Args:
+            atom_choice (str): Determines the type of atoms that can be included in the expression.
+            constraints (ExpressionConstraints): The target constraints, `self.constraints` by default.
+            max_attempts (int): Attempts before giving up, `self.constraint_max_attempts` by default.
+
+        Returns:
+            Dict[str, Any]: Properties of the accepted expression.
+
+        Raises:
+            RuntimeError: If no attempt satisfied the constraints.
+        """
+        if constraints is None:
+            constraints = self.constraints
+        if constraints is None:
+            return self.create_expression(atom_choice)
+        self.expr_evaluator.require_fields(constraints.required_fields())
+        if max_attempts is None:
+            max_attempts = self.constraint_max_attempts
+        for _ in range(max_attempts):
+            expression_tree = self.generate_constrained_tree(atom_choice, constraints)
+            leaf_buckets = self.bias_leaf_values(expression_tree)
+            properties = self.evaluate_expression_tree(expression_tree)
+            accepted = constraints.accepts(properties)
+            self.constraint_statistics.record(properties["used_operators"], leaf_buckets, accepted)
+            if accepted:
+                for op_id in properties["used_operators"]:
+                    self.operators2expr[op_id].append(self.cur_expr_id)
+                self.cur_expr_id += 1
+                return properties
+        raise RuntimeError(
+            f"No expression satisfying {constraints} was found in {max_attempts} attempts."
+        )
+
+    def estimate_blind_acceptance_rate(
+        self, atom_choice: str, constraints: ExpressionConstraints = None, num_samples: int = 1000
+    ) -> float:
+        """
+        Estimates the fraction of blindly generated expressions that satisfy the constraints,
+        i.e. the acceptance rate of generate-then-filter.
+
+        Args:
+            atom_choice (str): Determines the type of atoms that can be included in the expression.
+            constraints (ExpressionConstraints): The target constraints, `self.constraints` by default.
+            num_samples (int): Number of blind samples.
+
+        Returns:
+            float: The blind acceptance rate.
+        """
+        if constraints is None:
+            constraints = self.constraints
+        self.expr_evaluator.require_fields(constraints.required_fields())
+        accepted = 0
+        for _ in range(num_samples):
+            if self.tree_representation == "array":
+                expression_tree = self.generate_expression_array(self.max_depth, atom_choice).root
+            else:
+                expression_tree = self.generate_expression(0, self.max_depth, atom_choice)
+            accepted += constraints.accepts(self.evaluate_expression_tree(expression_tree))
+        return accepted / num_samples if num_samples else 0.0
+
+    def constraint_acceptance_report(
+        self, atom_choice: str, constraints: ExpressionConstraints = None, blind_samples: int = 1000
+    ) -> Dict[str, Any]:
+        """
+        Reports the acceptance rate of constrained generation so far against blind sampling.
+
+        Args:
+            atom_choice (str): Atom choice used for the blind samples.
+            constraints (ExpressionConstraints): The target constraints, `self.constraints` by default.
+            blind_samples (int): Number of blind samples, 0 to skip the comparison.
+
+        Returns:
+            Dict[str, Any]: See `ConstraintStatistics.report`.
+        """
+        if constraints is None:
+            constraints = self.constraints
+        blind_rate = None
+        if blind_samples and constraints is not None:
+            blind_rate = self.estimate_blind_acceptance_rate(atom_choice, constraints, blind_samples)
+        return self.constraint_statistics.report(blind_rate)
 
 
     def create_expression_str(self, max_depth: int, atom_choice: str) -> str:
@@ -3,8 +3,16 @@ from operatorplus.operator_manager import OperatorManager
 from expression.base_converter import BaseConverter
 from expression.expression_base_converter import ExpressionBaseConverter
 
+# Node kinds, shared by the object nodes below and the array-backed ExpressionArrayTree
+NUMBER_NODE = 0
+VARIABLE_NODE = 1
+BINARY_NODE = 2
+UNARY_NODE = 3
+
 
 class ExpressionNode:
+    kind = None
+
     def __init__(self):
         """
         Initializes a basic expression node with a position attribute.
@@ -20,6 +28,8 @@ class ExpressionNode:
 
 
 class NumberNode(ExpressionNode):
+    kind = NUMBER_NODE
+
     def __init__(self, value: int, base: int = 10):
         """
         Initializes a number node with a value and an optional base.
@@ -80,6 +90,8 @@ class NumberNode(ExpressionNode):
 
 
 class VariableNode(ExpressionNode):
+    kind = VARIABLE_NODE
+
     def __init__(self, variable: str):
         """
         Initializes a variable node with a variable name.
@@ -104,6 +116,8 @@ class VariableNode(ExpressionNode):
 
 
 class BinaryExpressionNode(ExpressionNode):
+    kind = BINARY_NODE
+
     def __init__(self, operator: OperatorInfo):
         """
         Initializes a binary expression node with an operator.
@@ -132,6 +146,8 @@ class BinaryExpressionNode(ExpressionNode):
 
 
 class UnaryExpressionNode(ExpressionNode):
+    kind = UNARY_NODE
+
     def __init__(self, operator: OperatorInfo):
         """
         Initializes a unary expression node with an operator.
@@ -155,3 +171,40 @@ class UnaryExpressionNode(ExpressionNode):
             "operator": self.operator.symbol,
             "unary_expr": self.unary_expr.to_dict(),
         }
+
+
+class ExpressionNodeBuilder:
+    """
+    Builds expression trees out of the node objects above.
+
+    The expression generator only talks to a builder, so the same generation logic can also
+    produce an `ExpressionArrayTree`, which implements the same methods.
+    """
+
+    def new_number(self, value: int, base: int) -> NumberNode:
+        return NumberNode(value, base)
+
+    def new_variable(self, variable: str) -> VariableNode:
+        return VariableNode(variable)
+
+    def new_binary(self, operator: OperatorInfo) -> BinaryExpressionNode:
+        return BinaryExpressionNode(operator)
+
+    def new_unary(self, operator: OperatorInfo) -> UnaryExpressionNode:
+        return UnaryExpressionNode(operator)
+
+    def attach_binary(self, node: BinaryExpressionNode, left: ExpressionNode, right: ExpressionNode) -> None:
+        """
+        Sets the operands of a binary node and records their positions.
+        """
+        node.left_expr = left
+        node.left_expr.position = "left"
+        node.right_expr = right
+        node.right_expr.position = "right"
+
+    def attach_unary(self, node: UnaryExpressionNode, operand: ExpressionNode) -> None:
+        """
+        Sets the operand of a unary node and records its position.
+        """
+        node.unary_expr = operand
+        node.unary_expr.position = "unary"
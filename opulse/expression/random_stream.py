@@ -0,0 +1,113 @@
+from typing import Any, Callable, Iterator, Optional
+import numpy as np
+
+
+class RandomStream:
+    """
+    Block-buffered random source used by the expression generator.
+
+    Instead of calling the Python-level `random` module once per draw, every kind of draw
+    (leaf values, bases, node types, ...) is pre-drawn in large blocks from a
+    `numpy.random.Generator` and handed out one by one. A block is refilled transparently
+    when it is exhausted.
+    """
+
+    DEFAULT_BLOCK_SIZE = 4096
+
+    def __init__(self, rng: Optional[np.random.Generator] = None, block_size: int = DEFAULT_BLOCK_SIZE):
+        """
+        Initializes the random stream.
+
+        Parameters:
+            rng (np.random.Generator, optional): The generator the blocks are drawn from. A fresh, OS-seeded generator is used if None.
+            block_size (int): Number of values drawn per refill.
+        """
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.block_size = block_size
+
+    def block_iter(self, draw: Callable[[np.random.Generator, int], np.ndarray]) -> Iterator[Any]:
+        """
+        Creates an endless iterator over values produced by `draw` in blocks of `block_size`.
+
+        Parameters:
+            draw (Callable): A function `draw(rng, size)` returning an array of `size` values.
+
+        Returns:
+            Iterator[Any]: An iterator yielding plain Python values; use `next()` to take one.
+        """
+        rng = self.rng
+        block_size = self.block_size
+        while True:
+            # tolist() converts to Python ints/floats once per block instead of once per value
+            yield from draw(rng, block_size).tolist()
+
+    def uniform_iter(self) -> Iterator[float]:
+        """
+        Creates an endless iterator of floats in [0, 1), used for picking from sequences.
+
+        Returns:
+            Iterator[float]: Uniform floats.
+        """
+        return self.block_iter(lambda rng, size: rng.random(size))
+
+    def randint_iter(self, low: int, high: int) -> Iterator[int]:
+        """
+        Creates an endless iterator of integers in [low, high], matching `random.randint(low, high)`.
+
+        Parameters:
+            low (int): Lower bound (inclusive).
+            high (int): Upper bound (inclusive).
+
+        Returns:
+            Iterator[int]: Uniform integers.
+        """
+        return self.block_iter(lambda rng, size: rng.integers(low, high, size, endpoint=True))
+
+    def weighted_index_iter(self, weights) -> Iterator[int]:
+        """
+        Creates an endless iterator of indices drawn with the given relative weights,
+        matching `random.choices(range(len(weights)), weights=weights)`.
+
+        Parameters:
+            weights (Sequence[float]): Non-negative relative weights, they do not need to sum to 1.
+
+        Returns:
+            Iterator[int]: Indices into `weights`.
+        """
+        p = np.asarray(weights, dtype=float)
+        p = p / p.sum()
+        return self.block_iter(lambda rng, size: rng.choice(len(p), size, p=p))
+
+    @classmethod
+    def for_shard(cls, global_seed: int, *shard_key: int, block_size: int = DEFAULT_BLOCK_SIZE) -> "RandomStream":
+        """
+        Creates the random stream of one shard of a run.
+
+        Parameters:
+            global_seed (int): The seed of the whole run.
+            *shard_key (int): Integers identifying the shard, e.g. (base, depth, shard_id).
+            block_size (int): Number of values drawn per refill.
+
+        Returns:
+            RandomStream: A stream that only depends on `global_seed` and `shard_key`.
+        """
+        return cls(shard_rng(global_seed, *shard_key), block_size=block_size)
+
+
+def shard_rng(global_seed: int, *shard_key: int) -> np.random.Generator:
+    """
+    Creates an independent, counter-based (Philox) generator for one shard of a run.
+
+    The generator is fully determined by `global_seed` and `shard_key`, so any shard can be
+    regenerated on its own, and different keys never share a stream regardless of which
+    process draws from it.
+
+    Parameters:
+        global_seed (int): The seed of the whole run.
+        *shard_key (int): Non-negative integers identifying the shard.
+
+    Returns:
+        np.random.Generator: The shard's generator.
+    """
+    seed_seq = np.random.SeedSequence(global_seed, spawn_key=shard_key)
+    return np.random.Generator(np.random.Philox(seed_seq))
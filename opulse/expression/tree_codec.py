@@ -0,0 +1,173 @@
+import base64
+from typing import List, Tuple
+from expression.expression_node import (
+    ExpressionNodeBuilder,
+    NUMBER_NODE,
+    VARIABLE_NODE,
+    BINARY_NODE,
+    UNARY_NODE,
+)
+from expression.expression_array_tree import OperatorTable
+
+NODE_KINDS = (NUMBER_NODE, VARIABLE_NODE, BINARY_NODE, UNARY_NODE)
+
+# Values of the `expr_tree_encoding` config entry
+TREE_ENCODINGS = ("compact", "dict")
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, position: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, position
+        shift += 7
+
+
+def encode_tree(root, operator_table: OperatorTable, variables: List[str]) -> bytes:
+    """
+    Encodes an expression tree in compact prefix order.
+
+    Every node is its kind byte followed by, for operator nodes, the varint index of its operator
+    in `operator_table`; for number nodes, the zigzag varint value and the varint base; and for
+    variable nodes, the varint index of the variable in `variables`. Operands follow their
+    operator node, left before right, so no child references are stored.
+
+    Args:
+        root: The root node, an `ExpressionNode` or an `ArrayNodeView`.
+        operator_table (OperatorTable): The table operator indices refer to, see `OperatorTable.from_manager`.
+        variables (List[str]): The variable names variable indices refer to.
+
+    Returns:
+        bytes: The encoded tree.
+
+    Raises:
+        ValueError: If a node has an unknown kind.
+    """
+    out = bytearray()
+    append = out.append
+    indices = operator_table.indices
+    stack = [root]
+    pop = stack.pop
+    push = stack.append
+    while stack:
+        node = pop()
+        kind = node.kind
+        if kind not in NODE_KINDS:
+            raise ValueError(f"Unknown node kind {kind}")
+        append(kind)
+        if kind == NUMBER_NODE:
+            value = int(node.value)
+            value = value << 1 if value >= 0 else (-value << 1) - 1
+            base = int(node.base)
+            # Leaf values and bases are mostly single varint bytes
+            if value < 0x80:
+                append(value)
+            else:
+                _write_varint(out, value)
+            if base < 0x80:
+                append(base)
+            else:
+                _write_varint(out, base)
+        elif kind == VARIABLE_NODE:
+            _write_varint(out, variables.index(node.v))
+        else:
+            operator = node.operator
+            op_index = indices.get(operator.func_id)
+            if op_index is None:
+                op_index = operator_table.index_of(operator)
+            if op_index < 0x80:
+                append(op_index)
+            else:
+                _write_varint(out, op_index)
+            if kind == BINARY_NODE:
+                push(node.right_expr)
+                push(node.left_expr)
+            else:
+                push(node.unary_expr)
+    return bytes(out)
+
+
+def decode_tree(data: bytes, operator_table: OperatorTable, variables: List[str], builder=None):
+    """
+    Decodes a tree encoded by `encode_tree`.
+
+    Args:
+        data (bytes): The encoded tree.
+        operator_table (OperatorTable): The table the tree was encoded with.
+        variables (List[str]): The variable names the tree was encoded with.
+        builder (optional): The builder creating the nodes, a new `ExpressionNodeBuilder` by default.
+            With an `ExpressionArrayTree` the tree is decoded into its arrays.
+
+    Returns:
+        The root node returned by the builder, an `ExpressionNode` by default.
+
+    Raises:
+        ValueError: If the data holds more than one tree.
+    """
+    if builder is None:
+        builder = ExpressionNodeBuilder()
+
+    def decode_node(position: int):
+        kind = data[position]
+        position += 1
+        if kind == NUMBER_NODE:
+            value, position = _read_varint(data, position)
+            base, position = _read_varint(data, position)
+            value = value >> 1 if not value & 1 else -((value + 1) >> 1)
+            return builder.new_number(value, base), position
+        elif kind == VARIABLE_NODE:
+            index, position = _read_varint(data, position)
+            return builder.new_variable(variables[index]), position
+        elif kind == BINARY_NODE:
+            op_index, position = _read_varint(data, position)
+            node = builder.new_binary(operator_table[op_index])
+            left, position = decode_node(position)
+            right, position = decode_node(position)
+            builder.attach_binary(node, left, right)
+            return node, position
+        elif kind == UNARY_NODE:
+            op_index, position = _read_varint(data, position)
+            node = builder.new_unary(operator_table[op_index])
+            operand, position = decode_node(position)
+            builder.attach_unary(node, operand)
+            return node, position
+        else:
+            raise ValueError(f"Unknown node kind {kind} at byte {position - 1}.")
+
+    root, position = decode_node(0)
+    if position != len(data):
+        raise ValueError(f"{len(data) - position} trailing bytes after the encoded tree.")
+    return root
+
+
+def tree_to_text(data: bytes) -> str:
+    """
+    Returns the base64 text of an encoded tree, as stored in the `tree` field of JSONL records.
+    """
+    return base64.b64encode(data).decode("ascii")
+
+
+def tree_from_text(text: str) -> bytes:
+    """
+    Returns the encoded tree of a `tree_to_text` string.
+    """
+    return base64.b64decode(text)
+
+
+def tree_to_dict(data: bytes, operator_table: OperatorTable, variables: List[str]) -> dict:
+    """
+    Converts an encoded tree to the nested dictionary of `ExpressionNode.to_dict`, e.g. to read
+    compact records with tools expecting the old form.
+    """
+    return decode_tree(data, operator_table, variables).to_dict()
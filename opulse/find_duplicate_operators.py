@@ -0,0 +1,52 @@
+import argparse
+import time
+from operatorplus import *
+from operatorplus.behavior import find_behavior_duplicates
+from config import LogConfig, ParamConfig
+import orjson
+
+if __name__ == "__main__":
+    # Parse command-line arguments
+    parser = argparse.ArgumentParser(description="Find operators of an operator file that behave identically.")
+
+    parser.add_argument('--config', type=str, default='config/generate_operator.yaml', help="Path to the config file")
+    parser.add_argument('--operator-file', type=str, required=True, help="Path to the operator JSONL file")
+    parser.add_argument('--cython-cache-dir', type=str, default="./compiled_funcs", help='Path to the Cython cache directory')
+    parser.add_argument('--output', type=str, default=None, help="Optional JSONL file receiving one line per group of duplicates")
+
+    args = parser.parse_args()
+
+    print("==================================================")
+    print("Searching for behaviourally identical operators...")
+    print(f"Config Path: {args.config}")
+    print(f"Operator File: {args.operator_file}")
+    print(f"Cython Cache Directory: {args.cython_cache_dir}")
+
+    # Load config
+    config = ParamConfig(args.config)
+
+    # Setup logging
+    logging_config = config.get_logging_config()
+    log = LogConfig(logging_config)
+
+    # Operators are compiled (or loaded from the cache) so they can run on the probe vector
+    compiler = CythonCompiler(args.cython_cache_dir)
+    op_manager = OperatorManager(args.operator_file, config, log, args.cython_cache_dir, compiler, True)
+
+    start_time = time.time()
+    groups = find_behavior_duplicates(op_manager.operators)
+    end_time = time.time()
+
+    for func_ids in groups:
+        symbols = [op_manager.operators[func_id].symbol for func_id in func_ids]
+        print(f"Identical behaviour: {', '.join(f'{s} ({i})' for s, i in zip(symbols, func_ids))}")
+    print(f"Fingerprinted {len(op_manager.operators)} operators in {end_time - start_time:.2f}s, "
+          f"found {len(groups)} groups of duplicates.")
+
+    if args.output:
+        with open(args.output, "wb") as f:
+            for func_ids in groups:
+                f.write(orjson.dumps({
+                    "func_ids": func_ids,
+                    "symbols": [op_manager.operators[func_id].symbol for func_id in func_ids],
+                }) + b"\n")
@@ -1,4 +1,7 @@
-from multiprocessing import Pool, Manager, Queue
+from dataclasses import asdict
+from typing import List, Tuple
+from itertools import product
+from functools import partial
 import time
 import orjson
 import os
@@ -6,6 +9,8 @@ import argparse
 from operatorplus import *
 from expression import ExpressionGenerator
 from config import LogConfig, ParamConfig
+from pipeline import ShardTask, plan_shards, imap_bounded, encode_jsonl, ShardManifest, write_shard, WorkerSpec, export_for_preload, get_pool_context, load_operator_manager, load_expression_generator, RunHeader, RunManifest, imap_adaptive, UtilizationMeter, AsyncWriter, ShardEntry, ShardFileWriter, WorkQueue, default_owner, ParquetShardDataset, require_pyarrow, special_values_from_config, parquet_shard_size, FrameIndex, compress_frames, commit_compressed_shard, require_zstandard
+import secrets
 
 global logger
 
@@ -22,17 +27,16 @@ def extract_func_ids(operators_path):
 
     return func_ids
 
-def initialize(config_path: str, operators_path: str, cython_cache_dir: str):
-    config = ParamConfig(config_path)
+def initialize(spec: WorkerSpec):
+    config = spec.load_config()
     log = LogConfig(config.get_logging_config())
     global logger
     logger = log.get_logger()
 
-    compiler = CythonCompiler(cython_cache_dir)
-    op_manager = OperatorManager(operators_path, config, log, cython_cache_dir, compiler, True)
+    op_manager = load_operator_manager(spec, config, log)
     
     expression_generator = ExpressionGenerator(
-        config, log, cython_cache_dir, operator_manager=op_manager
+        config, log, spec.cython_cache_dir, operator_manager=op_manager
     )
     
     return {
@@ -43,89 +47,388 @@ def initialize(config_path: str, operators_path: str, cython_cache_dir: str):
         "exp_generator": expression_generator
     }
 
-def init_worker(global_dict):
+def init_worker(spec: WorkerSpec):
+    # Workers rebuild their state from the small spec instead of unpickling managers and generators
     global exp_generator_global
-    exp_generator_global = global_dict["exp_generator"]  
+    exp_generator_global = initialize(spec)["exp_generator"]
 
-def worker_generate_expression(result_queue):
+
+def generate_shard_records(exp_generator: ExpressionGenerator, task: ShardTask, seed: int, stream_key: tuple):
+    # Every shard draws from its own stream, so its records do not depend on the worker running it
+    exp_generator.seed_shard(seed, *stream_key, task.shard_id)
+    records = []
+    for idx in range(task.first_idx, task.stop_idx + 1):
+        # Falls back to create_expression when no expr_constraints are configured
+        properties = exp_generator.create_constrained_expression("number")
+        if idx >= task.start_idx:
+            properties['id'] = idx
+            records.append(properties)
+    if exp_generator.constraints is not None:
+        report = exp_generator.constraint_acceptance_report(
+            "number", blind_samples=exp_generator.param_config.get("expr_constraint_blind_samples", 0)
+        )
+        exp_generator.logger.info(f"Shard {task.shard_id} constraint acceptance: {report}")
+    return records
+
+def generate_shard(exp_generator: ExpressionGenerator, task: ShardTask, seed: int, stream_key: tuple):
+    # Serialized here, so the whole shard travels back to the parent as one bytes object
+    return encode_jsonl(generate_shard_records(exp_generator, task, seed, stream_key))
+
+def worker_generate_shard(task: ShardTask, seed: int, stream_key: tuple, shard_dir: str = None, parquet_dir: str = None, row_group_size: int = 10000, frame_records: int = None, zstd_level: int = 3):
     start_time = time.time()
-    properties = exp_generator_global.create_expression("number")
-    end_time = time.time()
-    result_queue.put((properties, end_time - start_time))  # 通过队列传递结果
-    
-def read_existing_lines(file_path):
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return sum(1 for line in f)
-    except FileNotFoundError:
-        return 0
+    if parquet_dir is not None:
+        # Parquet output mode: the worker writes the shard's own Parquet file and returns its path
+        records = generate_shard_records(exp_generator_global, task, seed, stream_key)
+        return task, ParquetShardDataset(parquet_dir).write(
+            task, records, row_group_size, special_values=special_values_from_config(exp_generator_global.param_config)
+        ), time.time() - start_time
+    blob = generate_shard(exp_generator_global, task, seed, stream_key)
+    if frame_records is not None:
+        # Compressed here as well, so the zstd work is spread over the workers
+        return task, compress_frames(blob, frame_records, zstd_level), time.time() - start_time
+    if shard_dir is not None:
+        # Shard output mode: the worker writes its own part file and only returns the manifest entry
+        return task, write_shard(shard_dir, task, blob, seed, stream_key), time.time() - start_time
+    return task, blob, time.time() - start_time
 
-def batch_write_to_file(batch, f):
-    for item in batch:
-        f.write(item.decode('utf-8') + '\n')
+def init_sweep_worker(spec: WorkerSpec):
+    # Sweep workers only keep the base spec; generators are built per (base, depth) on first use
+    global worker_spec_global
+    worker_spec_global = spec
+
+def worker_generate_sweep_shard(item: tuple):
+    base, depth, seed, task = item
+    start_time = time.time()
+    exp_generator = load_expression_generator(worker_spec_global.with_overrides(grid_overrides(base, depth)))
+    return item, generate_shard(exp_generator, task, seed, (base, depth)), time.time() - start_time
+
+def grid_overrides(base: int, depth: int):
+    return {
+        "random_base.base": base,
+        "result_base.base": base,
+        "longer_result_compute.base": base,
+        "expr_max_depth": depth,
+    }
 
 def generate_expressions_multiprocess_base_depth(
     file_path: str,
-    cython_cache_dir: str,
-    global_dict: dict,
+    worker_spec: WorkerSpec,
     num: int,
     max_workers: int,
     base: int,
     depth: int,
+    seed: int,
+    shard_size: int = 1000,
+    max_in_flight: int = None,
+    start_method: str = None,
+    output_mode: str = "single",
+    merge: bool = False,
+    fsync: str = "batch",
+    row_group_size: int = 10000,
+    compression: str = "none",
+    frame_records: int = 1000,
+    zstd_level: int = 3,
 ):
     directory = os.path.dirname(file_path)
     if directory and not os.path.exists(directory):
         os.makedirs(directory)
         
-    existing_lines = read_existing_lines(file_path)
-    if existing_lines >= num:
+    overrides = grid_overrides(base, depth)
+
+    if max_in_flight is None:
+        max_in_flight = 2 * max_workers
+
+    run_spec = worker_spec.with_overrides(overrides)
+    stream_key = (base, depth)
+
+    if output_mode == "parquet":
+        require_pyarrow()
+        # One Parquet file per shard, renamed into place when complete; listing the directory says what is done
+        dataset = ParquetShardDataset(f"{os.path.splitext(file_path)[0]}.parquet")
+        if parquet_shard_size(shard_size, row_group_size) != shard_size:
+            print(f"Parquet shards hold at least one row group, using a shard size of {row_group_size} instead of {shard_size}.")
+            shard_size = parquet_shard_size(shard_size, row_group_size)
+        run_manifest = RunManifest(dataset.run_manifest_path)
+        seed = run_manifest.start(RunHeader.for_spec(run_spec, seed, shard_size, stream_key)).seed
+        tasks = dataset.pending_tasks(num, shard_size)
+        if not tasks:
+            print(f"{dataset.directory} has generated enough expressions, skipping.")
+            return
+        print(f"Need to generate {sum(task.count for task in tasks)} more expressions...")
+        start_time = time.time()
+        context = get_pool_context(start_method)
+        with context.Pool(processes=max_workers, initializer=init_worker, initargs=(run_spec,)) as pool:
+            worker = partial(worker_generate_shard, seed=seed, stream_key=stream_key, parquet_dir=dataset.directory, row_group_size=row_group_size)
+            for task, path, time_taken in imap_bounded(pool, worker, tasks, max_in_flight, ordered=False):
+                print(f"Shard {task.shard_id} written to {path} ({task.start_idx}-{task.stop_idx}) in {time_taken:.2f}s")
+        end_time = time.time()
+        print(f"Generated {num} expressions in {end_time - start_time:.2f}s")
+        return
+
+    if output_mode == "shards":
+        # Every worker appends to its own part file; the manifest, not the output, says what is done
+        shard_dir = f"{os.path.splitext(file_path)[0]}.shards"
+        manifest = ShardManifest(shard_dir)
+        # The run header pins the config and operator set the committed shards were generated with,
+        # and is the only record of the seed they were drawn from
+        run_manifest = RunManifest(os.path.join(shard_dir, "run.jsonl"))
+        seed = run_manifest.start(RunHeader.for_spec(run_spec, seed, shard_size, stream_key)).seed
+        tasks = manifest.pending_tasks(num, shard_size)
+        if not tasks:
+            print(f"{shard_dir} has generated enough expressions, skipping.")
+        else:
+            print(f"Need to generate {sum(task.count for task in tasks)} more expressions...")
+            start_time = time.time()
+            context = get_pool_context(start_method)
+            with context.Pool(processes=max_workers, initializer=init_worker, initargs=(run_spec,)) as pool:
+                worker = partial(worker_generate_shard, seed=seed, stream_key=stream_key, shard_dir=shard_dir)
+                for task, entry, time_taken in imap_bounded(pool, worker, tasks, max_in_flight, ordered=False):
+                    manifest.add(entry)
+                    print(f"Shard {task.shard_id} committed ({task.start_idx}-{task.stop_idx}) in {time_taken:.2f}s")
+            end_time = time.time()
+            print(f"Generated {num} expressions in {end_time - start_time:.2f}s")
+        if merge:
+            merged = manifest.merge(file_path)
+            print(f"Merged {merged} expressions into {file_path}")
+        return
+
+    frame_index = None
+    if compression == "zstd":
+        require_zstandard()
+        # Independent zstd frames of frame_records records, with a sidecar index of their first ids and offsets
+        file_path = f"{file_path}.zst"
+        frame_index = FrameIndex(f"{file_path}.idx")
+
+    # The manifest, not the output, says which records are done; see RunManifest
+    run_manifest = RunManifest(f"{file_path}.manifest.jsonl")
+    seed = run_manifest.start(RunHeader.for_spec(run_spec, seed, shard_size, stream_key)).seed
+    if frame_index is None:
+        run_manifest.adopt_output(file_path)
+    dropped = run_manifest.rollback_output(file_path)
+    if dropped:
+        print(f"Dropped {dropped} uncommitted bytes from {file_path}.")
+    if frame_index is not None:
+        frame_index.truncate(run_manifest.end_offset)
+    tasks = run_manifest.pending_tasks(num)
+    if not tasks:
         print(f"{file_path} has generated enough expressions, skipping.")
         return
     
-    remaining = num - existing_lines
-    print(f"Need to generate {remaining} more expressions...")
+    print(f"Need to generate {sum(task.count for task in tasks)} more expressions...")
 
-    global_dict['config'].config["random_base"]["base"] = base
-    global_dict['config'].config["result_base"]["base"] = base
-    global_dict['config'].config["longer_result_compute"]["base"] = base
-    global_dict['config'].config["expr_max_depth"] = depth
-    
-    global_dict['exp_generator'] = ExpressionGenerator(
-        global_dict['config'], global_dict['log'], cython_cache_dir, operator_manager=global_dict['op_manager']
+    start_time = time.time()
+    context = get_pool_context(start_method)
+    # The writer thread writes, fsyncs and commits shards while the next results are collected
+    with AsyncWriter(max_pending=2, fsync=fsync) as writer, context.Pool(processes=max_workers, initializer=init_worker, initargs=(run_spec,)) as pool:
+        worker = partial(
+            worker_generate_shard, seed=seed, stream_key=stream_key,
+            frame_records=frame_records if frame_index is not None else None, zstd_level=zstd_level,
+        )
+        # Shards are written as they arrive, in id order; at most max_in_flight shards are held in memory
+        for task, blob, time_taken in imap_bounded(pool, worker, tasks, max_in_flight):
+            # Committed only once the shard is written (and durable under fsync="batch"); a crash before
+            # the commit rolls it back on restart
+            if frame_index is None:
+                on_written = partial(run_manifest.commit, task, blob.count(b"\n"))
+            else:
+                # Compressed shards arrive with their frame entries, which are indexed before the commit
+                blob, frames = blob
+                on_written = partial(commit_compressed_shard, frame_index, run_manifest, task, len(blob), frames)
+            writer.submit(file_path, [blob], on_written=on_written)
+            print(f"Batch write queued up to expression {task.stop_idx}")
+            print(f"Batch Generate expressions cost {time_taken:.2f}s")
+
+    end_time = time.time()
+    print(f"Generated {num} expressions in {end_time - start_time:.2f}s")
+
+def generate_expressions_sweep(
+    output_dir: str,
+    worker_spec: WorkerSpec,
+    grid: List[Tuple[int, int, int]],
+    max_workers: int,
+    seed: int,
+    shard_size: int = 1000,
+    max_in_flight: int = None,
+    start_method: str = None,
+    target_task_seconds: float = 2.0,
+    fsync: str = "batch",
+):
+    """
+    Generates a whole grid of (base, depth, num) points with one long-lived pool.
+
+    Workers stay warm across the grid: each task carries its (base, depth) and a worker builds
+    the generator of a point once, sharing the loaded operator set. Every point writes
+    `base<base>_depth<depth>.jsonl` with its own run manifest and the same random streams as
+    `generate_expressions_multiprocess_base_depth`, so the files are identical to separate runs
+    and can be resumed by either entry point. Shards are batched into tasks of about
+    `target_task_seconds` from the measured cost of each point, see `imap_adaptive`.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if max_in_flight is None:
+        max_in_flight = 2 * max_workers
+
+    outputs = {}
+    items = []
+    for base, depth, num in grid:
+        file_path = os.path.join(output_dir, f"base{base}_depth{depth}.jsonl")
+        run_manifest = RunManifest(f"{file_path}.manifest.jsonl")
+        header = RunHeader.for_spec(worker_spec.with_overrides(grid_overrides(base, depth)), seed, shard_size, (base, depth))
+        point_seed = run_manifest.start(header).seed
+        run_manifest.adopt_output(file_path)
+        dropped = run_manifest.rollback_output(file_path)
+        if dropped:
+            print(f"Dropped {dropped} uncommitted bytes from {file_path}.")
+        tasks = run_manifest.pending_tasks(num)
+        if not tasks:
+            print(f"{file_path} has generated enough expressions, skipping.")
+            continue
+        print(f"Need to generate {sum(task.count for task in tasks)} more expressions for base {base}, depth {depth}...")
+        outputs[(base, depth)] = (file_path, run_manifest)
+        items.extend((base, depth, point_seed, task) for task in tasks)
+
+    if not items:
+        return
+
+    start_time = time.time()
+    context = get_pool_context(start_method)
+    meter = UtilizationMeter(max_workers)
+    with AsyncWriter(max_pending=2, fsync=fsync) as writer, context.Pool(processes=max_workers, initializer=init_sweep_worker, initargs=(worker_spec,)) as pool:
+        # Items are grouped by point and in id order, so every output file is still appended in id order
+        results = imap_adaptive(
+            pool, worker_generate_sweep_shard, items, cost=lambda item: item[3].count, group=lambda item: item[:2],
+            max_in_flight=max_in_flight, target_seconds=target_task_seconds, meter=meter,
+        )
+        for (base, depth, _, task), blob, time_taken in results:
+            file_path, run_manifest = outputs[(base, depth)]
+            writer.submit(file_path, [blob], on_written=partial(run_manifest.commit, task, blob.count(b"\n")))
+            print(f"Base {base}, depth {depth}: batch write queued up to expression {task.stop_idx} in {time_taken:.2f}s")
+
+    end_time = time.time()
+    print(f"Generated {sum(task.count for *_, task in items)} expressions for {len(outputs)} grid points in {end_time - start_time:.2f}s")
+    print(f"Worker utilization: {meter.report()}")
+
+def queue_task_name(task: ShardTask):
+    return f"shard-{task.shard_id:09d}-{task.start_idx}-{task.stop_idx}"
+
+def collect_queue_results(queue: WorkQueue, manifest: ShardManifest):
+    # Finished queue tasks become manifest entries, so shards written by any node merge as usual
+    committed = {(entry.shard_id, entry.start_idx, entry.stop_idx) for entry in manifest.entries}
+    added = 0
+    for done in queue.results():
+        result = dict(done["result"], stream_key=tuple(done["result"]["stream_key"]))
+        entry = ShardEntry(**result)
+        if (entry.shard_id, entry.start_idx, entry.stop_idx) not in committed:
+            manifest.add(entry)
+            committed.add((entry.shard_id, entry.start_idx, entry.stop_idx))
+            added += 1
+    return added
+
+def enqueue_base_depth(
+    queue_dir: str,
+    worker_spec: WorkerSpec,
+    num: int,
+    base: int,
+    depth: int,
+    seed: int,
+    shard_size: int = 1000,
+    lease_seconds: float = 600.0,
+):
+    """
+    Coordinator of a multi-node run: writes the shard tasks of one (base, depth) file into a
+    `WorkQueue` directory on a shared filesystem.
+
+    The job description holds the worker spec (with absolute paths), the seed and the stream
+    key, so `queue_worker` processes on any node can generate shards without other arguments.
+    Calling it again resumes: finished shards are collected, and only ids not yet done or
+    handed out are enqueued, so it also extends a run to a larger `num`.
+    """
+    queue = WorkQueue(queue_dir)
+    run_spec = WorkerSpec(
+        os.path.abspath(worker_spec.config_path),
+        os.path.abspath(worker_spec.operators_path),
+        os.path.abspath(worker_spec.cython_cache_dir),
+        worker_spec.overrides,
+    ).with_overrides(grid_overrides(base, depth))
+    # The run header pins the config and operator set of every shard in the queue
+    run_manifest = RunManifest(os.path.join(queue_dir, "run.jsonl"))
+    seed = run_manifest.start(RunHeader.for_spec(run_spec, seed, shard_size, (base, depth))).seed
+    shard_dir = os.path.join(os.path.abspath(queue_dir), "shards")
+    queue.initialize(
+        {"spec": run_spec.to_json(), "seed": seed, "stream_key": [base, depth], "shard_dir": shard_dir},
+        lease_seconds,
     )
 
-    with open(file_path, "a", encoding="utf-8") as f:
-        with Manager() as manager:
-            result_queue = manager.Queue()
-            
-            start_time = time.time()
-            with Pool(processes=max_workers, initializer=init_worker, initargs=(global_dict,)) as pool:
-                # Corrected starmap call with proper arguments
-                pool.starmap(worker_generate_expression, [(result_queue,) for _ in range(remaining)])
-
-            batch_size = 1000
-            batch = []
-            idx = existing_lines + 1
-
-            while not result_queue.empty():
-                properties, time_taken = result_queue.get()
-                try:
-                    properties['id'] = idx
-                    batch.append(orjson.dumps(properties))
-                    
-                    if len(batch) >= batch_size or idx == num:
-                        batch_write_to_file(batch, f)
-                        batch.clear()
-                        print(f"Batch write completed up to expression {idx}")
-                        print(f"Batch Generate expressions cost {time_taken:.2f}s")
-                    
-                    idx += 1
-                except Exception as e:
-                    print(f"Error generating expression {idx}: {e}")
+    manifest = ShardManifest(shard_dir)
+    collect_queue_results(queue, manifest)
+    in_progress = [ShardTask(**payload) for payload in queue.outstanding()]
+    submitted = 0
+    for task in manifest.pending_tasks(num, shard_size, in_progress):
+        if queue.submit(queue_task_name(task), asdict(task)):
+            submitted += 1
+    print(f"Enqueued {submitted} shards in {queue_dir}: {queue.status()}")
 
-            end_time = time.time()
-            print(f"Generated {num} expressions in {end_time - start_time:.2f}s")
+def queue_worker(queue_dir: str, poll_seconds: float = 5.0):
+    """
+    Worker of a multi-node run: claims shard tasks from the queue until none is pending or leased.
+
+    Every worker appends to its own `part-<host>-<pid>.jsonl` file in the queue's shard
+    directory and records the shard's manifest entry as the task result. A lease is renewed
+    while its shard is generated; leases of crashed workers expire and are claimed again.
+    """
+    queue = WorkQueue(queue_dir)
+    job = queue.job
+    spec = WorkerSpec.from_json(job["spec"])
+    seed, stream_key = job["seed"], tuple(job["stream_key"])
+    exp_generator = load_expression_generator(spec)
+    owner = default_owner()
+    writer = ShardFileWriter(job["shard_dir"], f"part-{owner}.jsonl")
+    completed = 0
+    while True:
+        queue.requeue_expired()
+        lease = queue.claim(owner)
+        if lease is None:
+            if queue.is_finished():
+                break
+            # Other workers still hold leases, which may expire and come back
+            time.sleep(poll_seconds)
+            continue
+        task = ShardTask(**lease.payload)
+        start_time = time.time()
+        with queue.keep_alive(lease):
+            blob = generate_shard(exp_generator, task, seed, stream_key)
+            entry = writer.write(task, blob, seed, stream_key)
+        queue.complete(lease, asdict(entry))
+        completed += 1
+        print(f"{owner}: shard {task.shard_id} done ({task.start_idx}-{task.stop_idx}) in {time.time() - start_time:.2f}s")
+    return completed
 
+def run_queue_workers(queue_dir: str, max_workers: int, start_method: str = None, poll_seconds: float = 5.0):
+    # Local worker processes of one node; start the same command on every node sharing queue_dir
+    context = get_pool_context(start_method)
+    processes = [context.Process(target=queue_worker, args=(queue_dir, poll_seconds)) for _ in range(max_workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+def collect_queue(queue_dir: str, output_dir: str = None):
+    """
+    Adds the finished shards of a queue to its shard manifest and, once every task is done,
+    optionally merges them into `base<base>_depth<depth>.jsonl` in `output_dir`.
+    """
+    queue = WorkQueue(queue_dir)
+    manifest = ShardManifest(queue.job["shard_dir"])
+    added = collect_queue_results(queue, manifest)
+    print(f"Collected {added} new shards, {manifest.record_count} expressions committed: {queue.status()}")
+    if output_dir is not None:
+        if not queue.is_finished():
+            print(f"{queue_dir} still has pending or leased shards, not merging.")
+            return
+        base, depth = queue.job["stream_key"]
+        os.makedirs(output_dir, exist_ok=True)
+        file_path = os.path.join(output_dir, f"base{base}_depth{depth}.jsonl")
+        merged = manifest.merge(file_path)
+        print(f"Merged {merged} expressions into {file_path}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate expressions using multiprocessing.")
@@ -167,10 +470,73 @@ if __name__ == "__main__":
     parser.add_argument(
         "--depth", type=int, default=2, help="Depth of expressions to generate"
     )
+    parser.add_argument(
+        "--seed", type=int, default=None, help="Global random seed of the run, a random one is drawn and printed if omitted"
+    )
+    parser.add_argument(
+        "--shard-size", type=int, default=1000, help="Number of expressions generated from one random stream"
+    )
+    parser.add_argument(
+        "--start-method", type=str, default=None, choices=["fork", "spawn", "forkserver"],
+        help="Start method of the worker processes; forkserver loads the operator set once and forks warm workers"
+    )
+    parser.add_argument(
+        "--output-mode", type=str, default="single", choices=["single", "shards", "parquet"],
+        help="single: the parent appends to one JSONL file; shards: every worker writes its own part file, tracked by a manifest; parquet: one Parquet file per shard (needs pyarrow)"
+    )
+    parser.add_argument(
+        "--compression", type=str, default="none", choices=["none", "zstd"],
+        help="In single output mode, write zstd-compressed JSONL (<output>.jsonl.zst) in independent frames with a sidecar index (needs zstandard)"
+    )
+    parser.add_argument(
+        "--frame-records", type=int, default=1000, help="With --compression zstd, number of records per zstd frame"
+    )
+    parser.add_argument(
+        "--zstd-level", type=int, default=3, help="With --compression zstd, the zstd compression level"
+    )
+    parser.add_argument(
+        "--row-group-size", type=int, default=10000, help="In parquet mode, maximum number of rows per Parquet row group"
+    )
+    parser.add_argument(
+        "--merge", action="store_true", help="In shards mode, concatenate the committed shards into one JSONL file afterwards"
+    )
+    parser.add_argument(
+        "--max-in-flight", type=int, default=None, help="Maximum number of shards queued, running or waiting to be written, 2x workers by default"
+    )
+    parser.add_argument(
+        "--fsync", type=str, default="batch", choices=["batch", "close", "never"],
+        help="When the output is fsynced: after every shard (before it is committed to the run manifest), when the file is closed, or never"
+    )
+    parser.add_argument(
+        "--target-task-seconds", type=float, default=2.0,
+        help="In sweeps, batch shards into tasks of about this many seconds based on measured costs"
+    )
+    parser.add_argument(
+        "--queue-dir", type=str, default=None,
+        help="Run through a work queue in this directory on a filesystem shared by several nodes, see --role"
+    )
+    parser.add_argument(
+        "--role", type=str, default="enqueue", choices=["enqueue", "work", "collect"],
+        help="With --queue-dir: enqueue the shards of --base/--depth, work on queued shards with --workers local processes, or collect finished shards (and --merge them)"
+    )
+    parser.add_argument(
+        "--lease-seconds", type=float, default=600.0, help="With --queue-dir, time after which a claimed shard of a silent worker is handed out again"
+    )
+    parser.add_argument(
+        "--bases", type=int, nargs="+", default=None, help="Sweep these bases (with --depths) in one long-lived pool instead of a single --base"
+    )
+    parser.add_argument(
+        "--depths", type=int, nargs="+", default=None, help="Sweep these depths (with --bases) in one long-lived pool instead of a single --depth"
+    )
     
     args = parser.parse_args()
+    if args.seed is None:
+        # 63 bits, so the seed fits the JSON integers of the run manifest, job and shard files
+        args.seed = secrets.randbits(63)
 
-    global_dict = initialize(args.config, args.operators_path, args.cython_cache_dir)
+    worker_spec = WorkerSpec(args.config, args.operators_path, args.cython_cache_dir)
+    # Must happen before the first pool starts the forkserver
+    export_for_preload(worker_spec)
 
     print("==================================================")
     print("Starting expression generation process...")
@@ -179,17 +545,64 @@ if __name__ == "__main__":
     print(f"Output Path: {args.generated_expression_path}")
     print(f"Number of Expressions: {args.num}")
     print(f"Number of Workers: {args.workers}")
-    print(f"Base: {args.base}")
-    print(f"Depth: {args.depth}")
+    print(f"Base: {args.bases or args.base}")
+    print(f"Depth: {args.depths or args.depth}")
+    print(f"Seed: {args.seed}")
+    print(f"Shard Size: {args.shard_size}")
+    print(f"Start Method: {args.start_method}")
+    print(f"Output Mode: {args.output_mode}")
     print("==================================================")
 
-    generate_expressions_multiprocess_base_depth(
-        file_path=os.path.join(args.generated_expression_path,f"base{args.base}_depth{args.depth}.jsonl"),
-        cython_cache_dir = args.cython_cache_dir,
-        global_dict = global_dict,
-        num=args.num,
-        max_workers=args.workers,
-        base=args.base,
-        depth=args.depth,
-    )
-    print(f"Expression generation for base {args.base}, depth {args.depth} completed.")
+    if args.queue_dir is not None:
+        if args.role == "enqueue":
+            enqueue_base_depth(
+                queue_dir=args.queue_dir,
+                worker_spec=worker_spec,
+                num=args.num,
+                base=args.base,
+                depth=args.depth,
+                seed=args.seed,
+                shard_size=args.shard_size,
+                lease_seconds=args.lease_seconds,
+            )
+        elif args.role == "work":
+            run_queue_workers(args.queue_dir, args.workers, start_method=args.start_method)
+        else:
+            collect_queue(args.queue_dir, output_dir=args.generated_expression_path if args.merge else None)
+        print(f"Queue role {args.role} for {args.queue_dir} completed.")
+    elif args.bases is not None or args.depths is not None:
+        grid = [(base, depth, args.num) for base, depth in product(args.bases or [args.base], args.depths or [args.depth])]
+        generate_expressions_sweep(
+            output_dir=args.generated_expression_path,
+            worker_spec=worker_spec,
+            grid=grid,
+            max_workers=args.workers,
+            seed=args.seed,
+            shard_size=args.shard_size,
+            max_in_flight=args.max_in_flight,
+            start_method=args.start_method,
+            target_task_seconds=args.target_task_seconds,
+            fsync=args.fsync,
+        )
+        print(f"Expression generation for {len(grid)} base/depth combinations completed.")
+    else:
+        generate_expressions_multiprocess_base_depth(
+            file_path=os.path.join(args.generated_expression_path,f"base{args.base}_depth{args.depth}.jsonl"),
+            worker_spec=worker_spec,
+            num=args.num,
+            max_workers=args.workers,
+            base=args.base,
+            depth=args.depth,
+            seed=args.seed,
+            shard_size=args.shard_size,
+            max_in_flight=args.max_in_flight,
+            start_method=args.start_method,
+            output_mode=args.output_mode,
+            merge=args.merge,
+            fsync=args.fsync,
+            row_group_size=args.row_group_size,
+            compression=args.compression,
+            frame_records=args.frame_records,
+            zstd_level=args.zstd_level,
+        )
+        print(f"Expression generation for base {args.base}, depth {args.depth} completed.")
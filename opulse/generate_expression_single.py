@@ -1,4 +1,5 @@
-from multiprocessing import Pool, Manager, Queue
+from typing import Dict
+from functools import partial
 import time
 import orjson
 import os
@@ -6,6 +7,8 @@ import argparse
 from operatorplus import *
 from expression import ExpressionGenerator
 from config import LogConfig, ParamConfig
+from pipeline import ShardTask, plan_shards, imap_bounded, encode_jsonl, ShardManifest, write_shard, WorkerSpec, export_for_preload, get_pool_context, load_operator_manager, stable_key, RunHeader, RunManifest, imap_adaptive, UtilizationMeter, AsyncWriter, ParquetShardDataset, require_pyarrow, special_values_from_config, parquet_shard_size, FrameIndex, compress_frames, commit_compressed_shard, require_zstandard
+import secrets
 
 
 global logger
@@ -23,17 +26,37 @@ def extract_func_ids(operators_path):
 
     return func_ids
 
-def initialize(config_path: str, operators_path: str, cython_cache_dir: str):
-    config = ParamConfig(config_path)
+def estimate_operator_costs(operators_path):
+    """
+    Estimates the relative cost of generating one expression per non-base operator.
+
+    Higher-order operators call lower-order ones and recursive definitions unroll at evaluation
+    time, so the estimate grows with the order, the number of dependencies and recursion.
+    """
+    costs = {}
+    with open(operators_path, "rb") as f:
+        for line in f:
+            try:
+                data = orjson.loads(line.strip())
+            except orjson.JSONDecodeError:
+                continue
+            if "func_id" in data and data["is_base"] is None:
+                cost = max(data.get("n_order") or 1, 1) * (1 + len(data.get("dependencies") or []))
+                if data.get("definition_type") == "recursive_definition":
+                    cost *= 2
+                costs[data["func_id"]] = cost
+    return costs
+
+def initialize(spec: WorkerSpec):
+    config = spec.load_config()
     log = LogConfig(config.get_logging_config())
     global logger
     logger = log.get_logger()
 
-    compiler = CythonCompiler(cython_cache_dir)
-    op_manager = OperatorManager(operators_path, config, log, cython_cache_dir, compiler, True)
+    op_manager = load_operator_manager(spec, config, log)
     
     expression_generator = ExpressionGenerator(
-        config, log, cython_cache_dir, operator_manager=op_manager
+        config, log, spec.cython_cache_dir, operator_manager=op_manager
     )
     
     return {
@@ -44,90 +67,256 @@ def initialize(config_path: str, operators_path: str, cython_cache_dir: str):
         "exp_generator": expression_generator
     }
 
-def init_worker(global_dict):
+def init_worker(spec: WorkerSpec):
+    # Workers rebuild their state from the small spec instead of unpickling managers and generators
     global exp_generator_global
-    exp_generator_global = global_dict["exp_generator"]  
+    exp_generator_global = initialize(spec)["exp_generator"]
 
 
-def worker_generate_expression(func_id, result_queue):
+def worker_generate_shard(task: ShardTask, func_id: str, seed: int, stream_key: tuple, shard_dir: str = None, parquet_dir: str = None, row_group_size: int = 10000, frame_records: int = None, zstd_level: int = 3):
+    # Every shard draws from its own stream, so its records do not depend on the worker running it
+    exp_generator_global.seed_shard(seed, *stream_key, task.shard_id)
+    records = []
     start_time = time.time()
-    properties = exp_generator_global.create_single_operator_expression(func_id=func_id)
-    end_time = time.time()
-    result_queue.put((properties, end_time - start_time))  
-
-def read_existing_lines(file_path):
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return sum(1 for line in f)
-    except FileNotFoundError:
-        return 0
+    for idx in range(task.first_idx, task.stop_idx + 1):
+        properties = exp_generator_global.create_single_operator_expression(func_id=func_id)
+        if idx >= task.start_idx:
+            properties['id'] = idx
+            records.append(properties)
+    if parquet_dir is not None:
+        # Parquet output mode: the worker writes the shard's own Parquet file and returns its path
+        return task, ParquetShardDataset(parquet_dir).write(
+            task, records, row_group_size, special_values=special_values_from_config(exp_generator_global.param_config)
+        ), time.time() - start_time
+    # Serialized here, so the whole shard travels back to the parent as one bytes object
+    blob = encode_jsonl(records)
+    if frame_records is not None:
+        # Compressed here as well, so the zstd work is spread over the workers
+        return task, compress_frames(blob, frame_records, zstd_level), time.time() - start_time
+    if shard_dir is not None:
+        # Shard output mode: the worker writes its own part file and only returns the manifest entry
+        return task, write_shard(shard_dir, task, blob, seed, stream_key), time.time() - start_time
+    return task, blob, time.time() - start_time
 
-def batch_write_to_file(batch, f):
-    for item in batch:
-        f.write(item.decode('utf-8') + '\n')
+def worker_generate_operator_shard(item: tuple):
+    func_id, base, seed, task = item
+    task, blob, time_taken = worker_generate_shard(task, func_id, seed, (base, stable_key(func_id)))
+    return item, blob, time_taken
 
 def generate_expressions_multiprocess_op_base(
     file_path: str,
-    cython_cache_dir: str,
-    global_dict: dict,
+    worker_spec: WorkerSpec,
     num: int,
     max_workers: int,
     base: int,
-    func_id: str
+    func_id: str,
+    seed: int,
+    shard_size: int = 1000,
+    max_in_flight: int = None,
+    start_method: str = None,
+    output_mode: str = "single",
+    merge: bool = False,
+    fsync: str = "batch",
+    row_group_size: int = 10000,
+    compression: str = "none",
+    frame_records: int = 1000,
+    zstd_level: int = 3,
 ):
     directory = os.path.dirname(file_path)
     
     if directory and not os.path.exists(directory):
         os.makedirs(directory)
         
-    existing_lines = read_existing_lines(file_path)
-    if existing_lines >= num:
+    overrides = {
+        "random_base.base": base,
+        "result_base.base": base,
+        "longer_result_compute.base": base,
+    }
+
+    if max_in_flight is None:
+        max_in_flight = 2 * max_workers
+
+    run_spec = worker_spec.with_overrides(overrides)
+    stream_key = (base, stable_key(func_id))
+
+    if output_mode == "parquet":
+        require_pyarrow()
+        # One Parquet file per shard, renamed into place when complete; listing the directory says what is done
+        dataset = ParquetShardDataset(f"{os.path.splitext(file_path)[0]}.parquet")
+        if parquet_shard_size(shard_size, row_group_size) != shard_size:
+            print(f"Parquet shards hold at least one row group, using a shard size of {row_group_size} instead of {shard_size}.")
+            shard_size = parquet_shard_size(shard_size, row_group_size)
+        run_manifest = RunManifest(dataset.run_manifest_path)
+        seed = run_manifest.start(RunHeader.for_spec(run_spec, seed, shard_size, stream_key)).seed
+        tasks = dataset.pending_tasks(num, shard_size)
+        if not tasks:
+            print(f"{dataset.directory} has generated enough expressions, skipping.")
+            return
+        print(f"Need to generate {sum(task.count for task in tasks)} more expressions...")
+        start_time = time.time()
+        context = get_pool_context(start_method)
+        with context.Pool(processes=max_workers, initializer=init_worker, initargs=(run_spec,)) as pool:
+            worker = partial(worker_generate_shard, func_id=func_id, seed=seed, stream_key=stream_key, parquet_dir=dataset.directory, row_group_size=row_group_size)
+            for task, path, time_taken in imap_bounded(pool, worker, tasks, max_in_flight, ordered=False):
+                print(f"Shard {task.shard_id} written to {path} ({task.start_idx}-{task.stop_idx}) in {time_taken:.2f}s")
+        end_time = time.time()
+        print(f"Generated {num} expressions in {end_time - start_time:.2f}s")
+        return
+
+    if output_mode == "shards":
+        # Every worker appends to its own part file; the manifest, not the output, says what is done
+        shard_dir = f"{os.path.splitext(file_path)[0]}.shards"
+        manifest = ShardManifest(shard_dir)
+        # The run header pins the config and operator set the committed shards were generated with,
+        # and is the only record of the seed they were drawn from
+        run_manifest = RunManifest(os.path.join(shard_dir, "run.jsonl"))
+        seed = run_manifest.start(RunHeader.for_spec(run_spec, seed, shard_size, stream_key)).seed
+        tasks = manifest.pending_tasks(num, shard_size)
+        if not tasks:
+            print(f"{shard_dir} has generated enough expressions, skipping.")
+        else:
+            print(f"Need to generate {sum(task.count for task in tasks)} more expressions...")
+            start_time = time.time()
+            context = get_pool_context(start_method)
+            with context.Pool(processes=max_workers, initializer=init_worker, initargs=(run_spec,)) as pool:
+                worker = partial(worker_generate_shard, func_id=func_id, seed=seed, stream_key=stream_key, shard_dir=shard_dir)
+                for task, entry, time_taken in imap_bounded(pool, worker, tasks, max_in_flight, ordered=False):
+                    manifest.add(entry)
+                    print(f"Shard {task.shard_id} committed ({task.start_idx}-{task.stop_idx}) in {time_taken:.2f}s")
+            end_time = time.time()
+            print(f"Generated {num} expressions in {end_time - start_time:.2f}s")
+        if merge:
+            merged = manifest.merge(file_path)
+            print(f"Merged {merged} expressions into {file_path}")
+        return
+
+    frame_index = None
+    if compression == "zstd":
+        require_zstandard()
+        # Independent zstd frames of frame_records records, with a sidecar index of their first ids and offsets
+        file_path = f"{file_path}.zst"
+        frame_index = FrameIndex(f"{file_path}.idx")
+
+    # The manifest, not the output, says which records are done; see RunManifest
+    run_manifest = RunManifest(f"{file_path}.manifest.jsonl")
+    seed = run_manifest.start(RunHeader.for_spec(run_spec, seed, shard_size, stream_key)).seed
+    if frame_index is None:
+        run_manifest.adopt_output(file_path)
+    dropped = run_manifest.rollback_output(file_path)
+    if dropped:
+        print(f"Dropped {dropped} uncommitted bytes from {file_path}.")
+    if frame_index is not None:
+        frame_index.truncate(run_manifest.end_offset)
+    tasks = run_manifest.pending_tasks(num)
+    if not tasks:
         print(f"{file_path} has generated enough expressions, skipping.")
         return
     
-    remaining = num - existing_lines
-    print(f"Need to generate {remaining} more expressions...")
+    print(f"Need to generate {sum(task.count for task in tasks)} more expressions...")
 
-    global_dict['config'].config["random_base"]["base"] = base
-    global_dict['config'].config["result_base"]["base"] = base
-    global_dict['config'].config["longer_result_compute"]["base"] = base
-    
-    global_dict['exp_generator'] = ExpressionGenerator(
-        global_dict['config'], global_dict['log'], cython_cache_dir, operator_manager=global_dict['op_manager']
-    )
-    
-    global_dict['func_id'] = func_id
+    start_time = time.time()
+    context = get_pool_context(start_method)
+    # The writer thread writes, fsyncs and commits shards while the next results are collected
+    with AsyncWriter(max_pending=2, fsync=fsync) as writer, context.Pool(processes=max_workers, initializer=init_worker, initargs=(run_spec,)) as pool:
+        worker = partial(
+            worker_generate_shard, func_id=func_id, seed=seed, stream_key=stream_key,
+            frame_records=frame_records if frame_index is not None else None, zstd_level=zstd_level,
+        )
+        # Shards are written as they arrive, in id order; at most max_in_flight shards are held in memory
+        for task, blob, time_taken in imap_bounded(pool, worker, tasks, max_in_flight):
+            # Committed only once the shard is written (and durable under fsync="batch"); a crash before
+            # the commit rolls it back on restart
+            if frame_index is None:
+                on_written = partial(run_manifest.commit, task, blob.count(b"\n"))
+            else:
+                # Compressed shards arrive with their frame entries, which are indexed before the commit
+                blob, frames = blob
+                on_written = partial(commit_compressed_shard, frame_index, run_manifest, task, len(blob), frames)
+            writer.submit(file_path, [blob], on_written=on_written)
+            print(f"Batch write queued up to expression {task.stop_idx}")
+            print(f"Batch Generate expressions cost {time_taken:.2f}s")
 
-    with open(file_path, "a", encoding="utf-8") as f:
-        with Manager() as manager:
-            result_queue = manager.Queue()
-            
-            start_time = time.time()
-            with Pool(processes=max_workers, initializer=init_worker, initargs=(global_dict,)) as pool:
-                pool.starmap(worker_generate_expression, [(func_id, result_queue) for _ in range(remaining)])
-
-            batch_size = 1000
-            batch = []
-            idx = existing_lines + 1
-
-            while not result_queue.empty():
-                properties, time_taken = result_queue.get()
-                try:
-                    properties['id'] = idx
-                    batch.append(orjson.dumps(properties))
-                    
-                    if len(batch) >= batch_size or idx == num:
-                        batch_write_to_file(batch, f)
-                        batch.clear()
-                        print(f"Batch write completed up to expression {idx}")
-                        print(f"Batch Generate expressions cost {time_taken:.2f}s")
-                    
-                    idx += 1
-                except Exception as e:
-                    print(f"Error generating expression {idx}: {e}")
+    end_time = time.time()
+    print(f"Generated {num} expressions in {end_time - start_time:.2f}s")
 
-            end_time = time.time()
-            print(f"Generated {num} expressions in {end_time - start_time:.2f}s")
+def generate_expressions_all_operators(
+    output_dir: str,
+    worker_spec: WorkerSpec,
+    operator_costs: Dict[str, float],
+    num: int,
+    max_workers: int,
+    base: int,
+    seed: int,
+    shard_size: int = 1000,
+    max_in_flight: int = None,
+    start_method: str = None,
+    target_task_seconds: float = 2.0,
+    fsync: str = "batch",
+):
+    """
+    Generates `num` expressions for every operator with one pool for all of them.
+
+    The shards of all operators are scheduled most expensive first (estimated cost times shard
+    size), so long operators start early instead of straggling at the end, and every result is
+    routed to its operator's `<func_id>_base<base>.jsonl` file. Files, random streams and run
+    manifests are the same as for `generate_expressions_multiprocess_op_base`, so outputs match
+    per-operator runs and either entry point can resume them. Shards are batched into tasks of
+    about `target_task_seconds` from each operator's measured cost, and slow operators get a
+    task per shard, see `imap_adaptive`.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if max_in_flight is None:
+        max_in_flight = 2 * max_workers
+
+    run_spec = worker_spec.with_overrides({
+        "random_base.base": base,
+        "result_base.base": base,
+        "longer_result_compute.base": base,
+    })
+
+    outputs = {}
+    items = []
+    # The config and operators hashes are the same for every operator, so they are computed once
+    run_header = RunHeader.for_spec(run_spec, seed, shard_size, (base,))
+    for func_id, cost in operator_costs.items():
+        file_path = os.path.join(output_dir, f"{func_id}_base{base}.jsonl")
+        run_manifest = RunManifest(f"{file_path}.manifest.jsonl")
+        op_seed = run_manifest.start(run_header.with_stream_key((base, stable_key(func_id)))).seed
+        run_manifest.adopt_output(file_path)
+        dropped = run_manifest.rollback_output(file_path)
+        if dropped:
+            print(f"Dropped {dropped} uncommitted bytes from {file_path}.")
+        tasks = run_manifest.pending_tasks(num)
+        if not tasks:
+            continue
+        outputs[func_id] = (file_path, run_manifest)
+        items.extend(((-cost, task.shard_id), (func_id, base, op_seed, task)) for task in tasks)
+
+    if not items:
+        print(f"All {len(operator_costs)} operators have generated enough expressions, skipping.")
+        return
+    # Costly operators first; within an operator by shard id, so every file is appended in id order.
+    # Sorting by cost * count would put a partly finished shard after the later ones.
+    items.sort(key=lambda item: item[0])
+    items = [item for _, item in items]
+    print(f"Need to generate {sum(task.count for *_, task in items)} more expressions for {len(outputs)} operators...")
+
+    start_time = time.time()
+    context = get_pool_context(start_method)
+    meter = UtilizationMeter(max_workers)
+    with AsyncWriter(max_pending=2, fsync=fsync) as writer, context.Pool(processes=max_workers, initializer=init_worker, initargs=(run_spec,)) as pool:
+        results = imap_adaptive(
+            pool, worker_generate_operator_shard, items, cost=lambda item: item[3].count, group=lambda item: item[0],
+            max_in_flight=max_in_flight, target_seconds=target_task_seconds, meter=meter,
+        )
+        for (func_id, _, _, task), blob, time_taken in results:
+            file_path, run_manifest = outputs[func_id]
+            writer.submit(file_path, [blob], on_written=partial(run_manifest.commit, task, blob.count(b"\n")))
+            print(f"{func_id}: batch write queued up to expression {task.stop_idx} in {time_taken:.2f}s")
+
+    end_time = time.time()
+    print(f"Generated expressions for {len(outputs)} operators in {end_time - start_time:.2f}s")
+    print(f"Worker utilization: {meter.report()}")
 
 
 if __name__ == "__main__":
@@ -166,11 +355,61 @@ if __name__ == "__main__":
     parser.add_argument(
         "--base", type=int, default=10, help="Numerical base for expression generation"
     )
+    parser.add_argument(
+        "--seed", type=int, default=None, help="Global random seed of the run, a random one is drawn and printed if omitted"
+    )
+    parser.add_argument(
+        "--shard-size", type=int, default=1000, help="Number of expressions generated from one random stream"
+    )
+    parser.add_argument(
+        "--start-method", type=str, default=None, choices=["fork", "spawn", "forkserver"],
+        help="Start method of the worker processes; forkserver loads the operator set once and forks warm workers"
+    )
+    parser.add_argument(
+        "--output-mode", type=str, default="single", choices=["single", "shards", "parquet"],
+        help="single: the parent appends to one JSONL file; shards: every worker writes its own part file, tracked by a manifest; parquet: one Parquet file per shard (needs pyarrow)"
+    )
+    parser.add_argument(
+        "--compression", type=str, default="none", choices=["none", "zstd"],
+        help="In single output mode, write zstd-compressed JSONL (<output>.jsonl.zst) in independent frames with a sidecar index (needs zstandard)"
+    )
+    parser.add_argument(
+        "--frame-records", type=int, default=1000, help="With --compression zstd, number of records per zstd frame"
+    )
+    parser.add_argument(
+        "--zstd-level", type=int, default=3, help="With --compression zstd, the zstd compression level"
+    )
+    parser.add_argument(
+        "--row-group-size", type=int, default=10000, help="In parquet mode, maximum number of rows per Parquet row group"
+    )
+    parser.add_argument(
+        "--merge", action="store_true", help="In shards mode, concatenate the committed shards into one JSONL file afterwards"
+    )
+    parser.add_argument(
+        "--max-in-flight", type=int, default=None, help="Maximum number of shards queued, running or waiting to be written, 2x workers by default"
+    )
+    parser.add_argument(
+        "--fsync", type=str, default="batch", choices=["batch", "close", "never"],
+        help="When the output is fsynced: after every shard (before it is committed to the run manifest), when the file is closed, or never"
+    )
+    parser.add_argument(
+        "--target-task-seconds", type=float, default=2.0,
+        help="With --func_id all, batch shards into tasks of about this many seconds based on measured costs"
+    )
+    parser.add_argument(
+        "--per-operator-pools", action="store_true",
+        help="With --func_id all, run every operator in its own pool instead of one shared pool; always the case with --output-mode shards or parquet"
+    )
 
     args = parser.parse_args()
+    if args.seed is None:
+        # 63 bits, so the seed fits the JSON integers of the run manifest, job and shard files
+        args.seed = secrets.randbits(63)
 
 
-    global_dict = initialize(args.config, args.operators_path, args.cython_cache_dir)
+    worker_spec = WorkerSpec(args.config, args.operators_path, args.cython_cache_dir)
+    # Must happen before the first pool starts the forkserver
+    export_for_preload(worker_spec)
 
     # 打印信息
     print("==================================================")
@@ -182,30 +421,70 @@ if __name__ == "__main__":
     print(f"Number of Workers: {args.workers}")
     print(f"Func_id: {args.func_id}")
     print(f"Base: {args.base}")
+    print(f"Seed: {args.seed}")
+    print(f"Shard Size: {args.shard_size}")
+    print(f"Start Method: {args.start_method}")
+    print(f"Output Mode: {args.output_mode}")
     print("==================================================")
 
-    func_ids=extract_func_ids(args.operators_path)
-    if args.func_id == "all":
+    if args.func_id == "all" and (args.per_operator_pools or args.output_mode != "single" or args.compression != "none"):
+        func_ids=extract_func_ids(args.operators_path)
         for func_id in func_ids:
             generate_expressions_multiprocess_op_base(
                 file_path=os.path.join(args.generated_expression_path, f"{func_id}_base{args.base}.jsonl"),
-                cython_cache_dir = args.cython_cache_dir,
-                global_dict = global_dict,
+                worker_spec=worker_spec,
                 num=args.num,
                 max_workers=args.workers,
                 base=args.base,
-                func_id=func_id
+                func_id=func_id,
+                seed=args.seed,
+                shard_size=args.shard_size,
+                max_in_flight=args.max_in_flight,
+                start_method=args.start_method,
+                output_mode=args.output_mode,
+                merge=args.merge,
+                fsync=args.fsync,
+                row_group_size=args.row_group_size,
+                compression=args.compression,
+                frame_records=args.frame_records,
+                zstd_level=args.zstd_level,
             )
 
+    elif args.func_id == "all":
+        generate_expressions_all_operators(
+            output_dir=args.generated_expression_path,
+            worker_spec=worker_spec,
+            operator_costs=estimate_operator_costs(args.operators_path),
+            num=args.num,
+            max_workers=args.workers,
+            base=args.base,
+            seed=args.seed,
+            shard_size=args.shard_size,
+            max_in_flight=args.max_in_flight,
+            start_method=args.start_method,
+            target_task_seconds=args.target_task_seconds,
+            fsync=args.fsync,
+        )
+
     else:
         generate_expressions_multiprocess_op_base(
             file_path=os.path.join(args.generated_expression_path, f"{args.func_id}_base{args.base}.jsonl"),
-            cython_cache_dir = args.cython_cache_dir,
-            global_dict = global_dict,
+            worker_spec=worker_spec,
             num=args.num,
             max_workers=args.workers,
             func_id=args.func_id,
-            base=args.base
+            base=args.base,
+            seed=args.seed,
+            shard_size=args.shard_size,
+            max_in_flight=args.max_in_flight,
+            start_method=args.start_method,
+            output_mode=args.output_mode,
+            merge=args.merge,
+            fsync=args.fsync,
+            row_group_size=args.row_group_size,
+            compression=args.compression,
+            frame_records=args.frame_records,
+            zstd_level=args.zstd_level,
         )
 
     print(f"Expression generation completed for func_id: {args.func_id} with base: {args.base}.")
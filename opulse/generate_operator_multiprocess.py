@@ -6,32 +6,49 @@ import argparse
 import logging
 import traceback
 from operatorplus import *
-from generate_operator_type import initialize_globals, generate_operator_type
+from generate_operator_type import initialize_globals, generate_operator_type, operator_fingerprints, operator_sync_message, import_synced_module
 
 from operatorplus.operator_manager import OperatorManager
 from expression import ExpressionGenerator
 from config import LogConfig, ParamConfig
+from pipeline import AsyncWriter, BroadcastLog, OrderedCommitter, Proposal
 import orjson
 import random
+import secrets
 # Global variables for worker processes
 globals_dict = None
+# Number of generate_operators_multiprocess calls so far, part of the workers' random stream keys
+generation_calls = 0
 
-def worker_generate_operator(operator_type, order):
+def worker_generate_operator(seed, call_key, task_index, attempt, operator_type, order):
     """
-    Worker function to generate a single expression.
-    Returns the generated properties and the time taken.
+    Worker function to generate a single operator.
+    Returns the operator proposed for the task, with its fingerprints, and the time taken.
     """
     start_time_expr = time.time()
+    # Forked workers inherit the parent's random state; a stream per (call, task, attempt) keeps their
+    # proposals apart. Task indices restart with every call, call_key tells the calls apart.
+    globals_dict["expr_generator"].seed_shard(seed, *call_key, task_index, attempt)
     # Generate expression
     operator = generate_operator_type(globals_dict, operator_type, order)
+    fingerprints = operator_fingerprints(operator)
+    # Modules cannot be pickled; the parent re-imports it from the Cython cache, see import_synced_module
+    operator.module = None
+    proposal = Proposal(task_index, attempt, operator, fingerprints)
     end_time_expr = time.time()
     time_taken = end_time_expr - start_time_expr
-    return operator, time_taken
+    return proposal, time_taken
+
+def init_operator_sync(sync_path: str):
+    """
+    Worker initializer: subscribes the worker to the operators the parent accepts, see
+    `generate_operator_type.sync_accepted_operators`.
+    """
+    globals_dict["operator_sync"] = BroadcastLog(sync_path)
 
 def batch_write_to_file(batch, f):
-    """write a batchc of items to a file"""
-    for item in batch:
-        f.write(item.decode('utf-8') + '\n')
+    """write a batch of orjson-serialized items to a file opened in binary mode, with one writelines call"""
+    f.writelines(item + b"\n" for item in batch)
 
 def generate_operators_multiprocess(
     config_path: str,
@@ -41,35 +58,90 @@ def generate_operators_multiprocess(
     tasks: List[Tuple[str, int]],  # 每个任务格式：(operator_type, order)
     max_workers: int,
     file_path: str,
+    max_attempts: int = 10,
 ):
     """
-    Generates expressions using multiple processes and writes them to a file.
+    Generates operators using multiple processes and writes them to a file.
+
+    Workers generate speculatively and propose each operator with its fingerprints; the parent
+    commits the proposals in task order, so ids and the accepted set do not depend on which worker
+    finished first. A proposal sharing a fingerprint with an earlier commit is rejected and its
+    task retried, up to `max_attempts` times.
     """
+    global generation_calls
     start_time = time.time()
 
     results = []
     batch_size = 1
     print(globals_dict["op_manager"].operators)
+    # Accepted operators are broadcast to the workers, which then reject duplicates of them locally
+    operator_sync = BroadcastLog(f"{file_path}.sync.jsonl")
+    operator_sync.reset()
+    # The operators already there claim their symbols and, through the manager's indexes, their body hashes and behaviours
+    op_manager = globals_dict["op_manager"]
+    committer = OrderedCommitter(
+        len(tasks),
+        claimed=[{"symbol": symbol} for symbol, operators in op_manager.symbol_to_operators.items() if operators]
+        + [{"body_hash": body_hash} for body_hash in op_manager.body_hash_index]
+        + [{"behavior": behavior} for behavior in op_manager.behavior_index or ()],
+    )
+    idx = 0
+    time_taken = 0.0
+    # Every (call, task, attempt) draws from its own stream of this seed, see worker_generate_operator
+    seed = globals_dict["config"].get("random_seed")
+    if seed is None:
+        seed = secrets.randbits(63)
+    generation_calls += 1
+    call_key = (initial_idx, generation_calls)
+    # Batches are written by a background thread, so collecting the next operator does not wait on IO
     with concurrent.futures.ProcessPoolExecutor(
-        max_workers=max_workers,
-    ) as executor, open(file_path, "a", encoding="utf-8") as f:  
-        futures = [executor.submit(worker_generate_operator, op_type, order) for (op_type, order) in tasks]
-        for idx, future in enumerate(concurrent.futures.as_completed(futures), 1):
-            try:
-                operator, time_taken = future.result()
-                operator.id = initial_idx + idx  
-                globals_dict["op_manager"].add_operator(operator) 
+        max_workers=max_workers, initializer=init_operator_sync, initargs=(operator_sync.path,),
+    ) as executor, AsyncWriter(fsync="never") as writer:
+        pending = {
+            executor.submit(worker_generate_operator, seed, call_key, task_index, 1, op_type, order): task_index
+            for task_index, (op_type, order) in enumerate(tasks)
+        }
+
+        def resolve(committed, rejected):
+            nonlocal idx
+            for proposal in committed:
+                operator = proposal.candidate
+                idx += 1
+                operator.id = initial_idx + idx
+                message = operator_sync_message(operator, cython_cache_dir)
+                import_synced_module(globals_dict, operator, message)
+                globals_dict["op_manager"].add_operator(operator)
+                operator_sync.publish([message])
                 results.append(orjson.dumps(operator.to_dict()))
-                if len(results) >= batch_size or idx == len(tasks):
-                    batch_write_to_file(results, f)
+            for proposal in rejected:
+                if proposal.attempt >= max_attempts:
+                    logging.warning(f"Giving up task {proposal.task_index} after {proposal.attempt} conflicting proposals")
+                    resolve(*committer.skip(proposal.task_index))
+                    continue
+                # Raced with an operator committed while it was generated; the retry sees it through the broadcast
+                logging.info(f"Operator {proposal.candidate.func_id} duplicates an accepted operator, retrying task {proposal.task_index}")
+                op_type, order = tasks[proposal.task_index]
+                future = executor.submit(worker_generate_operator, seed, call_key, proposal.task_index, proposal.attempt + 1, op_type, order)
+                pending[future] = proposal.task_index
+
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                task_index = pending.pop(future)
+                try:
+                    proposal, time_taken = future.result()
+                    resolve(*committer.propose(proposal))
+                except Exception as e:
+                    print(f"Error in task {task_index}:\n{traceback.format_exc()}")
+                    logging.error(f"Error generating operator for task {task_index}: {e}")
+                    resolve(*committer.skip(task_index))
+                if results and (len(results) >= batch_size or not pending):
+                    writer.submit(file_path, [item + b"\n" for item in results])
                     results.clear()
                     logging.info(f"Batch write completed up to operator {idx}")
                     print(f"Batch Generate expressions cost {time_taken:.2f}s")
-            except Exception as e:
-                print(f"Error in task {idx}:\n{traceback.format_exc()}")
-                logging.error(f"Error generating operator {idx}: {e}")    
     end_time = time.time()
-    logging.info(f"Generated {len(tasks)} operators. Total time: {end_time - start_time:.2f}s")
+    logging.info(f"Generated {idx} of {len(tasks)} operators. Total time: {end_time - start_time:.2f}s")
     
 def generate_randop(
     config_path: str,
@@ -161,21 +233,21 @@ def get_initial_idx(file_path):
         return 0
 
 
-def generate_total_process(config_path, initial_operators_path, cython_cache_dir, num, max_workers, file_path, raise_increase_at_order=3, increase_count=3, ratio=0.6):
+def generate_total_process(config_path, initial_operators_path, cython_cache_dir, num, max_workers, file_path, raise_increase_at_order=3, increase_count=3, ratio=0.6, deep_check=False):
     start_time = time.time()
     global globals_dict
     globals_dict = initialize_globals(
         config_path=config_path,
         initial_operators_path=initial_operators_path,
         cython_cache_dir=cython_cache_dir,
-        max_workers=max_workers
+        deep_check=deep_check
     )
     if is_file_empty(file_path):
         results = []
         for func_id, operator in globals_dict["op_manager"].operators.items():
             results.append(orjson.dumps(operator.to_dict()))
         
-        with open(file_path, "a", encoding="utf-8") as f: 
+        with open(file_path, "ab") as f:
             batch_write_to_file(results, f)
         
         globals_dict["logger"].debug("Initial operators saved by main process.")
@@ -222,7 +294,7 @@ def generate_total_process(config_path, initial_operators_path, cython_cache_dir
     logging.info(f"Generated all operators. Total time: {end_time - start_time:.2f}s")
 
 
-def generate_total_process_continue(config_path, initial_operators_path, cython_cache_dir, num, max_workers, file_path, raise_increase_at_order=3, increase_count=3, ratio=0.6):
+def generate_total_process_continue(config_path, initial_operators_path, cython_cache_dir, num, max_workers, file_path, raise_increase_at_order=3, increase_count=3, ratio=0.6, deep_check=False):
     start_time = time.time()
     global globals_dict
     
@@ -230,14 +302,14 @@ def generate_total_process_continue(config_path, initial_operators_path, cython_
         config_path=config_path,
         initial_operators_path=initial_operators_path,
         cython_cache_dir=cython_cache_dir,
-        max_workers=max_workers
+        deep_check=deep_check
     )
     if is_file_empty(file_path):
         results = []
         for func_id, operator in globals_dict["op_manager"].operators.items():
             results.append(orjson.dumps(operator.to_dict()))
         
-        with open(file_path, "a", encoding="utf-8") as f: 
+        with open(file_path, "ab") as f:
             batch_write_to_file(results, f)
         
         globals_dict["logger"].debug("Initial operators saved by main process.")
@@ -297,6 +369,7 @@ if __name__ == "__main__":
     parser.add_argument('--raise-increase-at-order', type=int, default=3, help='The order at which to start increasing the number of operators')
     parser.add_argument('--increase-count', type=int, default=3, help='The number of operators to add after the raise-order')
     parser.add_argument('--continue-mode', type=bool, default=False, help='Whether to continue the generation process or not')
+    parser.add_argument('--deep-check', action='store_true', help='Also property-test candidates with hypothesis (slower)')
 
     # Parse arguments
     args = parser.parse_args()
@@ -312,6 +385,7 @@ if __name__ == "__main__":
     print(f"Number of Operators to Generate: {args.num}")
     # print(f"Order of Operators to Generate: {args.n_order}")
     print(f"Maximum worker processes: {args.max_workers}")
+    print(f"Deep Check: {args.deep_check}")
 
     if args.continue_mode:
         generate_total_process_continue(
@@ -323,7 +397,8 @@ if __name__ == "__main__":
             file_path=args.generated_operators_path,
             raise_increase_at_order=args.raise_increase_at_order,
             increase_count=args.increase_count,
-            ratio=args.ratio
+            ratio=args.ratio,
+            deep_check=args.deep_check
         )
     else:
         generate_total_process(
@@ -335,5 +410,6 @@ if __name__ == "__main__":
             file_path=args.generated_operators_path,
             raise_increase_at_order=args.raise_increase_at_order,
             increase_count=args.increase_count,
-            ratio=args.ratio
+            ratio=args.ratio,
+            deep_check=args.deep_check
         )
@@ -2,36 +2,24 @@ from lark import Lark
 import argparse
 from operatorplus import *
 from expression.expression_generator import ExpressionGenerator
-from hypothesis import given, settings, HealthCheck
-import hypothesis.strategies as st
 import ast
 from config import LogConfig, ParamConfig
 from typing import Dict, Any
 import random
 from config.constants import thres
 import os
-import hashlib
+from pipeline import StagedValidator
+from operatorplus.behavior import operator_behavior, operator_probes
 
 global logger
-#Local global
-compute_func=None
-count_func=None
 
-def check_syntax(code: str) -> bool:
-    logger.debug(f"Checking syntax for code: {code}")
-    try:
-        ast.parse(code)
-        logger.info("Syntax is valid.")
-        return True  
-    except SyntaxError as e:
-        logger.error(f"Syntax error: {e}")
-        return False
-
-def is_binary_operator(function):
+def is_binary_operator(function, tree=None):
     """
     Determine if a function is a binary operator.
+    `tree` is the function parsed with `ast.parse`, if the caller already has it.
     """
-    tree = ast.parse(function)
+    if tree is None:
+        tree = ast.parse(function)
     for node in ast.walk(tree):
         if isinstance(node, ast.FunctionDef):
             arg_names = [arg.arg for arg in node.args.args]
@@ -45,11 +33,13 @@ def is_binary_operator(function):
     return False
 
 
-def is_unary_operator(function):
+def is_unary_operator(function, tree=None):
     """ 
     Determine if a function is a unary operator. 
+    `tree` is the function parsed with `ast.parse`, if the caller already has it.
     """
-    tree = ast.parse(function)
+    if tree is None:
+        tree = ast.parse(function)
     for node in ast.walk(tree):
         if isinstance(node, ast.FunctionDef):
             arg_names = [arg.arg for arg in node.args.args]
@@ -63,65 +53,71 @@ def is_unary_operator(function):
     
     return False
 
-def check_single_function_call_with_same_args(function_code: str) -> bool:
+def check_single_function_call_with_same_args(function_code: str, tree=None) -> bool:
     """
     Check if a function only calls a single other function, and if the parameter count of both
     functions is the same, return False. Otherwise, return True.
 
     Args:
         function_code (str): The source code of the function to check.
+        tree (optional): The code parsed with `ast.parse`, if the caller already has it.
 
     Returns:
         bool: Returns False if the function calls a single function with the same number of arguments.
               Returns True otherwise.
     """
-    try:
-        tree = ast.parse(function_code)
-    except SyntaxError:
-        raise ValueError("Invalid Python code.")
+    if tree is None:
+        try:
+            tree = ast.parse(function_code)
+        except SyntaxError:
+            raise ValueError("Invalid Python code.")
     
-    if len(function_code.strip().splitlines()) == 2:
-        # This dictionary will store function names and their argument counts
-        function_args = {}
-        called_functions = set()  # Track called functions and their argument counts
-        num_calls = 0  # Count total function calls in the function
-        fun_name = None
-        # First pass: Collect function argument counts
-        for node in ast.walk(tree):
-            if isinstance(node, ast.FunctionDef):
-                function_args[node.name] = len(node.args.args)  # Number of arguments for each function
-                fun_name = node.name
-        # Second pass: Analyze function calls
-        for node in ast.walk(tree):
-            if isinstance(node, ast.Call):
-                num_calls += 1
-                if isinstance(node.func, ast.Name):  # Ensure the called function is a named function
-                    called_function = node.func.id
-                    called_functions.add((called_function, len(node.args)))  # Add function name and arg count
-
-        # If there is exactly one function call
-        if num_calls == 1 and len(called_functions) == 1:
-            # Extract the called function's name and arg count
-            called_function, called_arg_count = next(iter(called_functions))
-            if function_args.get(fun_name) == called_arg_count:
-                return False
+    if len(function_code.strip().splitlines()) != 2:
+        # Only a one-line body can be a plain call
+        return True
+    # This dictionary will store function names and their argument counts
+    function_args = {}
+    called_functions = set()  # Track called functions and their argument counts
+    num_calls = 0  # Count total function calls in the function
+    fun_name = None
+    # First pass: Collect function argument counts
+    for node in ast.walk(tree):
+        if isinstance(node, ast.FunctionDef):
+            function_args[node.name] = len(node.args.args)  # Number of arguments for each function
+            fun_name = node.name
+    # Second pass: Analyze function calls
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            num_calls += 1
+            if isinstance(node.func, ast.Name):  # Ensure the called function is a named function
+                called_function = node.func.id
+                called_functions.add((called_function, len(node.args)))  # Add function name and arg count
+
+    # If there is exactly one function call
+    if num_calls == 1 and len(called_functions) == 1:
+        # Extract the called function's name and arg count
+        called_function, called_arg_count = next(iter(called_functions))
+        if function_args.get(fun_name) == called_arg_count:
+            return False
     return True
 
-def check_duplicate_returns_in_branches(function_code: str) -> bool:
+def check_duplicate_returns_in_branches(function_code: str, tree=None) -> bool:
     """
     Check if there are duplicate return statements in different branches (if/elif/else)
     of the same function.
     
     Args:
         function_code (str): The source code of the function to check.
+        tree (optional): The code parsed with `ast.parse`, if the caller already has it.
     
     Returns:
         bool: Returns False if any branch has duplicate return statements, True otherwise.
     """
-    try:
-        tree = ast.parse(function_code)
-    except SyntaxError:
-        raise ValueError("Invalid Python code.")
+    if tree is None:
+        try:
+            tree = ast.parse(function_code)
+        except SyntaxError:
+            raise ValueError("Invalid Python code.")
     
     # Check each function in the abstract syntax tree
     for node in ast.walk(tree):
@@ -142,156 +138,130 @@ def check_duplicate_returns_in_branches(function_code: str) -> bool:
                 return False
     return True
 
-def get_operator_compute_funcs(globals_dict):
+def operator_fingerprints(operator: OperatorInfo) -> Dict[str, Any]:
     """
-    Retrieve the computation functions of all operators in the current op_manager.
+    Returns the fingerprints two accepted operators must not share: the symbol, the canonical
+    hash of the compute function body and the behavioural fingerprint of the compiled functions.
+    None values are ignored when comparing.
     """
-    operator_compute_funcs = []
-    all_operators = globals_dict["op_manager"].operators
-    for operator_id, operator_info in all_operators.items():
-        operator_compute_funcs.append(operator_info.op_compute_func)
-    return operator_compute_funcs[:-1]
+    return {
+        "symbol": operator.symbol,
+        "body_hash": canonical_body_hash(operator.op_compute_func),
+        "behavior": operator_behavior(operator),
+    }
 
-def extract_function_body(func):
+def operator_sync_message(operator: OperatorInfo, cython_cache_dir: str) -> Dict[str, Any]:
     """
-    Extract the code content of the function body, removing the definition part (i.e., the `def` line).
+    Builds the broadcast message of an accepted operator: its metadata and the location of its
+    compiled module. Receivers index its body hash when adding it, see `OperatorManager.add_operator`.
     """
-    try:
-        tree = ast.parse(func)
-        body = tree.body[0].body  
-        func_body_code = ast.unparse(body)  
-        return func_body_code
-    except Exception as e:
-        return None  
+    module_name = f"module_{operator.func_id}"
+    return {
+        "operator": operator.to_dict(),
+        "module": module_name,
+        "module_path": os.path.join(os.path.abspath(cython_cache_dir), f"{module_name}.cpython-310-x86_64-linux-gnu.so"),
+    }
 
-def compare_function_bodies(func1, func2):
+def import_synced_module(globals_dict, operator: OperatorInfo, message: Dict[str, Any]) -> None:
     """
-    Compare whether the computation functions of two functions are the same by analyzing the AST to detect structural similarities.
+    Imports the compiled module of an operator received through `operator_sync_message`, if the
+    worker that generated it left it in the Cython cache. Modules cannot be pickled, so operators
+    travel between processes without theirs.
     """
-    body1 = extract_function_body(func1)
-    body2 = extract_function_body(func2)
+    if os.path.exists(message["module_path"]):
+        # Compiled by the worker that generated it; dependent operators import it by name
+        operator.module = globals_dict["compiler"].import_module_from_path(message["module"])
 
-    if body1 is None or body2 is None:
-        return False
+def sync_accepted_operators(globals_dict) -> int:
+    """
+    Applies the operators accepted by the parent since the last call, see `operator_sync_message`.
 
-    return body1 == body2
+    Only does something in workers started with a broadcast log under globals_dict["operator_sync"].
+    Received operators are added to the local op_manager, so symbol uniqueness, similarity and
+    body hash checks see them.
 
-def get_function_hash(func):
+    Returns the number of operators added.
     """
-    Compute the hash of the function body.
+    operator_sync = globals_dict.get("operator_sync")
+    if operator_sync is None:
+        return 0
+    added = 0
+    for message in operator_sync.poll():
+        operator = OperatorInfo(**message["operator"])
+        if operator.func_id in globals_dict["op_manager"].operators:
+            continue
+        import_synced_module(globals_dict, operator, message)
+        globals_dict["op_manager"].add_operator(operator)
+        added += 1
+    if added:
+        globals_dict["logger"].debug(f"Synced {added} operators accepted by other workers.")
+    return added
+
+def check_executable(operator: OperatorInfo):
     """
-    body = extract_function_body(func)
-    if body is None:
+    Runs a compiled operator's compute and count functions on the probe vector in one call,
+    see `behavior.run_probes`. Returns the run if both return numbers on every integer probe,
+    None otherwise; the run also carries the behavioural fingerprint.
+    """
+    run = operator_probes(operator)
+    if run is None:
+        logger.error(f"Operator {operator.func_id} cannot be probed.")
+        return None
+    if not run.executable:
+        logger.error(f"Operator {operator.func_id} is not executable: {'; '.join(run.failures[:3])}")
         return None
-    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+    logger.info(f"Operator {operator.func_id} is executable on {len(run.probes)} probes.")
+    return run
 
-def check_function_similarity(new_func, existing_funcs):
+def deep_check_executability(operator: OperatorInfo, max_examples: int = 5) -> bool:
     """
-    Check if the newly generated operator's computation function is equivalent to any existing operator's computation function.
+    Opt-in deep check: property tests of the compute and count functions with hypothesis over
+    the whole [-thres, thres] range. Slower than `check_executable`, which always runs first.
     """
-    new_func_hash = get_function_hash(new_func)
-    if new_func_hash is None:
-        return False
-
-    # Iterate through existing hashes, and if a matching hash is found, further compare the function bodies
-    for existing_func in existing_funcs:
-        existing_func_hash = get_function_hash(existing_func)
-        if existing_func_hash == new_func_hash:
-            # If hashes match, further compare the function bodies
-            if compare_function_bodies(new_func, existing_func):
-                return True
-    return False
-
-
-@given(st.integers(min_value=-thres, max_value=thres))
-@settings(max_examples=5)
-def test_unary_op_compute_func(a: int):
-    logger.debug(f"Running test_unary_op_compute_func with a: {a}")
-    try:
-        result = compute_func(a)
-        logger.debug(f"Result of compute_func: {result}")
-        assert isinstance(result, (int, float)), f"Expected result to be either an integer or a float, but got {type(result)}"
-        logger.info(f"test_unary_op_compute_func passed for a: {a}")
-    except Exception as e:
-        logger.error(f"Error in test_unary_op_compute_func with a: {a} - {e}")
-        raise
-
-@given(st.integers(min_value=-thres, max_value=thres))
-@settings(max_examples=5)
-def test_unary_op_count_func(a: int):
-    logger.debug(f"Running test_unary_op_count_func with a: {a}")
-    try:
-        result = count_func(a)
-        logger.debug(f"Result of count_func: {result}")
-        assert isinstance(result, (int, float)), f"Expected result to be either an integer or a float, but got {type(result)}"
-        logger.info(f"test_unary_op_count_func passed for a: {a}")
-    except Exception as e:
-        logger.error(f"Error in test_unary_op_count_func with a: {a} - {e}")
-        raise
-
-@given(st.integers(min_value=-thres, max_value=thres), st.integers(min_value=-thres, max_value=thres))
-@settings(max_examples=5)
-def test_binary_op_compute_func(a: int, b: int):
-    logger.debug(f"Running test_binary_op_compute_func with a: {a}, b: {b}")
-    try:
-        result = compute_func(a, b)
-        logger.debug(f"Running test_binary_op_compute_func with a: {a}, b: {b}, result: {result}")
-        logger.debug(f"Result of compute_func: {result}")
-        assert isinstance(result, (int, float)), f"Expected result to be either an integer or a float, but got {type(result)}"
-        logger.info(f"test_binary_op_compute_func passed for a: {a}, b: {b}")
-    except Exception as e:
-        logger.error(f"Error in test_binary_op_compute_func with a: {a}, b: {b} - {e}")
-        raise
-
-@given(st.integers(min_value=-thres, max_value=thres), st.integers(min_value=-thres, max_value=thres))
-@settings(max_examples=5)
-def test_binary_op_count_func(a: int, b: int):
-    logger.debug(f"Running test_binary_op_count_func with a: {a}, b: {b}")
-    try:
-        result = count_func(a, b)
-        logger.debug(f"Running test_binary_op_count_func with a: {a}, b: {b}, result: {result}")
-        logger.debug(f"Result of count_func: {result}")
+    # Imported here, so hypothesis is only needed when deep checks are enabled
+    from hypothesis import given, settings, HealthCheck
+    import hypothesis.strategies as st
+
+    funcs = [
+        getattr(operator.module, f"op_{operator.func_id}", None),
+        getattr(operator.module, f"op_count_{operator.func_id}", None),
+    ]
+    operand = st.integers(min_value=-thres, max_value=thres)
+
+    def returns_number(func, *args):
+        result = func(*args)
         assert isinstance(result, (int, float)), f"Expected result to be either an integer or a float, but got {type(result)}"
-        logger.info(f"test_binary_op_count_func passed for a: {a}, b: {b}")
-    except Exception as e:
-        logger.error(f"Error in test_binary_op_count_func with a: {a}, b: {b} - {e}")
-        raise
 
-def test_syntax_validity(op_compute_func: str, op_count_func: str) -> bool:
-    logger.debug(f"Testing syntax validity for op_compute_func: {op_compute_func} and op_count_func: {op_count_func}")
-    if check_syntax(op_compute_func) and check_syntax(op_count_func):
-        logger.info("Both operator functions have valid syntax.")
-        return True
-    else:
-        logger.error("One or both operator functions have syntax errors.")
-        return False
-
-def test_unary_op_executability():
-    logger.debug("Running test_unary_op_executability")
-    try:
-        test_unary_op_compute_func()  # Just run the test, if no exception occurs, it passes
-        test_unary_op_count_func()
-        logger.info("Unary operator functions are executable.")
-        return True
-    except Exception as e:
-        logger.error(f"Error in test_unary_op_executability: {e}")
-        return False
+    def property_test(func):
+        # The function is bound per test instead of through module globals, so checks are re-entrant
+        if operator.n_ary == 1:
+            @given(operand)
+            @settings(max_examples=max_examples, suppress_health_check=list(HealthCheck))
+            def test(a: int):
+                returns_number(func, a)
+        else:
+            @given(operand, operand)
+            @settings(max_examples=max_examples, suppress_health_check=list(HealthCheck))
+            def test(a: int, b: int):
+                returns_number(func, a, b)
+        return test
 
-def test_binary_op_executability():
-    logger.debug("Running test_binary_op_executability")
     try:
-        test_binary_op_compute_func() 
-        test_binary_op_count_func()
-        logger.info("Binary operator functions are executable.")
+        for func in funcs:
+            if func is None:
+                raise ValueError(f"Operator {operator.func_id} is missing a compiled function.")
+            property_test(func)()
+        logger.info(f"Operator {operator.func_id} passed the deep check.")
         return True
     except Exception as e:
-        logger.error(f"Error in test_binary_op_executability: {e}")
+        logger.error(f"Error in deep_check_executability: {e}")
         return False
 
-def initialize_globals(config_path: str, initial_operators_path: str, cython_cache_dir: str):
+def initialize_globals(config_path: str, initial_operators_path: str, cython_cache_dir: str, deep_check: bool = False):
     """
     Initializes global variables including configuration loading, 
     creation of the operator manager, and related generators.
+    With `deep_check`, candidates are also property-tested with hypothesis, see `deep_check_executability`.
     """
     # Load configuration
     # global config
@@ -303,6 +273,8 @@ def initialize_globals(config_path: str, initial_operators_path: str, cython_cac
     # Initialize Operator Manager
     compiler = CythonCompiler(cython_cache_dir)
     op_manager = OperatorManager(initial_operators_path, config, log, cython_cache_dir, compiler, True)
+    # Candidates are checked against the behaviour of every operator, not only its source
+    op_manager.enable_behavior_index()
     # Initialize Generators
     condition_generator = ConditionGenerator(config, log, op_manager)
     expr_generator = ExpressionGenerator(config, log, cython_cache_dir, op_manager)
@@ -334,9 +306,75 @@ def initialize_globals(config_path: str, initial_operators_path: str, cython_cac
         'parser': parser,
         'transformer': transformer,
         'op_priority_manager': op_priority_manager,
-        'compiler':compiler
+        'compiler':compiler,
+        'validator': StagedValidator(),
+        'deep_check': deep_check
     }
 
+def parse_operator_functions(operator: OperatorInfo):
+    """
+    Parses the compute and count functions of an operator.
+    Returns the two trees, or None if either has a syntax error.
+    """
+    try:
+        return ast.parse(operator.op_compute_func), ast.parse(operator.op_count_func)
+    except SyntaxError as e:
+        logger.error(f"Syntax error: {e}")
+        return None
+
+def has_order(globals_dict, operator: OperatorInfo, order: int) -> bool:
+    """
+    Calculates the order of an operator from its dependencies and checks that it is the one needed.
+    """
+    globals_dict["op_manager"].calculate_order(operator)
+    if operator.n_order != order:
+        globals_dict["logger"].debug("n_order is not equal to needed order.")
+        return False
+    return True
+
+def is_known_function(globals_dict, func: str, tree=None) -> bool:
+    """
+    Checks a compute function against the operators accepted by other workers and the existing operators.
+    One canonical body hash lookup, see `OperatorManager.find_same_body`.
+    """
+    # Pick up what other workers accepted meanwhile; synced operators land in the op_manager's index
+    sync_accepted_operators(globals_dict)
+    body_hash = canonical_body_hash(func, tree)
+    if body_hash is None:
+        return False
+    same_body = globals_dict["op_manager"].body_hash_index.get(body_hash)
+    if same_body:
+        globals_dict["logger"].debug(f"Found the same function in existing operators: {same_body}")
+        return True
+    return False
+
+def is_known_behavior(globals_dict, fingerprint: str) -> bool:
+    """
+    Checks a behavioural fingerprint against those of the existing operators, which catches
+    equivalent operators with different source, e.g. reordered branches.
+    """
+    same_behavior = globals_dict["op_manager"].find_same_behavior(fingerprint)
+    if same_behavior:
+        globals_dict["logger"].debug(f"Found an operator with the same behaviour: {same_behavior}")
+        return True
+    return False
+
+def compile_operator(globals_dict, operator: OperatorInfo) -> bool:
+    """
+    Compiles an operator's functions with Cython and imports the module.
+    Returns whether the compute or the count function is available.
+    """
+    deps = [f"module_{dep}" for dep in getattr(operator, 'dependencies', [])]
+    func_code_str = f"thres = {2**31 - 1}\n\n"
+    func_code_str += f"# Operator Func ID: {operator.func_id} - op_compute_func\n"
+    func_code_str += f"{operator.op_compute_func}\n\n"
+    func_code_str += f"# Operator Func ID: {operator.func_id} - op_count_func\n"
+    func_code_str += f"{operator.op_count_func}\n\n"
+    globals_dict["compiler"].compile_function(func_code_str, operator.func_id, deps = deps)
+
+    operator.module = globals_dict["compiler"].import_module_from_path(f"module_{operator.func_id}")
+    return operator.get_compute_function() is not None or operator.get_count_function() is not None
+
 def generate_operator_type(globals_dict, operator_type, order):
     """
     Generate a specified type of operators and handle their creation, parsing, 
@@ -355,6 +393,8 @@ def generate_operator_type(globals_dict, operator_type, order):
     """
     # generated_count = 0
     while True:
+        # Pick up operators accepted elsewhere before drawing a symbol and a definition
+        sync_accepted_operators(globals_dict)
         # Create a new operator based on the specified type
         operator_data = globals_dict["op_generator"].create_operator_info(choice=operator_type, order=order)
         new_operator = OperatorInfo(**operator_data)
@@ -380,76 +420,54 @@ def generate_operator_type(globals_dict, operator_type, order):
                     globals_dict["logger"].error(f"Error transforming the parsed definition: {e}")
                     continue
 
-        # Update global variables to ensure the correct compute and count functions are set
-        global compute_func, count_func
-        
-        globals_dict["op_manager"].extract_op_dependencies(new_operator)
-        
-        dependencies = getattr(new_operator, 'dependencies', [])
-        deps = [f"module_{dep}" for dep in dependencies]
-        func_code_str = f"thres = {2**31 - 1}\n\n"
-        func_code_str += f"# Operator Func ID: {new_operator.func_id} - op_compute_func\n"
-        func_code_str += f"{new_operator.op_compute_func}\n\n"
-        func_code_str += f"# Operator Func ID: {new_operator.func_id} - op_count_func\n"
-        func_code_str += f"{new_operator.op_count_func}\n\n"
-        globals_dict["compiler"].compile_function(func_code_str, new_operator.func_id, deps = deps) 
-
-        new_operator.module = globals_dict["compiler"].import_module_from_path(f"module_{new_operator.func_id}")
-
-        compute_func = new_operator.get_compute_function()
-        count_func = new_operator.get_count_function()
-
-        if compute_func is None and count_func is None:
-            globals_dict["logger"].debug("Compile func failed.")
-            continue  
-        
-        # First, check the syntax validity of the compute and count functions
-        if test_syntax_validity(new_operator.op_compute_func, new_operator.op_count_func) == False:
+        validator = globals_dict["validator"]
+        # Parse once; the static checks below share the trees and run before anything is compiled
+        trees = validator.stage("parse", parse_operator_functions, new_operator)
+        if not trees:
             globals_dict["logger"].debug("Code for operators has syntax errors")
-            # globals_dict["op_manager"].remove_operator(new_operator.id)
             continue
+        compute_code = new_operator.op_compute_func
+        compute_tree = trees[0]
+
+        globals_dict["op_manager"].extract_op_dependencies(new_operator)
+
+        static_checks = []
         if new_operator.n_ary == 1:
-            if is_unary_operator(new_operator.op_compute_func)==False:
-                globals_dict["logger"].debug("is_unary_operator_check is False")
-                continue
+            static_checks.append(("arity", lambda: is_unary_operator(compute_code, compute_tree)))
         elif new_operator.n_ary == 2:
-            if is_binary_operator(new_operator.op_compute_func)==False:
-                globals_dict["logger"].debug("is_binary_operator_check is False")
-                continue
-        
-        if check_single_function_call_with_same_args(new_operator.op_compute_func) ==False:
+            static_checks.append(("arity", lambda: is_binary_operator(compute_code, compute_tree)))
+        static_checks += [
+            ("single_call", lambda: check_single_function_call_with_same_args(compute_code, compute_tree)),
+            ("duplicate_returns", lambda: check_duplicate_returns_in_branches(compute_code, compute_tree)),
+            ("order", lambda: has_order(globals_dict, new_operator, order)),
+            ("similarity", lambda: not is_known_function(globals_dict, compute_code, compute_tree)),
+        ]
+        rejected_by = validator.run_cheapest_first(static_checks)
+        if rejected_by is not None:
+            globals_dict["logger"].debug(f"Operator {new_operator.func_id} rejected by the {rejected_by} check")
             continue
-        
-        if check_single_function_call_with_same_args(new_operator.op_compute_func) ==False:
+
+        # Only the survivors of the static checks are compiled and executed
+        if not validator.stage("compile", compile_operator, globals_dict, new_operator):
+            globals_dict["logger"].debug("Compile func failed.")
             continue
-        
-        if check_duplicate_returns_in_branches(new_operator.op_compute_func) ==False:
+
+        # One batched probe run decides executability and gives the behavioural fingerprint
+        probe_run = validator.stage("executable", check_executable, new_operator)
+        if not probe_run:
             continue
-        
-        existing_funcs = get_operator_compute_funcs(globals_dict)
 
-        if check_function_similarity(new_operator.op_compute_func, existing_funcs):
-            globals_dict["logger"].debug("Found a similar function in existing operators")
-            continue  #
-        
-        # Validate whether the operator is executable based on its arity (1 or 2)
-        if new_operator.n_ary == 1:
-            is_executable = test_unary_op_executability()
-        elif new_operator.n_ary == 2:
-            is_executable = test_binary_op_executability()
-
-        # Process successful operators
-        if is_executable:
-            new_operator.is_temporary = False
-            globals_dict["op_manager"].calculate_order(new_operator)
-            if new_operator.n_order != order:
-                globals_dict["logger"].debug("n_order is not equal to needed order.")
-                continue  
-            globals_dict["logger"].debug(f"Operator {new_operator.func_id} is executable.")
-            return new_operator  
-        else:
+        if not validator.stage("behavior", lambda: not is_known_behavior(globals_dict, probe_run.fingerprint)):
+            continue
+
+        if globals_dict.get("deep_check") and not validator.stage("deep_check", deep_check_executability, new_operator):
             continue
 
+        new_operator.is_temporary = False
+        globals_dict["logger"].debug(f"Operator {new_operator.func_id} is executable.")
+        globals_dict["logger"].info(f"Validation stages:\n{validator.format_summary()}")
+        return new_operator
+
         
 def generate_randop(globals_dict: Dict[str, Any], file_path: str, num: int, order: int):
     """
@@ -514,6 +532,7 @@ if __name__ == "__main__":
     parser.add_argument('--mode', type=str, choices=['raise', 'expand'], default='expand', help="Mode for operator generation: 'raise' for exponentiation, 'expand' for expansion")
     parser.add_argument('--num', type=int, default=5, help='Number of operators to generate')
     parser.add_argument('--n_order', type=int, default=1, help='Order of operators to generate')
+    parser.add_argument('--deep-check', action='store_true', help='Also property-test candidates with hypothesis (slower)')
     
     # Parse arguments
     args = parser.parse_args()
@@ -528,9 +547,10 @@ if __name__ == "__main__":
     print(f"Mode to Generate: {args.mode}")
     print(f"Number of Operators to Generate: {args.num}")
     print(f"Order of Operators to Generate: {args.n_order}")
+    print(f"Deep Check: {args.deep_check}")
     
     # Initialize global objects
-    globals_dict = initialize_globals(config_path=args.config, initial_operators_path=args.initial_operators_path, cython_cache_dir=args.cython_cache_dir)
+    globals_dict = initialize_globals(config_path=args.config, initial_operators_path=args.initial_operators_path, cython_cache_dir=args.cython_cache_dir, deep_check=args.deep_check)
 
     if args.mode == 'raise':
         generate_raise_order_operators(globals_dict, args.generated_operators_path, args.num, args.n_order)
@@ -8,6 +8,7 @@ from .operator_priority_manager import OperatorPriorityManager
 from .operator_dependency_graph  import OperatorDependencyGraph
 from .simple_expr_parse import Simple_Expr_Parser,Simple_Expr_Transformer
 from .compiler import CythonCompiler
+from .body_hash import canonical_body_hash
 
 __all__ = [
     'ConditionGenerator',
@@ -20,7 +21,8 @@ __all__ = [
     'OperatorDependencyGraph',
     'CythonCompiler',
     'Simple_Expr_Parser',
-    'Simple_Expr_Transformer'
+    'Simple_Expr_Transformer',
+    'canonical_body_hash'
 ]
 
 
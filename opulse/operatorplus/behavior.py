@@ -0,0 +1,213 @@
+import hashlib
+import math
+import random
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Seed of the probe vectors; changing it changes every fingerprint
+PROBE_SEED = 20240601
+
+# Edge values every probe vector starts with. Magnitudes stay small because recursive operators
+# loop |operand| times, calling lower-order operators that loop again.
+EDGE_VALUES = (0, 1, -1, 2, -2, 3, -3, 7, -7, 64, -64)
+SPECIAL_VALUES = (float("nan"), float("inf"), float("-inf"))
+
+
+@lru_cache(maxsize=None)
+def probe_inputs(n_ary: int, num_random: int = 24, seed: int = PROBE_SEED) -> Tuple[Tuple, ...]:
+    """
+    Returns the fixed probe vector operators of an arity are evaluated on.
+
+    The vector holds the edge values (zero, small positives and negatives), NaN and infinities,
+    and `num_random` seeded random integers, so it is the same in every process. Vectors are
+    built once per process.
+
+    Parameters:
+        n_ary (int): The arity, 1 or 2.
+        num_random (int): The number of random probes.
+        seed (int): The random seed.
+
+    Returns:
+        Tuple[Tuple, ...]: The argument tuples.
+    """
+    rng = random.Random(seed * 10 + n_ary)
+    if n_ary == 1:
+        probes = [(value,) for value in EDGE_VALUES + SPECIAL_VALUES]
+        probes += [(rng.randint(-50, 50),) for _ in range(num_random)]
+    elif n_ary == 2:
+        small = EDGE_VALUES[:7]
+        probes = [(a, b) for a in small for b in small]
+        for special in SPECIAL_VALUES:
+            probes += [(special, 2), (3, special), (special, special)]
+        probes += [(rng.randint(-50, 50), rng.randint(-50, 50)) for _ in range(num_random)]
+    else:
+        raise ValueError(f"Unsupported arity {n_ary}.")
+    return tuple(probes)
+
+
+def probe_outcome(result: Any) -> str:
+    """
+    Encodes one result so equal behaviour gives equal text: numbers by value (3 and 3.0 alike),
+    NaN and infinities by name, anything else by type.
+    """
+    if isinstance(result, bool) or not isinstance(result, (int, float)):
+        return f"type:{type(result).__name__}"
+    if isinstance(result, float):
+        if math.isnan(result):
+            return "nan"
+        if math.isinf(result):
+            return "inf" if result > 0 else "-inf"
+        if result.is_integer():
+            return str(int(result))
+    return repr(result)
+
+
+def evaluate_probes(func: Optional[Callable], probes: Sequence[Tuple]) -> List[str]:
+    """
+    Evaluates a function on every probe, capturing exceptions as outcomes.
+
+    Parameters:
+        func (Optional[Callable]): The compiled function; None gives a `missing` outcome per probe.
+        probes (Sequence[Tuple]): The argument tuples.
+
+    Returns:
+        List[str]: One `probe_outcome`, or `error:<ExceptionType>`, per probe.
+    """
+    if func is None:
+        return ["missing"] * len(probes)
+    outcomes = []
+    for args in probes:
+        try:
+            outcomes.append(probe_outcome(func(*args)))
+        except Exception as e:
+            outcomes.append(f"error:{type(e).__name__}")
+    return outcomes
+
+
+def _is_failure(outcome: str) -> bool:
+    return outcome.startswith(("error:", "type:")) or outcome == "missing"
+
+
+@dataclass
+class ProbeRun:
+    """
+    The outcomes of an operator's compute and count functions on a probe vector.
+
+    One run gives both the executability verdict and the behavioural fingerprint. Failures only
+    count on probes made of integers, the inputs operators are generated for; the outcomes on
+    NaN and infinities only feed the fingerprint.
+    """
+    n_ary: int
+    probes: Sequence[Tuple]
+    compute_outcomes: List[str]
+    count_outcomes: List[str]
+    failures: List[str] = field(default_factory=list)
+
+    @property
+    def executable(self) -> bool:
+        """
+        Whether both functions returned a number on every integer probe.
+        """
+        return not self.failures
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        The behavioural fingerprint, see `behavior_fingerprint`.
+        """
+        text = f"{self.n_ary}\n" + ",".join(self.compute_outcomes) + "\n" + ",".join(self.count_outcomes)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def run_probes(
+    compute_func: Optional[Callable],
+    count_func: Optional[Callable],
+    n_ary: int,
+    probes: Optional[Sequence[Tuple]] = None,
+) -> ProbeRun:
+    """
+    Evaluates an operator's compute and count functions on a probe vector in one call.
+
+    Nothing is global, so runs are re-entrant, and exceptions are captured per probe.
+
+    Parameters:
+        compute_func (Optional[Callable]): The compiled compute function.
+        count_func (Optional[Callable]): The compiled count function.
+        n_ary (int): The arity.
+        probes (Optional[Sequence[Tuple]]): The probe vector, `probe_inputs(n_ary)` by default.
+
+    Returns:
+        ProbeRun: The outcomes and the failures, described as `<function><args>: <outcome>`.
+    """
+    if probes is None:
+        probes = probe_inputs(n_ary)
+    run = ProbeRun(n_ary, probes, evaluate_probes(compute_func, probes), evaluate_probes(count_func, probes))
+    for name, outcomes in (("compute", run.compute_outcomes), ("count", run.count_outcomes)):
+        for args, outcome in zip(probes, outcomes):
+            if _is_failure(outcome) and all(type(arg) is int for arg in args):
+                run.failures.append(f"{name}{args}: {outcome}")
+    return run
+
+
+def behavior_fingerprint(
+    compute_func: Optional[Callable],
+    count_func: Optional[Callable],
+    n_ary: int,
+    probes: Optional[Sequence[Tuple]] = None,
+) -> str:
+    """
+    Computes the behavioural fingerprint of an operator: the hash of its compute and count
+    outcomes on the probe vector. Operators that compute the same function, whatever their
+    source, get the same fingerprint.
+
+    Parameters:
+        compute_func (Optional[Callable]): The compiled compute function.
+        count_func (Optional[Callable]): The compiled count function.
+        n_ary (int): The arity.
+        probes (Optional[Sequence[Tuple]]): The probe vector, `probe_inputs(n_ary)` by default.
+
+    Returns:
+        str: The sha256 hex digest.
+    """
+    return run_probes(compute_func, count_func, n_ary, probes).fingerprint
+
+
+def operator_probes(operator) -> Optional[ProbeRun]:
+    """
+    Runs a compiled `OperatorInfo` on its probe vector, or returns None if it is not compiled.
+    """
+    if operator.module is None or operator.n_ary not in (1, 2):
+        return None
+    # Looked up by name like ExpressionEvaluator.get_compute_count_func does
+    return run_probes(
+        getattr(operator.module, f"op_{operator.func_id}", None),
+        getattr(operator.module, f"op_count_{operator.func_id}", None),
+        operator.n_ary,
+    )
+
+
+def operator_behavior(operator) -> Optional[str]:
+    """
+    Returns the behavioural fingerprint of an `OperatorInfo`, or None if it is not compiled.
+    """
+    run = operator_probes(operator)
+    return run.fingerprint if run is not None else None
+
+
+def find_behavior_duplicates(operators: Dict[str, Any]) -> List[List[str]]:
+    """
+    Groups the operators that behave identically, e.g. all operators of an operators file.
+
+    Parameters:
+        operators (Dict[str, OperatorInfo]): Compiled operators by func_id, e.g. `OperatorManager.operators`.
+
+    Returns:
+        List[List[str]]: The func_ids of every group of two or more identical operators, in file order.
+    """
+    groups: Dict[str, List[str]] = {}
+    for func_id, operator in operators.items():
+        fingerprint = operator_behavior(operator)
+        if fingerprint is not None:
+            groups.setdefault(fingerprint, []).append(func_id)
+    return [func_ids for func_ids in groups.values() if len(func_ids) > 1]
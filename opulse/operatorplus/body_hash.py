@@ -0,0 +1,66 @@
+import ast
+import hashlib
+from typing import Optional
+
+# Names that references to the function itself and to its count function are replaced with
+SELF_NAME = "op_self"
+SELF_COUNT_NAME = "op_count_self"
+
+
+def function_func_id(name: str) -> str:
+    """
+    Returns the func_id of an operator function name, `op_<func_id>` or `op_count_<func_id>`.
+    """
+    if name.startswith("op_count_"):
+        return name[len("op_count_"):]
+    if name.startswith("op_"):
+        return name[len("op_"):]
+    return name
+
+
+def canonical_body_hash(func_code: Optional[str], tree: Optional[ast.AST] = None) -> Optional[str]:
+    """
+    Computes the hash of an operator function's normalized body.
+
+    The function name is dropped, references to the function itself and to its count function
+    are renamed so the func_id does not matter, and parameters are renamed by position. Two
+    operators with the same hash compute the same thing the same way.
+
+    Parameters:
+        func_code (Optional[str]): The source code of the function, e.g. `op_compute_func`.
+        tree (Optional[ast.AST]): The code parsed with `ast.parse`, if the caller already has it.
+            It is left unchanged.
+
+    Returns:
+        Optional[str]: The sha256 hex digest, or None if the code is missing or not a function.
+    """
+    try:
+        if tree is None:
+            if not func_code:
+                return None
+            tree = ast.parse(func_code)
+        function = tree.body[0]
+    except (SyntaxError, ValueError, AttributeError, IndexError):
+        return None
+    if not isinstance(function, ast.FunctionDef):
+        return None
+
+    func_id = function_func_id(function.name)
+    arg_names = [arg.arg for arg in function.args.args]
+    renames = {f"op_{func_id}": SELF_NAME, f"op_count_{func_id}": SELF_COUNT_NAME}
+    for position, name in enumerate(arg_names):
+        renames[name] = f"arg_{position}"
+
+    # Rename in place for the dump and restore afterwards, which is cheaper than copying the tree
+    renamed = []
+    for body_node in function.body:
+        for node in ast.walk(body_node):
+            if isinstance(node, ast.Name) and node.id in renames:
+                renamed.append((node, node.id))
+                node.id = renames[node.id]
+    try:
+        dump = "\n".join(ast.dump(node) for node in function.body)
+    finally:
+        for node, name in renamed:
+            node.id = name
+    return hashlib.sha256(f"{len(arg_names)}\n{dump}".encode("utf-8")).hexdigest()
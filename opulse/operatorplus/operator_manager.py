@@ -10,6 +10,8 @@ import numpy as np
 from config.constants import thres, special_values
 import cython
 from operatorplus.compiler import CythonCompiler
+from operatorplus.body_hash import canonical_body_hash
+from operatorplus.behavior import operator_behavior
 
 
 # def exponential_decay(n_order, decay_rate=0.2, max_weight=1.0, min_weight=0.05):
@@ -42,6 +44,14 @@ class OperatorManager:
         )  # key: operator symbol, value: list of OperatorInfo
         self.base_operators: Dict[int, List[OperatorInfo]] = defaultdict(list)
         # key: is_base, value: list of OperatorInfo
+        self.body_hash_index: Dict[str, List[str]] = defaultdict(list)
+        # key: canonical body hash of op_compute_func, value: list of operator func_ids
+        self.body_hashes: Dict[str, str] = {}
+        # key: operator func_id, value: canonical body hash of its op_compute_func
+        self.behavior_index: Optional[Dict[str, List[str]]] = None
+        # key: behavioural fingerprint, value: list of operator func_ids; None until enable_behavior_index
+        self.behaviors: Dict[str, str] = {}
+        # key: operator func_id, value: behavioural fingerprint
 
         # self.available_funcs: Dict[str, Any] = {}  # to store available functions
         # self.available_funcs_str = f"thres = {2**31 - 1}\n\n"
@@ -93,6 +103,7 @@ class OperatorManager:
                         
                     self.operators[operator.func_id] = operator
                     self.symbol_to_operators[operator.symbol].append(operator)
+                    self._index_body(operator)
 
                     # Update available functions for the operator
                     if operator.is_base:
@@ -463,6 +474,7 @@ class OperatorManager:
 
         # Add the operator to the operators dictionary
         self.operators[operator.func_id] = operator
+        self._index_body(operator)
 
         # Map the operator to its symbol in the symbol_to_operators dictionary
         if operator.symbol not in self.symbol_to_operators:
@@ -482,6 +494,93 @@ class OperatorManager:
             )
 
     
+    def _index_body(self, operator: OperatorInfo):
+        self._unindex_body(operator.func_id)
+        body_hash = canonical_body_hash(operator.op_compute_func)
+        if body_hash is not None:
+            self.body_hashes[operator.func_id] = body_hash
+            self.body_hash_index[body_hash].append(operator.func_id)
+        if self.behavior_index is not None:
+            behavior = operator_behavior(operator)
+            if behavior is not None:
+                self.behaviors[operator.func_id] = behavior
+                self.behavior_index.setdefault(behavior, []).append(operator.func_id)
+
+    def _unindex_body(self, op_func_id: str):
+        body_hash = self.body_hashes.pop(op_func_id, None)
+        if body_hash is not None:
+            func_ids = self.body_hash_index[body_hash]
+            func_ids.remove(op_func_id)
+            if not func_ids:
+                del self.body_hash_index[body_hash]
+        behavior = self.behaviors.pop(op_func_id, None)
+        if behavior is not None:
+            func_ids = self.behavior_index[behavior]
+            func_ids.remove(op_func_id)
+            if not func_ids:
+                del self.behavior_index[behavior]
+
+    def enable_behavior_index(self):
+        """
+        Builds the behavioural fingerprint index of the compiled operators, see `find_same_behavior`.
+
+        Fingerprints run every operator on the probe vector, so the index is only built on
+        request, e.g. when generating operators. Once built, `add_operator` and `remove_operator`
+        keep it up to date; operators added without a compiled module are left out.
+        """
+        self.behavior_index = {}
+        self.rebuild_body_hash_index()
+        self.logger.info(
+            f"Indexed {len(self.behaviors)} operators by behaviour, {len(self.behavior_index)} distinct."
+        )
+
+    def find_same_behavior(self, fingerprint: Optional[str]) -> List[str]:
+        """
+        Finds the operators with a behavioural fingerprint, see `behavior.behavior_fingerprint`.
+
+        Parameters:
+            fingerprint (Optional[str]): The fingerprint of a candidate.
+
+        Returns:
+            List[str]: The func_ids of the matching operators, empty if there are none or the
+            index is not enabled.
+        """
+        if fingerprint is None or not self.behavior_index:
+            return []
+        return list(self.behavior_index.get(fingerprint, ()))
+
+    def rebuild_body_hash_index(self):
+        """
+        Recomputes the canonical body hash index of all operators, see `find_same_body`, and
+        the behavioural index if it is enabled.
+        """
+        self.body_hash_index.clear()
+        self.body_hashes.clear()
+        if self.behavior_index is not None:
+            self.behavior_index.clear()
+            self.behaviors.clear()
+        for operator in self.operators.values():
+            self._index_body(operator)
+
+    def find_same_body(self, func_code: str, tree=None) -> List[str]:
+        """
+        Finds the operators whose compute function has the same canonical body as `func_code`.
+
+        The index is kept up to date by `add_operator` and `remove_operator`, so the lookup costs
+        one hash of the new function, whatever the number of operators.
+
+        Parameters:
+            func_code (str): The source code of a compute function.
+            tree (optional): The code parsed with `ast.parse`, if the caller already has it.
+
+        Returns:
+            List[str]: The func_ids of the matching operators, empty if there are none.
+        """
+        body_hash = canonical_body_hash(func_code, tree)
+        if body_hash is None:
+            return []
+        return list(self.body_hash_index.get(body_hash, ()))
+
     def remove_operator(self, op_func_id: str):
         """
         Dynamically removes an operator from the system.
@@ -503,6 +602,7 @@ class OperatorManager:
 
         # Retrieve and remove the operator from the operators dictionary
         operator = self.operators.pop(op_func_id)
+        self._unindex_body(op_func_id)
         self.logger.info(f"Removed operator {operator.symbol} (ID: {op_func_id}).")
 
         # Remove the operator from the symbol_to_operators mapping
@@ -547,12 +647,14 @@ class OperatorManager:
 
         # Remove the old operator
         old_operator = self.operators.pop(op_func_id)
+        self._unindex_body(op_func_id)
         self.symbol_to_operators[old_operator.symbol].remove(old_operator)
         self.logger.info(f"Removed old operator {old_operator.symbol} (ID: {op_func_id}).")
 
         # Add the updated operator
         updated_operator = OperatorInfo(**updated_data)
         self.operators[updated_operator.id] = updated_operator
+        self._index_body(updated_operator)
         self.symbol_to_operators[updated_operator.symbol].append(updated_operator)
         self.logger.info(f"Updated operator {updated_operator.symbol} (ID: {op_func_id}).")
 
@@ -616,6 +718,8 @@ class OperatorManager:
                         )
                 del self.operators[old_key]
 
+        # Renaming rewrote the functions calling renamed operators, so their hashes changed
+        self.rebuild_body_hash_index()
         self.logger.info(
             "Operator with ID %s and its dependencies removed. Operator IDs reassigned.",
             op_func_id)
@@ -0,0 +1,65 @@
+from .sharding import ShardTask, plan_shards, stable_key
+from .streaming import BoundedTaskFeeder, imap_bounded
+from .scheduler import AdaptiveBatcher, UtilizationMeter, imap_adaptive, run_batch
+from .records import encode_jsonl
+from .writer import AsyncWriter
+from .shard_output import ShardEntry, ShardFileWriter, ShardManifest, write_shard
+from .work_queue import Lease, WorkQueue, default_owner
+from .broadcast_log import BroadcastLog
+from .ordered_commit import Proposal, OrderedCommitter
+from .validation import StageStats, StagedValidator
+from .zstd_output import FrameEntry, FrameIndex, ZstdJsonlReader, compress_frames, commit_compressed_shard, require_zstandard
+from .parquet_output import ParquetShardDataset, expression_schema, expression_row, records_to_table, require_pyarrow, special_values_from_config, parquet_shard_size
+from .worker_spec import WorkerSpec, export_for_preload, preloaded_spec, get_pool_context
+from .worker_state import load_operator_manager, load_expression_generator
+from .run_manifest import RunHeader, RunCommit, RunManifest, hash_file, hash_config
+
+__all__ = [
+    'ShardTask',
+    'plan_shards',
+    'stable_key',
+    'BoundedTaskFeeder',
+    'imap_bounded',
+    'AdaptiveBatcher',
+    'UtilizationMeter',
+    'imap_adaptive',
+    'run_batch',
+    'encode_jsonl',
+    'AsyncWriter',
+    'ShardEntry',
+    'ShardFileWriter',
+    'ShardManifest',
+    'write_shard',
+    'Lease',
+    'WorkQueue',
+    'default_owner',
+    'BroadcastLog',
+    'Proposal',
+    'OrderedCommitter',
+    'StageStats',
+    'StagedValidator',
+    'FrameEntry',
+    'FrameIndex',
+    'ZstdJsonlReader',
+    'compress_frames',
+    'commit_compressed_shard',
+    'require_zstandard',
+    'ParquetShardDataset',
+    'expression_schema',
+    'expression_row',
+    'records_to_table',
+    'require_pyarrow',
+    'special_values_from_config',
+    'parquet_shard_size',
+    'WorkerSpec',
+    'export_for_preload',
+    'preloaded_spec',
+    'get_pool_context',
+    'load_operator_manager',
+    'load_expression_generator',
+    'RunHeader',
+    'RunCommit',
+    'RunManifest',
+    'hash_file',
+    'hash_config',
+]
\ No newline at end of file
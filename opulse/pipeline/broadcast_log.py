@@ -0,0 +1,59 @@
+from typing import Any, Dict, List
+import os
+import orjson
+
+
+class BroadcastLog:
+    """
+    Append-only JSONL file through which one process broadcasts messages to any number of readers.
+
+    The publisher appends one line per message; every reader keeps its own offset and `poll`
+    returns the complete lines written since its last call, so a reader only pays a `stat` when
+    nothing is new. A line still being written is left for the next poll. Readers can be worker
+    processes created in any way, as long as they see the same filesystem.
+    """
+
+    def __init__(self, path: str):
+        """
+        Opens a broadcast log; reading starts at the beginning of the file.
+
+        Parameters:
+            path (str): The log file.
+        """
+        self.path = path
+        self.offset = 0
+
+    def reset(self) -> None:
+        """
+        Creates the log, or empties it. Called by the publisher before any reader starts.
+        """
+        with open(self.path, "wb"):
+            pass
+        self.offset = 0
+
+    def publish(self, messages: List[Dict[str, Any]]) -> None:
+        """
+        Appends messages to the log.
+
+        Parameters:
+            messages (List[Dict[str, Any]]): JSON-serializable messages.
+        """
+        with open(self.path, "ab") as f:
+            f.write(b"".join(orjson.dumps(message) + b"\n" for message in messages))
+
+    def poll(self) -> List[Dict[str, Any]]:
+        """
+        Returns the messages published since the last poll, in publishing order.
+        """
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return []
+        if size <= self.offset:
+            return []
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        end = data.rfind(b"\n") + 1
+        self.offset += end
+        return [orjson.loads(line) for line in data[:end].splitlines()]
@@ -0,0 +1,115 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class Proposal:
+    """
+    A candidate a worker produced speculatively for one task: the task's index, the attempt that
+    produced it, the candidate and its fingerprints by kind (e.g. symbol or body hash). A
+    fingerprint of None never conflicts.
+    """
+    task_index: int
+    attempt: int
+    candidate: Any
+    fingerprints: Dict[str, Optional[Hashable]]
+
+
+class OrderedCommitter:
+    """
+    Commits speculative proposals in task order, so what is accepted depends on what the workers
+    proposed and not on which worker finished first.
+
+    A proposal is buffered until every lower task is resolved, then committed unless one of its
+    fingerprints was claimed by an earlier commit. A rejected task is handed back to be retried
+    under the same index and holds back the commits of later tasks until its retry is resolved,
+    so a conflict between two tasks is always won by the lower index. Buffered proposals that
+    already conflict are rejected right away, so their retries start early.
+    """
+
+    def __init__(self, num_tasks: int, claimed: Iterable[Dict[str, Optional[Hashable]]] = ()):
+        """
+        Initializes the committer.
+
+        Parameters:
+            num_tasks (int): The number of tasks, indexed from 0.
+            claimed (Iterable[Dict[str, Optional[Hashable]]]): Fingerprints of candidates committed
+                before, e.g. the operators already in the operators file.
+        """
+        self.num_tasks = num_tasks
+        self.next_index = 0
+        # None marks a skipped task
+        self.buffered: Dict[int, Optional[Proposal]] = {}
+        self.claimed: Dict[str, set] = {}
+        for fingerprints in claimed:
+            self.claim(fingerprints)
+
+    @property
+    def done(self) -> bool:
+        """
+        Whether every task is resolved.
+        """
+        return self.next_index >= self.num_tasks
+
+    def claim(self, fingerprints: Dict[str, Optional[Hashable]]) -> None:
+        """
+        Marks fingerprints as taken by a committed candidate.
+        """
+        for kind, value in fingerprints.items():
+            if value is not None:
+                self.claimed.setdefault(kind, set()).add(value)
+
+    def conflict(self, fingerprints: Dict[str, Optional[Hashable]]) -> Optional[str]:
+        """
+        Returns the kind of the first fingerprint already claimed, or None if there is none.
+        """
+        for kind, value in fingerprints.items():
+            if value is not None and value in self.claimed.get(kind, ()):
+                return kind
+        return None
+
+    def propose(self, proposal: Proposal) -> Tuple[List[Proposal], List[Proposal]]:
+        """
+        Adds a worker's proposal and resolves the tasks that can now be resolved.
+
+        Parameters:
+            proposal (Proposal): The proposal.
+
+        Returns:
+            Tuple[List[Proposal], List[Proposal]]: The proposals committed, in task order, and the
+            proposals rejected, whose tasks must be retried.
+        """
+        self.buffered[proposal.task_index] = proposal
+        return self._drain()
+
+    def skip(self, task_index: int) -> Tuple[List[Proposal], List[Proposal]]:
+        """
+        Resolves a task without committing anything, e.g. after it failed or ran out of attempts.
+
+        Returns:
+            Tuple[List[Proposal], List[Proposal]]: As for `propose`.
+        """
+        self.buffered[task_index] = None
+        return self._drain()
+
+    def _drain(self) -> Tuple[List[Proposal], List[Proposal]]:
+        committed = []
+        rejected = []
+        while self.next_index in self.buffered:
+            proposal = self.buffered.pop(self.next_index)
+            if proposal is None:
+                self.next_index += 1
+                continue
+            if self.conflict(proposal.fingerprints) is not None:
+                rejected.append(proposal)
+                break
+            self.claim(proposal.fingerprints)
+            committed.append(proposal)
+            self.next_index += 1
+        if committed:
+            # Claims only grow, so these would be rejected when their turn comes
+            for task_index in sorted(self.buffered):
+                proposal = self.buffered[task_index]
+                if proposal is not None and self.conflict(proposal.fingerprints) is not None:
+                    rejected.append(self.buffered.pop(task_index))
+        return committed, rejected
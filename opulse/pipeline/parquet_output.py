@@ -0,0 +1,268 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+import base64
+import math
+import os
+import re
+import orjson
+from pipeline.sharding import ShardTask, plan_shards
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is only needed for the parquet output format
+    pa = None
+    pq = None
+
+# Shard files of a dataset directory; files starting with "_" or "." are ignored by Arrow readers
+SHARD_FILE_PATTERN = re.compile(r"^shard-(\d+)-(\d+)-(\d+)\.parquet$")
+RUN_MANIFEST_NAME = "_run.jsonl"
+
+# The config's default nan/inf symbols, stored as float NaN/Inf in the metric columns
+SPECIAL_VALUES = {"NaN": math.nan, "Inf": math.inf, "-Inf": -math.inf}
+
+
+def special_values_from_config(config: Any) -> Dict[str, float]:
+    """
+    Returns the float values of the nan/inf symbols a config's `other_symbols_atoms` defines.
+
+    Parameters:
+        config: The loaded config, e.g. a `ParamConfig`; anything with a dict-like `get`.
+
+    Returns:
+        Dict[str, float]: The symbols mapped to NaN, Inf and -Inf.
+    """
+    atoms = config.get("other_symbols_atoms", None) or {}
+    return {
+        atoms.get("nan_symbol", "NaN"): math.nan,
+        atoms.get("inf_symbol", "Inf"): math.inf,
+        atoms.get("neg_inf_symbol", "-Inf"): -math.inf,
+    }
+
+
+def require_pyarrow() -> None:
+    """
+    Raises an ImportError explaining how to enable parquet output if pyarrow is missing.
+    """
+    if pa is None:
+        raise ImportError("The parquet output format needs pyarrow; install it with `pip install pyarrow`.")
+
+
+def expression_schema() -> "pa.Schema":
+    """
+    Returns the Arrow schema of expression records.
+
+    Scalar metrics are typed columns (nan/inf symbols become float NaN/Inf), the tree is an
+    encoded binary column, with `tree_encoding` telling how each row's tree is encoded, and the
+    CoT fields are lists of (info, layer) structs, so a reader projecting e.g. `expression` and
+    `result` does not decode anything else.
+    """
+    require_pyarrow()
+    step = pa.struct([("info", pa.string()), ("layer", pa.int64())])
+    return pa.schema(
+        [
+            ("id", pa.int64()),
+            ("expression", pa.string()),
+            ("expression_no_base_symbol", pa.string()),
+            ("text", pa.string()),
+            ("result", pa.string()),
+            ("highest_n_order", pa.int64()),
+            ("priority_hierarchical_complexity", pa.int64()),
+            ("normalized_expansion_degree", pa.float64()),
+            ("operation_count", pa.int64()),
+            ("complexity_ratio", pa.float64()),
+            ("base", pa.int64()),
+            ("result_base", pa.int64()),
+            ("longer_result_info", pa.struct([("target_base", pa.int64()), ("flag", pa.bool_())])),
+            ("used_operators", pa.list_(pa.string())),
+            ("dependent_operators", pa.list_(pa.string())),
+            ("tree", pa.binary()),
+            ("tree_encoding", pa.string()),
+            ("cot", pa.list_(step)),
+            ("cot_info", pa.list_(step)),
+        ]
+    )
+
+
+def parquet_shard_size(shard_size: int, row_group_size: int) -> int:
+    """
+    Returns the number of record ids per shard of a Parquet dataset.
+
+    Every shard is its own file, so shards smaller than `row_group_size` would leave the row group
+    size without effect and make many small files; shards hold at least one full row group.
+    """
+    return max(shard_size, row_group_size)
+
+
+def _to_float(value: Any, special_values: Dict[str, float]) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return special_values.get(value, math.nan)
+    return float(value)
+
+
+def _to_steps(steps: Optional[Iterable[Any]]) -> List[Dict[str, Any]]:
+    return [
+        {"info": step.get("info"), "layer": step.get("layer")} if isinstance(step, dict) else {"info": str(step), "layer": None}
+        for step in steps or []
+    ]
+
+
+def expression_row(record: Dict[str, Any], special_values: Dict[str, float] = SPECIAL_VALUES) -> Dict[str, Any]:
+    """
+    Converts a record of `ExpressionEvaluator.evaluate` to a row of `expression_schema`.
+
+    Parameters:
+        record (Dict[str, Any]): The record.
+        special_values (Dict[str, float]): Float values of the nan/inf symbols used in metrics,
+            see `special_values_from_config`.
+
+    Returns:
+        Dict[str, Any]: The row.
+    """
+    result = record.get("result")
+    tree = record.get("tree")
+    # Compact trees (base64 text of tree_codec.encode_tree) are stored as their raw encoding, dict trees as JSON
+    if tree is None:
+        tree_bytes, tree_encoding = None, None
+    elif isinstance(tree, str):
+        tree_bytes, tree_encoding = base64.b64decode(tree), "compact"
+    else:
+        tree_bytes, tree_encoding = orjson.dumps(tree), "dict"
+    return {
+        "id": record.get("id"),
+        "expression": record.get("expression"),
+        "expression_no_base_symbol": record.get("expression_no_base_symbol"),
+        "text": record.get("text"),
+        "result": None if result is None else str(result),
+        "highest_n_order": record.get("highest_n_order"),
+        "priority_hierarchical_complexity": record.get("priority_hierarchical_complexity"),
+        "normalized_expansion_degree": _to_float(record.get("normalized_expansion_degree"), special_values),
+        "operation_count": record.get("operation_count"),
+        "complexity_ratio": _to_float(record.get("complexity_ratio"), special_values),
+        "base": record.get("base"),
+        "result_base": record.get("result_base"),
+        "longer_result_info": record.get("longer_result_info"),
+        "used_operators": [str(func_id) for func_id in record.get("used_operators") or []],
+        "dependent_operators": [str(func_id) for func_id in record.get("dependent_operators") or []],
+        "tree": tree_bytes,
+        "tree_encoding": tree_encoding,
+        "cot": _to_steps(record.get("cot")),
+        "cot_info": _to_steps(record.get("cot_info")),
+    }
+
+
+def records_to_table(records: Iterable[Dict[str, Any]], special_values: Dict[str, float] = SPECIAL_VALUES) -> "pa.Table":
+    """
+    Converts expression records to an Arrow table of `expression_schema`, see `expression_row`.
+    """
+    require_pyarrow()
+    return pa.Table.from_pylist(
+        [expression_row(record, special_values) for record in records], schema=expression_schema()
+    )
+
+
+class ParquetShardDataset:
+    """
+    Directory of Parquet files, one per shard, named `shard-<shard_id>-<start_idx>-<stop_idx>.parquet`.
+
+    Every shard file is written to a hidden temporary file and renamed into place, so a shard
+    is either complete or absent and resuming only needs to list the directory. The directory
+    can be read as one dataset by any Arrow reader; the run manifest (`_run.jsonl`) and
+    temporary files are ignored by Arrow's dataset discovery.
+    """
+
+    def __init__(self, directory: str):
+        """
+        Opens (or creates) a dataset directory.
+
+        Parameters:
+            directory (str): The dataset directory.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.run_manifest_path = os.path.join(directory, RUN_MANIFEST_NAME)
+
+    def shards(self) -> List[ShardTask]:
+        """
+        Returns the shards present in the directory, in id order.
+        """
+        shards = []
+        for name in os.listdir(self.directory):
+            match = SHARD_FILE_PATTERN.match(name)
+            if match:
+                shard_id, start_idx, stop_idx = (int(group) for group in match.groups())
+                shards.append(ShardTask(shard_id, start_idx, start_idx, stop_idx))
+        return sorted(shards, key=lambda shard: shard.start_idx)
+
+    def shard_path(self, task: ShardTask) -> str:
+        return os.path.join(self.directory, f"shard-{task.shard_id:09d}-{task.start_idx}-{task.stop_idx}.parquet")
+
+    def pending_tasks(self, num: int, shard_size: int) -> List[ShardTask]:
+        """
+        Plans the shard tasks still needed to cover record ids 1..num.
+
+        Parameters:
+            num (int): The total number of records wanted.
+            shard_size (int): Number of record ids per shard; must match the previous runs.
+
+        Returns:
+            List[ShardTask]: The missing shard tasks, in id order.
+        """
+        covered: Dict[int, int] = {}
+        for shard in self.shards():
+            covered[shard.shard_id] = max(covered.get(shard.shard_id, 0), shard.stop_idx)
+        tasks = []
+        for task in plan_shards(1, num, shard_size):
+            start_idx = max(task.start_idx, covered.get(task.shard_id, 0) + 1)
+            if start_idx <= task.stop_idx:
+                tasks.append(ShardTask(task.shard_id, task.first_idx, start_idx, task.stop_idx))
+        return tasks
+
+    def write(
+        self,
+        task: ShardTask,
+        records: Sequence[Dict[str, Any]],
+        row_group_size: int = 10000,
+        compression: str = "zstd",
+        special_values: Dict[str, float] = SPECIAL_VALUES,
+    ) -> str:
+        """
+        Writes the records of a shard to its Parquet file.
+
+        Parameters:
+            task (ShardTask): The shard.
+            records (Sequence[Dict[str, Any]]): Its records.
+            row_group_size (int): Maximum number of rows per row group.
+            compression (str): The Parquet compression codec.
+            special_values (Dict[str, float]): Float values of the nan/inf symbols used in metrics,
+                see `special_values_from_config`.
+
+        Returns:
+            str: The path of the shard file.
+        """
+        require_pyarrow()
+        path = self.shard_path(task)
+        tmp_path = os.path.join(self.directory, f".{os.path.basename(path)}.{os.getpid()}.tmp")
+        pq.write_table(records_to_table(records, special_values), tmp_path, row_group_size=row_group_size, compression=compression)
+        os.replace(tmp_path, path)
+        return path
+
+    def read(self, columns: Optional[Sequence[str]] = None) -> "pa.Table":
+        """
+        Reads the dataset in id order, decoding only the requested columns.
+
+        Parameters:
+            columns (Sequence[str], optional): The columns, e.g. ("expression", "result"); all if None.
+
+        Returns:
+            pa.Table: The records.
+        """
+        require_pyarrow()
+        columns = list(columns) if columns is not None else None
+        tables = [pq.read_table(self.shard_path(shard), columns=columns) for shard in self.shards()]
+        if not tables:
+            return expression_schema().empty_table() if columns is None else pa.schema(
+                [expression_schema().field(column) for column in columns]
+            ).empty_table()
+        return pa.concat_tables(tables)
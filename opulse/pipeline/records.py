@@ -0,0 +1,28 @@
+from typing import Any, Dict, Iterable, List
+import orjson
+
+
+def encode_jsonl(records: Iterable[Dict[str, Any]]) -> bytes:
+    """
+    Serializes records to one JSONL byte blob, one record per line.
+
+    Workers call this on a whole shard, so the parent receives (and writes) a single bytes
+    object per shard instead of unpickling and re-serializing every record. As before, a record
+    that cannot be serialized is reported and skipped.
+
+    Parameters:
+        records (Iterable[Dict[str, Any]]): The records.
+
+    Returns:
+        bytes: The JSONL blob, ending with a newline unless there are no records.
+    """
+    lines: List[bytes] = []
+    for record in records:
+        try:
+            lines.append(orjson.dumps(record))
+        except orjson.JSONEncodeError as e:
+            print(f"Error generating expression {record.get('id')}: {e}")
+    if not lines:
+        return b""
+    lines.append(b"")
+    return b"\n".join(lines)
@@ -0,0 +1,242 @@
+from dataclasses import dataclass, asdict, replace
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+import os
+import orjson
+from pipeline.sharding import ShardTask, plan_shards
+from pipeline.worker_spec import WorkerSpec
+
+
+def hash_file(path: str) -> str:
+    """
+    Returns the sha256 hex digest of a file's bytes.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_config(config: Dict[str, Any]) -> str:
+    """
+    Returns the sha256 hex digest of a config dict, independent of key order.
+    """
+    return hashlib.sha256(orjson.dumps(config, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+@dataclass(frozen=True)
+class RunHeader:
+    """
+    What the records of a run depend on. A run can only be resumed with the same header;
+    only the seed is taken over from the recorded run.
+    """
+    seed: int
+    shard_size: int
+    stream_key: Tuple[int, ...]
+    config_hash: str
+    operators_hash: str
+
+    @staticmethod
+    def for_spec(spec: WorkerSpec, seed: int, shard_size: int, stream_key: Tuple[int, ...]) -> "RunHeader":
+        """
+        Builds the header of a run from the worker spec it runs with.
+
+        Parameters:
+            spec (WorkerSpec): The worker spec, including the run's config overrides.
+            seed (int): The global seed of the run.
+            shard_size (int): Number of record ids per shard.
+            stream_key (Tuple[int, ...]): The key of the run's random streams, without the shard id.
+
+        Returns:
+            RunHeader: The header.
+        """
+        return RunHeader(
+            seed=seed,
+            shard_size=shard_size,
+            stream_key=tuple(stream_key),
+            config_hash=hash_config(spec.load_config().config),
+            operators_hash=hash_file(spec.operators_path),
+        )
+
+    def with_stream_key(self, stream_key: Tuple[int, ...]) -> "RunHeader":
+        """
+        Returns the header of a run sharing this one's spec, seed and shard size, e.g. one output
+        file per operator, without reloading the config or rehashing the operators file.
+        """
+        return replace(self, stream_key=tuple(stream_key))
+
+
+@dataclass(frozen=True)
+class RunCommit:
+    """
+    A committed batch of a single-file run: records `start_idx..stop_idx` are in the output,
+    which is exactly `end_offset` bytes long after them. `shard_id` is None for records adopted
+    from an output written before the run had a manifest.
+    """
+    shard_id: Optional[int]
+    start_idx: int
+    stop_idx: int
+    count: int
+    end_offset: int
+
+
+class RunManifest:
+    """
+    Append-only checkpoint of a generation run: one header line, then one line per committed batch.
+
+    The output file is fsynced before a batch is committed, so on restart everything past the
+    last committed offset (a partially written batch) is cut off and generation continues at the
+    next record id, without reading the output.
+    """
+
+    def __init__(self, path: str):
+        """
+        Opens (or creates) a run manifest.
+
+        Parameters:
+            path (str): The manifest file.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.header: Optional[RunHeader] = None
+        self.commits: List[RunCommit] = []
+        self.load()
+
+    def load(self) -> None:
+        """
+        Reads the header and commits. A truncated last line left by a crash is cut off.
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            content = f.read()
+            if content and not content.endswith(b"\n"):
+                f.truncate(content.rfind(b"\n") + 1)
+        for line in content.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                continue
+            data = orjson.loads(line)
+            if "header" in data:
+                header = data["header"]
+                header["stream_key"] = tuple(header["stream_key"])
+                self.header = RunHeader(**header)
+            else:
+                self.commits.append(RunCommit(**data["commit"]))
+
+    def _append(self, data: Dict[str, Any]) -> None:
+        with open(self.path, "ab") as f:
+            f.write(orjson.dumps(data) + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def start(self, header: RunHeader) -> RunHeader:
+        """
+        Records the header of a new run, or checks that a resumed run matches the recorded one.
+
+        Parameters:
+            header (RunHeader): The header of the run about to start.
+
+        Returns:
+            RunHeader: The header in effect, which carries the recorded seed when resuming.
+
+        Raises:
+            ValueError: If the config, the operator set, the shard size or the stream key changed.
+        """
+        if self.header is None:
+            self._append({"header": asdict(header)})
+            self.header = header
+            return header
+        for field in ("config_hash", "operators_hash", "shard_size", "stream_key"):
+            recorded, current = getattr(self.header, field), getattr(header, field)
+            if recorded != current:
+                raise ValueError(
+                    f"Cannot resume {self.path}: {field} changed from {recorded} to {current}. "
+                    "Use a new output path or remove the previous run."
+                )
+        if self.header.seed != header.seed:
+            print(f"Resuming {self.path} with its recorded seed {self.header.seed} instead of {header.seed}.")
+        return self.header
+
+    def commit(self, task: ShardTask, count: int, end_offset: int) -> None:
+        """
+        Commits a batch whose records are durably written to the output.
+
+        Parameters:
+            task (ShardTask): The shard the batch covers.
+            count (int): Number of records written.
+            end_offset (int): Size of the output after the batch.
+        """
+        entry = RunCommit(task.shard_id, task.start_idx, task.stop_idx, count, end_offset)
+        self._append({"commit": asdict(entry)})
+        self.commits.append(entry)
+
+    @property
+    def stop_idx(self) -> int:
+        """The last committed record id, 0 if nothing is committed."""
+        return self.commits[-1].stop_idx if self.commits else 0
+
+    @property
+    def end_offset(self) -> int:
+        """The size of the output covered by the commits."""
+        return self.commits[-1].end_offset if self.commits else 0
+
+    def adopt_output(self, output_path: str) -> None:
+        """
+        Commits the complete lines of an output written before it had a manifest. This is the
+        only time the output is scanned; a partial last line is cut off first.
+
+        Parameters:
+            output_path (str): The output file.
+        """
+        if self.commits or not os.path.exists(output_path):
+            return
+        count = 0
+        end_offset = 0
+        with open(output_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                count += 1
+                end_offset += len(line)
+        if count:
+            entry = RunCommit(None, 1, count, count, end_offset)
+            self._append({"commit": asdict(entry)})
+            self.commits.append(entry)
+
+    def rollback_output(self, output_path: str) -> int:
+        """
+        Cuts the output back to the last commit, dropping any batch written but not committed.
+
+        Parameters:
+            output_path (str): The output file.
+
+        Returns:
+            int: Number of bytes dropped.
+
+        Raises:
+            ValueError: If the output is shorter than the committed records.
+        """
+        size = os.path.getsize(output_path) if os.path.exists(output_path) else 0
+        if size < self.end_offset:
+            raise ValueError(
+                f"{output_path} has {size} bytes but {self.path} committed {self.end_offset}; the output was modified."
+            )
+        if size > self.end_offset:
+            with open(output_path, "rb+") as f:
+                f.truncate(self.end_offset)
+        return size - self.end_offset
+
+    def pending_tasks(self, num: int) -> List[ShardTask]:
+        """
+        Plans the shard tasks for record ids after the last commit up to `num`.
+
+        Parameters:
+            num (int): The total number of records wanted.
+
+        Returns:
+            List[ShardTask]: The shard tasks, in id order.
+        """
+        return plan_shards(self.stop_idx + 1, num, self.header.shard_size)
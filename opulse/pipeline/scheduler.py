@@ -0,0 +1,234 @@
+from functools import partial
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+from multiprocessing.pool import Pool
+import threading
+import time
+from pipeline.streaming import BoundedTaskFeeder
+
+
+def run_batch(func: Callable[[Any], Any], batch: List[Any]) -> List[Tuple[Any, float, Any]]:
+    """
+    Runs `func` on every item of a batch in the worker, timing each call.
+
+    Returns:
+        List[Tuple[Any, float, Any]]: (item, seconds, result) per item, in batch order.
+    """
+    results = []
+    for item in batch:
+        start_time = time.perf_counter()
+        result = func(item)
+        results.append((item, time.perf_counter() - start_time, result))
+    return results
+
+
+def _call_numbered(func: Callable[[Any], Any], numbered: Tuple[int, Any]) -> Any:
+    return func(numbered[1])
+
+
+class AdaptiveBatcher:
+    """
+    Iterable grouping consecutive work items into pool tasks of roughly `target_seconds` each.
+
+    Costs are learned while the run goes: every group (e.g. an operator or a base/depth pair)
+    starts with single-item tasks, and once its seconds per unit are measured, cheap items are
+    batched together while an item expected to take `target_seconds` or more is always isolated
+    in its own task. Tasks are handed out lazily, so a batch is sized with the measurements
+    available when an idle worker asks for it.
+    """
+
+    def __init__(
+        self,
+        items: Iterable[Any],
+        cost: Callable[[Any], float],
+        group: Callable[[Any], Hashable],
+        target_seconds: float = 2.0,
+        max_batch: int = 64,
+        smoothing: float = 0.3,
+    ):
+        """
+        Initializes the batcher.
+
+        Parameters:
+            items (Iterable[Any]): The work items, in the order they must be yielded.
+            cost (Callable): Size of an item in work units, e.g. its number of records.
+            group (Callable): Key of the items sharing a per-unit cost.
+            target_seconds (float): Wanted duration of one task.
+            max_batch (int): Maximum number of items in one task.
+            smoothing (float): Weight of a new measurement in the moving average of a group's rate.
+        """
+        if target_seconds <= 0:
+            raise ValueError(f"target_seconds must be positive, got {target_seconds}.")
+        self.items = items
+        self.cost = cost
+        self.group = group
+        self.target_seconds = target_seconds
+        self.max_batch = max_batch
+        self.smoothing = smoothing
+        # Seconds per work unit by group; written by the consumer, read by the pool's feeder thread
+        self.rates: Dict[Hashable, float] = {}
+        self.lock = threading.Lock()
+
+    def estimate(self, item: Any) -> Optional[float]:
+        """
+        Returns the expected seconds of an item, None while its group is unmeasured.
+        """
+        with self.lock:
+            rate = self.rates.get(self.group(item))
+        return None if rate is None else rate * self.cost(item)
+
+    def record(self, item: Any, seconds: float) -> None:
+        """
+        Feeds back the measured duration of a finished item.
+        """
+        units = self.cost(item)
+        if units <= 0:
+            return
+        key = self.group(item)
+        with self.lock:
+            rate = seconds / units
+            previous = self.rates.get(key)
+            self.rates[key] = rate if previous is None else (1 - self.smoothing) * previous + self.smoothing * rate
+
+    def __iter__(self) -> Iterator[List[Any]]:
+        batch: List[Any] = []
+        batch_seconds = 0.0
+        for item in self.items:
+            estimate = self.estimate(item)
+            if estimate is None or estimate >= self.target_seconds:
+                # Unmeasured or slow items run alone: small first chunks, slow work isolated
+                if batch:
+                    yield batch
+                    batch, batch_seconds = [], 0.0
+                yield [item]
+                continue
+            if batch and (batch_seconds + estimate > self.target_seconds or len(batch) >= self.max_batch):
+                yield batch
+                batch, batch_seconds = [], 0.0
+            batch.append(item)
+            batch_seconds += estimate
+        if batch:
+            yield batch
+
+
+class UtilizationMeter:
+    """
+    Measures how busy the workers of a pool were: summed task time over wall time times workers.
+    """
+
+    def __init__(self, num_workers: int):
+        self.num_workers = num_workers
+        self.start_time = time.perf_counter()
+        self.busy_seconds = 0.0
+        self.tasks = 0
+        self.items = 0
+        self.slowest: Tuple[float, Any] = (0.0, None)
+
+    def add(self, item: Any, seconds: float) -> None:
+        """
+        Records a finished item.
+        """
+        self.busy_seconds += seconds
+        self.items += 1
+        if seconds > self.slowest[0]:
+            self.slowest = (seconds, item)
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Returns the utilization so far.
+
+        Returns:
+            Dict[str, Any]: Wall and busy seconds, tasks and items run, the utilization in [0, 1]
+            and the slowest item with its duration.
+        """
+        wall_seconds = time.perf_counter() - self.start_time
+        return {
+            "wall_seconds": wall_seconds,
+            "busy_seconds": self.busy_seconds,
+            "tasks": self.tasks,
+            "items": self.items,
+            "utilization": self.busy_seconds / (wall_seconds * self.num_workers) if wall_seconds > 0 else 0.0,
+            "slowest_seconds": self.slowest[0],
+            "slowest_item": self.slowest[1],
+        }
+
+
+def imap_adaptive(
+    pool: Pool,
+    func: Callable[[Any], Any],
+    items: Iterable[Any],
+    cost: Callable[[Any], float],
+    group: Callable[[Any], Hashable],
+    max_in_flight: int,
+    target_seconds: float = 2.0,
+    max_batch: int = 64,
+    meter: Optional[UtilizationMeter] = None,
+) -> Iterator[Any]:
+    """
+    Streams `func(item)` results in item order within each group, running the items in
+    adaptively sized batches.
+
+    Batches are formed by `AdaptiveBatcher` and pulled by whichever worker is idle, so no worker
+    is bound to a fixed share of the items. Batches complete in any order, so a slow batch does
+    not hold back the others; a result is held only until the earlier items of its group (e.g.
+    its output file) are yielded. At most `max_in_flight` batches are outstanding, counting both
+    the queued or running ones and the finished ones with results not yet yielded, so memory
+    stays bounded however long a slow batch holds back its group, see `BoundedTaskFeeder`.
+
+    Parameters:
+        pool (Pool): The worker pool.
+        func (Callable): A picklable function of one item.
+        items (Iterable[Any]): The items, consumed lazily.
+        cost (Callable): Size of an item in work units.
+        group (Callable): Key of the items sharing a per-unit cost and an output order.
+        max_in_flight (int): Maximum number of outstanding batches.
+        target_seconds (float): Wanted duration of one batch.
+        max_batch (int): Maximum number of items in one batch.
+        meter (UtilizationMeter, optional): Receives the duration of every item.
+
+    Returns:
+        Iterator[Any]: The results, in item order within each group.
+    """
+    # Items travel with their position in their group, which is how results are put back in order
+    counters: Dict[Hashable, int] = {}
+
+    def number(items: Iterable[Any]) -> Iterator[Tuple[int, Any]]:
+        for item in items:
+            key = group(item)
+            position = counters.get(key, 0)
+            counters[key] = position + 1
+            yield position, item
+
+    batcher = AdaptiveBatcher(
+        number(items), lambda numbered: cost(numbered[1]), lambda numbered: group(numbered[1]),
+        target_seconds, max_batch,
+    )
+    # A batch keeps its slot until its last result is yielded, not only until it is received
+    feeder = BoundedTaskFeeder(batcher, max_in_flight)
+    unyielded: Dict[int, int] = {}
+    next_position: Dict[Hashable, int] = {}
+    held: Dict[Hashable, Dict[int, Tuple[int, Any]]] = {}
+    worker = partial(run_batch, partial(_call_numbered, func))
+    for batch_index, results in enumerate(pool.imap_unordered(worker, feeder)):
+        if meter is not None:
+            meter.tasks += 1
+        unyielded[batch_index] = len(results)
+        if not results:
+            del unyielded[batch_index]
+            feeder.task_done()
+        for (position, item), seconds, result in results:
+            batcher.record((position, item), seconds)
+            if meter is not None:
+                meter.add(item, seconds)
+            key = group(item)
+            waiting = held.setdefault(key, {})
+            waiting[position] = (batch_index, result)
+            expected = next_position.get(key, 0)
+            while expected in waiting:
+                source, ready = waiting.pop(expected)
+                expected += 1
+                next_position[key] = expected
+                yield ready
+                unyielded[source] -= 1
+                if not unyielded[source]:
+                    del unyielded[source]
+                    feeder.task_done()
@@ -0,0 +1,227 @@
+from dataclasses import dataclass, asdict
+from typing import Dict, Iterable, List, Optional, Tuple
+import hashlib
+import os
+import orjson
+from pipeline.sharding import ShardTask, plan_shards
+
+MANIFEST_NAME = "manifest.jsonl"
+
+
+@dataclass(frozen=True)
+class ShardEntry:
+    """
+    Manifest entry of one written shard: which record ids it holds, which random stream they
+    came from, and where its bytes live.
+    """
+    shard_id: int
+    start_idx: int
+    stop_idx: int
+    count: int
+    seed: int
+    stream_key: Tuple[int, ...]
+    file: str
+    offset: int
+    length: int
+    sha256: str
+
+
+class ShardFileWriter:
+    """
+    Worker-side writer appending shard blobs to the worker's own part file.
+
+    Every worker process writes `part-<pid>.jsonl` in the shard directory, so no two processes
+    ever write to the same file and the parent never touches record bytes.
+    """
+
+    def __init__(self, directory: str, file_name: Optional[str] = None):
+        """
+        Initializes the writer.
+
+        Parameters:
+            directory (str): The shard directory, created if missing.
+            file_name (str, optional): The part file, `part-<pid>.jsonl` if None. Must be unique
+                per writing process, e.g. include the host name when nodes share the directory.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.file_name = file_name or f"part-{os.getpid()}.jsonl"
+
+    def write(self, task: ShardTask, blob: bytes, seed: int, stream_key: Tuple[int, ...]) -> ShardEntry:
+        """
+        Appends a shard's JSONL blob to the part file.
+
+        Parameters:
+            task (ShardTask): The shard the blob belongs to.
+            blob (bytes): The shard's records, see `encode_jsonl`.
+            seed (int): The global seed of the run.
+            stream_key (Tuple[int, ...]): The key of the shard's random stream, without the shard id.
+
+        Returns:
+            ShardEntry: The manifest entry describing the written bytes.
+        """
+        with open(os.path.join(self.directory, self.file_name), "ab") as f:
+            offset = f.seek(0, os.SEEK_END)
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        return ShardEntry(
+            shard_id=task.shard_id,
+            start_idx=task.start_idx,
+            stop_idx=task.stop_idx,
+            count=blob.count(b"\n"),
+            seed=seed,
+            stream_key=tuple(stream_key),
+            file=self.file_name,
+            offset=offset,
+            length=len(blob),
+            sha256=hashlib.sha256(blob).hexdigest(),
+        )
+
+
+class ShardManifest:
+    """
+    Parent-side, append-only manifest of the shards written to a shard directory.
+
+    A shard only counts as done once its entry is in the manifest, so bytes a crashed worker
+    appended to its part file without an entry are simply ignored. Resuming reads the manifest
+    instead of counting lines in the output.
+    """
+
+    def __init__(self, directory: str):
+        """
+        Opens (or creates) the manifest of a shard directory.
+
+        Parameters:
+            directory (str): The shard directory.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.path = os.path.join(directory, MANIFEST_NAME)
+        self.entries: List[ShardEntry] = self.load()
+
+    def load(self) -> List[ShardEntry]:
+        """
+        Reads the manifest entries. A truncated last line left by a crash is cut off, so later
+        entries are appended on a fresh line.
+
+        Returns:
+            List[ShardEntry]: The entries in commit order.
+        """
+        entries = []
+        if not os.path.exists(self.path):
+            return entries
+        with open(self.path, "rb+") as f:
+            content = f.read()
+            if content and not content.endswith(b"\n"):
+                f.truncate(content.rfind(b"\n") + 1)
+        for line in content.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                continue
+            data = orjson.loads(line)
+            data["stream_key"] = tuple(data["stream_key"])
+            entries.append(ShardEntry(**data))
+        return entries
+
+    def add(self, entry: ShardEntry) -> None:
+        """
+        Commits a written shard by appending its entry to the manifest.
+
+        Parameters:
+            entry (ShardEntry): The entry returned by `ShardFileWriter.write`.
+        """
+        with open(self.path, "ab") as f:
+            f.write(orjson.dumps(asdict(entry)) + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries.append(entry)
+
+    @property
+    def record_count(self) -> int:
+        """Number of records committed so far."""
+        return sum(entry.count for entry in self.entries)
+
+    def covered_stops(self) -> Dict[int, int]:
+        """
+        Returns, per shard id, the last record id committed for that shard.
+
+        A resumed run always continues a shard right after its last committed id, so the
+        committed ids of a shard are always `first_idx .. covered_stop`.
+        """
+        covered: Dict[int, int] = {}
+        for entry in self.entries:
+            covered[entry.shard_id] = max(covered.get(entry.shard_id, 0), entry.stop_idx)
+        return covered
+
+    def pending_tasks(self, num: int, shard_size: int, in_progress: Iterable[ShardTask] = ()) -> List[ShardTask]:
+        """
+        Plans the shard tasks still needed to cover record ids 1..num.
+
+        Parameters:
+            num (int): The total number of records wanted.
+            shard_size (int): Number of record ids per shard; must match the previous runs.
+            in_progress (Iterable[ShardTask]): Tasks not committed yet but already handed out,
+                counted as covered.
+
+        Returns:
+            List[ShardTask]: The missing shard tasks, in id order.
+        """
+        covered = self.covered_stops()
+        for task in in_progress:
+            covered[task.shard_id] = max(covered.get(task.shard_id, 0), task.stop_idx)
+        tasks = []
+        for task in plan_shards(1, num, shard_size):
+            start_idx = max(task.start_idx, covered.get(task.shard_id, 0) + 1)
+            if start_idx <= task.stop_idx:
+                tasks.append(ShardTask(task.shard_id, task.first_idx, start_idx, task.stop_idx))
+        return tasks
+
+    def read_shard(self, entry: ShardEntry) -> bytes:
+        """
+        Reads and verifies the bytes of a committed shard.
+
+        Raises:
+            ValueError: If the bytes do not match the recorded checksum.
+        """
+        with open(os.path.join(self.directory, entry.file), "rb") as f:
+            f.seek(entry.offset)
+            blob = f.read(entry.length)
+        if hashlib.sha256(blob).hexdigest() != entry.sha256:
+            raise ValueError(f"Checksum mismatch for shard {entry.shard_id} ({entry.start_idx}-{entry.stop_idx}) in {entry.file}.")
+        return blob
+
+    def merge(self, output_path: str, stop_idx: Optional[int] = None) -> int:
+        """
+        Concatenates the committed shards in record id order into one JSONL file.
+
+        Parameters:
+            output_path (str): The merged file, overwritten.
+            stop_idx (Optional[int]): Only merge shards ending at or before this id, all if None.
+
+        Returns:
+            int: Number of records written.
+        """
+        count = 0
+        tmp_path = f"{output_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            for entry in sorted(self.entries, key=lambda entry: entry.start_idx):
+                if stop_idx is not None and entry.stop_idx > stop_idx:
+                    continue
+                f.write(self.read_shard(entry))
+                count += entry.count
+        os.replace(tmp_path, output_path)
+        return count
+
+
+# ShardFileWriters of the current process by directory, see write_shard
+_shard_writers: Dict[Tuple[str, int], ShardFileWriter] = {}
+
+
+def write_shard(directory: str, task: ShardTask, blob: bytes, seed: int, stream_key: Tuple[int, ...]) -> ShardEntry:
+    """
+    Appends a shard to the calling worker's part file in `directory`, see `ShardFileWriter.write`.
+    """
+    key = (directory, os.getpid())
+    if key not in _shard_writers:
+        _shard_writers[key] = ShardFileWriter(directory)
+    return _shard_writers[key].write(task, blob, seed, stream_key)
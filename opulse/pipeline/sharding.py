@@ -0,0 +1,71 @@
+from dataclasses import dataclass
+from typing import List
+import hashlib
+
+
+@dataclass(frozen=True)
+class ShardTask:
+    """
+    A contiguous range of record ids generated from one random stream.
+
+    Record ids are 1-based. A shard always owns the ids `first_idx .. first_idx + shard_size - 1`;
+    when a run is resumed in the middle of a shard, records before `start_idx` are regenerated
+    (to advance the stream) but not emitted.
+    """
+    shard_id: int
+    first_idx: int
+    start_idx: int
+    stop_idx: int
+
+    @property
+    def count(self) -> int:
+        """Number of records the shard emits."""
+        return self.stop_idx - self.start_idx + 1
+
+
+def plan_shards(start_idx: int, stop_idx: int, shard_size: int) -> List[ShardTask]:
+    """
+    Splits the record ids `start_idx .. stop_idx` (inclusive) into shard tasks.
+
+    Shard boundaries only depend on `shard_size`, so the same record id always falls into the
+    same shard no matter where a run starts or stops.
+
+    Parameters:
+        start_idx (int): First record id to generate (1-based).
+        stop_idx (int): Last record id to generate (inclusive).
+        shard_size (int): Number of record ids per shard.
+
+    Returns:
+        List[ShardTask]: The shards covering the range, in id order.
+    """
+    if shard_size <= 0:
+        raise ValueError(f"shard_size must be positive, got {shard_size}.")
+    tasks = []
+    if start_idx > stop_idx:
+        return tasks
+    for shard_id in range((start_idx - 1) // shard_size, (stop_idx - 1) // shard_size + 1):
+        first_idx = shard_id * shard_size + 1
+        tasks.append(
+            ShardTask(
+                shard_id=shard_id,
+                first_idx=first_idx,
+                start_idx=max(first_idx, start_idx),
+                stop_idx=min(first_idx + shard_size - 1, stop_idx),
+            )
+        )
+    return tasks
+
+
+def stable_key(text: str) -> int:
+    """
+    Maps a string (e.g. a func_id) to a 63-bit integer usable as a random stream key.
+
+    Unlike `hash()`, the result is the same in every process and every run.
+
+    Parameters:
+        text (str): The string to map.
+
+    Returns:
+        int: A non-negative integer.
+    """
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big") >> 1
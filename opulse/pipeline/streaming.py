@@ -0,0 +1,72 @@
+from typing import Any, Callable, Iterable, Iterator
+from multiprocessing.pool import Pool
+import threading
+
+
+class BoundedTaskFeeder:
+    """
+    Iterable over tasks that never lets more than `max_in_flight` of them be outstanding.
+
+    `Pool.imap` pulls tasks from its input iterable in a background thread as fast as it can and
+    keeps every finished result until it is consumed. Wrapping the tasks in a feeder blocks that
+    thread once `max_in_flight` tasks have been handed out and not yet acknowledged with
+    `task_done`, which bounds both the queued tasks and the buffered results.
+    """
+
+    def __init__(self, tasks: Iterable[Any], max_in_flight: int):
+        """
+        Initializes the feeder.
+
+        Parameters:
+            tasks (Iterable[Any]): The tasks, consumed lazily.
+            max_in_flight (int): Maximum number of tasks handed out but not yet acknowledged.
+        """
+        if max_in_flight <= 0:
+            raise ValueError(f"max_in_flight must be positive, got {max_in_flight}.")
+        self.tasks = tasks
+        self.slots = threading.Semaphore(max_in_flight)
+
+    def __iter__(self) -> Iterator[Any]:
+        for task in self.tasks:
+            self.slots.acquire()
+            yield task
+
+    def task_done(self) -> None:
+        """
+        Acknowledges one consumed result, allowing the next task to be handed out.
+        """
+        self.slots.release()
+
+
+def imap_bounded(
+    pool: Pool,
+    func: Callable[[Any], Any],
+    tasks: Iterable[Any],
+    max_in_flight: int,
+    ordered: bool = True,
+) -> Iterator[Any]:
+    """
+    Streams `func(task)` results from a pool while keeping at most `max_in_flight` tasks
+    queued, running or waiting to be consumed.
+
+    A task's slot is freed when the consumer asks for the next result, i.e. after it has
+    finished processing (e.g. writing) the current one, so memory stays bounded no matter how
+    many tasks there are.
+
+    Parameters:
+        pool (Pool): The worker pool.
+        func (Callable): A picklable function of one argument.
+        tasks (Iterable[Any]): The tasks, consumed lazily.
+        max_in_flight (int): Maximum number of outstanding tasks.
+        ordered (bool): Yield results in task order (`imap`) instead of completion order
+            (`imap_unordered`). In-order results make the output files append-only in id order,
+            which keeps resuming by line count correct.
+
+    Returns:
+        Iterator[Any]: The results.
+    """
+    feeder = BoundedTaskFeeder(tasks, max_in_flight)
+    imap = pool.imap if ordered else pool.imap_unordered
+    for result in imap(func, feeder):
+        yield result
+        feeder.task_done()
@@ -0,0 +1,98 @@
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import time
+
+
+@dataclass
+class StageStats:
+    """
+    Counters of one validation stage: how often it ran, how often it rejected and the time it took.
+    """
+    runs: int = 0
+    rejections: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rejections_per_second(self) -> float:
+        """
+        Rejections per second spent in the stage; a stage that never ran scores highest, so it is tried early.
+        """
+        if self.runs == 0:
+            return float("inf")
+        return self.rejections / max(self.seconds, 1e-9)
+
+
+class StagedValidator:
+    """
+    Runs candidates through named checks and keeps per-stage timing and rejection counters.
+
+    `stage` runs one check. `run_cheapest_first` runs a group of independent checks, ordered by
+    the rejections per second each stage achieved so far, so the checks that throw out the most
+    candidates for the least time run first and the expensive ones only see the survivors.
+    """
+
+    def __init__(self):
+        self.stats: Dict[str, StageStats] = {}
+
+    def stage(self, name: str, check: Callable[..., Any], *args) -> Any:
+        """
+        Runs one check and records it.
+
+        Parameters:
+            name (str): The stage name.
+            check (Callable[..., Any]): The check; a falsy result rejects the candidate.
+            *args: The arguments of the check.
+
+        Returns:
+            Any: The result of the check, e.g. a parsed tree later stages reuse.
+        """
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = StageStats()
+        start = time.perf_counter()
+        try:
+            result = check(*args)
+        finally:
+            stats.seconds += time.perf_counter() - start
+            stats.runs += 1
+        if not result:
+            stats.rejections += 1
+        return result
+
+    def run_cheapest_first(self, checks: Sequence[Tuple[str, Callable[[], bool]]]) -> Optional[str]:
+        """
+        Runs independent checks, the best rejections per second first, until one rejects.
+
+        Parameters:
+            checks (Sequence[Tuple[str, Callable[[], bool]]]): The named checks, in the order to use
+                among stages without counters yet.
+
+        Returns:
+            Optional[str]: The name of the stage that rejected the candidate, or None if all passed.
+        """
+        empty = StageStats()
+        ordered = sorted(
+            checks, key=lambda item: -self.stats.get(item[0], empty).rejections_per_second
+        )
+        for name, check in ordered:
+            if not self.stage(name, check):
+                return name
+        return None
+
+    def summary(self) -> List[Dict[str, float]]:
+        """
+        Returns the counters of every stage, in the order the stages first ran.
+        """
+        return [
+            {"stage": name, "runs": s.runs, "rejections": s.rejections, "seconds": round(s.seconds, 6)}
+            for name, s in self.stats.items()
+        ]
+
+    def format_summary(self) -> str:
+        """
+        Returns the counters as one line per stage, for logs.
+        """
+        return "\n".join(
+            f"{name}: {s.rejections}/{s.runs} rejected, {s.seconds:.3f}s"
+            for name, s in self.stats.items()
+        )
@@ -0,0 +1,262 @@
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional
+import os
+import socket
+import threading
+import time
+import orjson
+
+QUEUE_NAME = "queue.json"
+
+
+def default_owner() -> str:
+    """
+    Returns an id for the calling process that is unique across the machines sharing a queue.
+    """
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _write_atomic(path: str, data: Dict[str, Any]) -> None:
+    tmp_path = f"{path}.{default_owner()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(orjson.dumps(data))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read(path: str) -> Dict[str, Any]:
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
+
+
+@dataclass(frozen=True)
+class Lease:
+    """
+    A task claimed by one worker: its name, its payload and the lease file the claim lives in.
+    """
+    name: str
+    payload: Dict[str, Any]
+    path: str
+
+
+class WorkQueue:
+    """
+    Work queue kept in a directory on a filesystem shared by all nodes, without any service.
+
+    Every task is one small JSON file that moves between three subdirectories:
+
+    - `pending/<name>`: waiting to be claimed.
+    - `leased/<name>@<owner>`: claimed by a worker. Claiming is an atomic rename, so exactly one
+      worker wins a task. The lease is kept alive by touching the file; a lease whose file was
+      not touched for `lease_seconds` is expired and the task is renamed back to pending.
+    - `done/<name>`: finished, holding the task payload and the worker's result.
+
+    A task that is finished twice (e.g. by a worker whose lease expired while it was still
+    running) simply overwrites its done file, so tasks must be deterministic.
+    """
+
+    def __init__(self, directory: str):
+        """
+        Opens (or creates) a queue directory.
+
+        Parameters:
+            directory (str): The queue directory.
+        """
+        self.directory = directory
+        self.pending_dir = os.path.join(directory, "pending")
+        self.leased_dir = os.path.join(directory, "leased")
+        self.done_dir = os.path.join(directory, "done")
+        for path in (self.pending_dir, self.leased_dir, self.done_dir):
+            os.makedirs(path, exist_ok=True)
+        self.path = os.path.join(directory, QUEUE_NAME)
+
+    def initialize(self, job: Dict[str, Any], lease_seconds: float = 600.0) -> Dict[str, Any]:
+        """
+        Records the job description every worker needs, unless the queue already has one.
+
+        Parameters:
+            job (Dict[str, Any]): The job description, e.g. worker spec, seed and output directory.
+            lease_seconds (float): Time after which an untouched lease expires.
+
+        Returns:
+            Dict[str, Any]: The job description in effect.
+        """
+        if not os.path.exists(self.path):
+            _write_atomic(self.path, {"lease_seconds": lease_seconds, "job": job})
+        return self.job
+
+    @property
+    def job(self) -> Dict[str, Any]:
+        """The job description, see `initialize`."""
+        return _read(self.path)["job"]
+
+    @property
+    def lease_seconds(self) -> float:
+        """Time after which an untouched lease expires."""
+        return _read(self.path)["lease_seconds"]
+
+    def known(self, name: str) -> bool:
+        """
+        Returns whether a task with this name was ever submitted.
+        """
+        if os.path.exists(os.path.join(self.pending_dir, name)) or os.path.exists(os.path.join(self.done_dir, name)):
+            return True
+        return any(lease.split("@", 1)[0] == name for lease in os.listdir(self.leased_dir))
+
+    def submit(self, name: str, payload: Dict[str, Any]) -> bool:
+        """
+        Adds a task, unless a task with this name was already submitted.
+
+        Parameters:
+            name (str): The task name, unique within the queue and without "@".
+            payload (Dict[str, Any]): The task description.
+
+        Returns:
+            bool: Whether the task was added.
+        """
+        if "@" in name:
+            raise ValueError(f"Task names cannot contain '@', got {name}.")
+        if self.known(name):
+            return False
+        _write_atomic(os.path.join(self.pending_dir, name), payload)
+        return True
+
+    def claim(self, owner: Optional[str] = None) -> Optional[Lease]:
+        """
+        Claims the first pending task.
+
+        Parameters:
+            owner (str, optional): The claiming worker, `default_owner()` if None.
+
+        Returns:
+            Optional[Lease]: The lease, None if no task is pending.
+        """
+        owner = owner or default_owner()
+        for name in sorted(os.listdir(self.pending_dir)):
+            if name.endswith(".tmp"):
+                continue
+            pending_path = os.path.join(self.pending_dir, name)
+            path = os.path.join(self.leased_dir, f"{name}@{owner}")
+            try:
+                # A rename keeps the mtime, so the lease would start out as old as the submission
+                # and `requeue_expired` could move it back before it is touched
+                os.utime(pending_path)
+                os.rename(pending_path, path)
+            except FileNotFoundError:
+                # Another worker claimed it first
+                continue
+            try:
+                os.utime(path)
+                return Lease(name, _read(path), path)
+            except FileNotFoundError:
+                # Requeued (and maybe claimed again) between the rename and now; the task is not ours
+                continue
+        return None
+
+    def renew(self, lease: Lease) -> bool:
+        """
+        Extends a lease.
+
+        Returns:
+            bool: False if the lease was lost, i.e. it expired and was requeued.
+        """
+        try:
+            os.utime(lease.path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    @contextmanager
+    def keep_alive(self, lease: Lease) -> Iterator[Lease]:
+        """
+        Renews a lease from a background thread while the body runs.
+        """
+        stop = threading.Event()
+        interval = self.lease_seconds / 3
+
+        def renew_until_stopped():
+            while not stop.wait(interval):
+                self.renew(lease)
+
+        thread = threading.Thread(target=renew_until_stopped, daemon=True)
+        thread.start()
+        try:
+            yield lease
+        finally:
+            stop.set()
+            thread.join()
+
+    def complete(self, lease: Lease, result: Dict[str, Any]) -> None:
+        """
+        Marks a claimed task as finished.
+
+        Parameters:
+            lease (Lease): The lease returned by `claim`.
+            result (Dict[str, Any]): The worker's result, kept next to the payload.
+        """
+        _write_atomic(os.path.join(self.done_dir, lease.name), {"task": lease.payload, "result": result})
+        try:
+            os.remove(lease.path)
+        except FileNotFoundError:
+            pass
+
+    def requeue_expired(self) -> int:
+        """
+        Moves tasks whose lease was not renewed for `lease_seconds` back to pending.
+
+        Returns:
+            int: Number of requeued tasks.
+        """
+        requeued = 0
+        deadline = time.time() - self.lease_seconds
+        for lease_name in os.listdir(self.leased_dir):
+            path = os.path.join(self.leased_dir, lease_name)
+            try:
+                if os.path.getmtime(path) >= deadline:
+                    continue
+                os.rename(path, os.path.join(self.pending_dir, lease_name.split("@", 1)[0]))
+                requeued += 1
+            except FileNotFoundError:
+                continue
+        return requeued
+
+    def outstanding(self) -> List[Dict[str, Any]]:
+        """
+        Returns the payloads of the pending and leased tasks.
+        """
+        payloads = []
+        for directory in (self.pending_dir, self.leased_dir):
+            for name in os.listdir(directory):
+                if name.endswith(".tmp"):
+                    continue
+                try:
+                    payloads.append(_read(os.path.join(directory, name)))
+                except FileNotFoundError:
+                    continue
+        return payloads
+
+    def results(self) -> Iterator[Dict[str, Any]]:
+        """
+        Yields the done files, i.e. {"task": payload, "result": result}, in name order.
+        """
+        for name in sorted(os.listdir(self.done_dir)):
+            if not name.endswith(".tmp"):
+                yield _read(os.path.join(self.done_dir, name))
+
+    def status(self) -> Dict[str, int]:
+        """
+        Returns the number of pending, leased and done tasks.
+        """
+        return {
+            state: sum(1 for name in os.listdir(directory) if not name.endswith(".tmp"))
+            for state, directory in (("pending", self.pending_dir), ("leased", self.leased_dir), ("done", self.done_dir))
+        }
+
+    def is_finished(self) -> bool:
+        """
+        Returns whether no task is pending or leased.
+        """
+        status = self.status()
+        return status["pending"] == 0 and status["leased"] == 0
@@ -0,0 +1,6 @@
+# Forkserver preload hook, see get_pool_context: importing this module loads the operator set of
+# the WorkerSpec published by export_for_preload, so every forked worker inherits it. Nothing else
+# should import it.
+from pipeline.worker_state import preload_worker_state
+
+preload_worker_state()
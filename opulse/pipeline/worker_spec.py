@@ -0,0 +1,110 @@
+from dataclasses import dataclass, replace
+from typing import Any, Dict, Iterable, Optional, Tuple
+import multiprocessing
+import json
+import os
+from config import ParamConfig
+
+# Environment variable a forkserver reads at startup to preload the operator set, see export_for_preload
+WORKER_SPEC_ENV = "OPULSE_WORKER_SPEC"
+
+
+@dataclass(frozen=True)
+class WorkerSpec:
+    """
+    Everything a worker needs to rebuild its state, instead of receiving pickled managers and generators.
+
+    Overrides are (dotted key, value) pairs applied on top of the loaded config, e.g.
+    ("random_base.base", 16) sets `config["random_base"]["base"]`.
+    """
+    config_path: str
+    operators_path: str
+    cython_cache_dir: str
+    overrides: Tuple[Tuple[str, Any], ...] = ()
+
+    def with_overrides(self, overrides: Dict[str, Any]) -> "WorkerSpec":
+        """
+        Returns a copy of the spec with additional config overrides.
+
+        Parameters:
+            overrides (Dict[str, Any]): Dotted config keys and their values; later values win.
+
+        Returns:
+            WorkerSpec: The new spec.
+        """
+        merged = dict(self.overrides)
+        merged.update(overrides)
+        return replace(self, overrides=tuple(sorted(merged.items())))
+
+    @property
+    def operator_key(self) -> Tuple[str, str, str]:
+        """
+        The part of the spec the operator set depends on; specs differing only in overrides share it.
+        """
+        return (self.config_path, self.operators_path, self.cython_cache_dir)
+
+    def load_config(self) -> ParamConfig:
+        """
+        Loads the config file and applies the overrides.
+
+        Returns:
+            ParamConfig: The config.
+        """
+        config = ParamConfig(self.config_path)
+        for key, value in self.overrides:
+            *parents, leaf = key.split(".")
+            section = config.config
+            for parent in parents:
+                section = section.setdefault(parent, {})
+            section[leaf] = value
+        return config
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "config_path": self.config_path,
+                "operators_path": self.operators_path,
+                "cython_cache_dir": self.cython_cache_dir,
+                "overrides": [list(item) for item in self.overrides],
+            }
+        )
+
+    @staticmethod
+    def from_json(text: str) -> "WorkerSpec":
+        data = json.loads(text)
+        data["overrides"] = tuple(tuple(item) for item in data["overrides"])
+        return WorkerSpec(**data)
+
+
+def export_for_preload(spec: WorkerSpec) -> None:
+    """
+    Publishes the spec in the environment, so a forkserver started afterwards can preload the
+    operator set once and fork every worker from that warm state.
+    """
+    os.environ[WORKER_SPEC_ENV] = spec.to_json()
+
+
+def preloaded_spec() -> Optional[WorkerSpec]:
+    """
+    Returns the spec published by `export_for_preload`, or None.
+    """
+    text = os.environ.get(WORKER_SPEC_ENV)
+    return WorkerSpec.from_json(text) if text else None
+
+
+def get_pool_context(start_method: Optional[str] = None, preload: Iterable[str] = ("pipeline.worker_preload",)):
+    """
+    Returns the multiprocessing context pools are created from.
+
+    Parameters:
+        start_method (Optional[str]): "fork", "spawn" or "forkserver"; the platform default if None.
+        preload (Iterable[str]): Modules the forkserver imports once before forking workers. The
+            default `pipeline.worker_preload` loads the operator set of the published `WorkerSpec`.
+
+    Returns:
+        multiprocessing.context.BaseContext: The context.
+    """
+    context = multiprocessing.get_context(start_method)
+    if context.get_start_method() == "forkserver" and preload:
+        context.set_forkserver_preload(list(preload))
+    return context
@@ -0,0 +1,76 @@
+from typing import Dict, Optional, Tuple
+from config import LogConfig, ParamConfig
+from operatorplus.compiler import CythonCompiler
+from operatorplus.operator_manager import OperatorManager
+from expression import ExpressionGenerator
+from pipeline.worker_spec import WorkerSpec, preloaded_spec
+
+# OperatorManagers by WorkerSpec.operator_key. When a forkserver preloads `pipeline.worker_preload`
+# (see get_pool_context) the operator set is loaded once there and inherited by every worker.
+_operator_managers: Dict[Tuple[str, str, str], OperatorManager] = {}
+
+# ExpressionGenerators by WorkerSpec, so a long-lived worker can serve tasks with different overrides
+_expression_generators: Dict[WorkerSpec, ExpressionGenerator] = {}
+
+
+def load_operator_manager(
+    spec: WorkerSpec, config: Optional[ParamConfig] = None, log: Optional[LogConfig] = None
+) -> OperatorManager:
+    """
+    Returns the operator manager of a spec, loading and compiling the operator set on first use.
+
+    Specs that only differ in their config overrides share one manager.
+
+    Parameters:
+        spec (WorkerSpec): The worker spec.
+        config (ParamConfig, optional): The loaded config, `spec.load_config()` if None.
+        log (LogConfig, optional): The log config, built from `config` if None.
+
+    Returns:
+        OperatorManager: The operator manager.
+    """
+    key = spec.operator_key
+    if key not in _operator_managers:
+        if config is None:
+            config = spec.load_config()
+        if log is None:
+            log = LogConfig(config.get_logging_config())
+        compiler = CythonCompiler(spec.cython_cache_dir)
+        _operator_managers[key] = OperatorManager(
+            spec.operators_path, config, log, spec.cython_cache_dir, compiler, True
+        )
+    return _operator_managers[key]
+
+
+def load_expression_generator(spec: WorkerSpec) -> ExpressionGenerator:
+    """
+    Returns the expression generator of a spec, building it on first use.
+
+    Generators of specs that only differ in their config overrides (e.g. base and depth) share
+    the operator manager, so switching between them costs one config load, not a pool restart.
+
+    Parameters:
+        spec (WorkerSpec): The worker spec, including its overrides.
+
+    Returns:
+        ExpressionGenerator: The expression generator.
+    """
+    if spec not in _expression_generators:
+        config = spec.load_config()
+        log = LogConfig(config.get_logging_config())
+        _expression_generators[spec] = ExpressionGenerator(
+            config, log, spec.cython_cache_dir, operator_manager=load_operator_manager(spec, config, log)
+        )
+    return _expression_generators[spec]
+
+
+def preload_worker_state() -> None:
+    """
+    Loads the operator set of the spec published by `export_for_preload`, if any.
+
+    Run by the forkserver when it imports `pipeline.worker_preload`; importing this module does
+    not load anything.
+    """
+    spec = preloaded_spec()
+    if spec is not None:
+        load_operator_manager(spec)
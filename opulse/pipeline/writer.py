@@ -0,0 +1,131 @@
+from collections import OrderedDict
+from typing import BinaryIO, Callable, Optional, Sequence
+import os
+import queue
+import threading
+
+FSYNC_POLICIES = ("batch", "close", "never")
+
+# Queue item telling the writer thread to stop
+_STOP = object()
+
+
+class AsyncWriter:
+    """
+    Background thread appending pre-serialized byte batches to files.
+
+    The caller hands over a batch with `submit` and goes back to collecting results while the
+    thread writes it with one `writelines` call. The queue between them is bounded, so a slow
+    disk throttles the producer instead of piling up batches in memory.
+
+    fsync policies:
+
+    - "batch": fsync after every batch, before its callback runs. Use this when the callback
+      commits the batch somewhere (e.g. a run manifest).
+    - "close": fsync every file once, when it is closed.
+    - "never": leave flushing to the OS.
+    """
+
+    def __init__(self, max_pending: int = 4, fsync: str = "batch", max_open_files: int = 64):
+        """
+        Starts the writer thread.
+
+        Parameters:
+            max_pending (int): Maximum number of batches submitted but not yet written.
+            fsync (str): The fsync policy, see above.
+            max_open_files (int): Files kept open at once; the least recently written is closed first.
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, got {fsync}.")
+        if max_pending <= 0:
+            raise ValueError(f"max_pending must be positive, got {max_pending}.")
+        self.fsync = fsync
+        self.max_open_files = max_open_files
+        self.files: "OrderedDict[str, BinaryIO]" = OrderedDict()
+        self.batches: queue.Queue = queue.Queue(maxsize=max_pending)
+        self.error: Optional[BaseException] = None
+        self.thread = threading.Thread(target=self._run, name="AsyncWriter", daemon=True)
+        self.thread.start()
+
+    def submit(
+        self, path: str, lines: Sequence[bytes], on_written: Optional[Callable[[int], None]] = None
+    ) -> None:
+        """
+        Queues a batch to be appended to a file, blocking while `max_pending` batches are queued.
+
+        Parameters:
+            path (str): The file, opened in append mode on first use.
+            lines (Sequence[bytes]): The batch, each item already ending with a newline.
+            on_written (Callable[[int], None], optional): Called in the writer thread with the
+                file size after the batch, once it is written (and fsynced under "batch").
+
+        Raises:
+            RuntimeError: If an earlier batch failed to be written.
+        """
+        self._raise_error()
+        self.batches.put((path, lines, on_written))
+
+    def flush(self) -> None:
+        """
+        Waits until every submitted batch is written.
+        """
+        self.batches.join()
+        self._raise_error()
+
+    def close(self) -> None:
+        """
+        Writes the remaining batches, closes every file and stops the thread.
+        """
+        if self.thread.is_alive():
+            self.batches.put(_STOP)
+            self.thread.join()
+        self._raise_error()
+
+    def __enter__(self) -> "AsyncWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def _raise_error(self) -> None:
+        if self.error is not None:
+            raise RuntimeError(f"Writing a batch failed: {self.error!r}") from self.error
+
+    def _open(self, path: str) -> BinaryIO:
+        f = self.files.pop(path, None)
+        if f is None:
+            f = open(path, "ab")
+            while len(self.files) >= self.max_open_files:
+                self._close_file(self.files.popitem(last=False)[1])
+        self.files[path] = f
+        return f
+
+    def _close_file(self, f: BinaryIO) -> None:
+        f.flush()
+        if self.fsync != "never":
+            os.fsync(f.fileno())
+        f.close()
+
+    def _run(self) -> None:
+        while True:
+            item = self.batches.get()
+            try:
+                if item is _STOP:
+                    while self.files:
+                        self._close_file(self.files.popitem()[1])
+                elif self.error is None:
+                    # After a failure the remaining batches are dropped; submit raises the error
+                    path, lines, on_written = item
+                    f = self._open(path)
+                    f.writelines(lines)
+                    f.flush()
+                    if self.fsync == "batch":
+                        os.fsync(f.fileno())
+                    if on_written is not None:
+                        on_written(f.tell())
+            except BaseException as e:
+                self.error = e
+            finally:
+                self.batches.task_done()
+            if item is _STOP:
+                return
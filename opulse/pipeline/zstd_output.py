@@ -0,0 +1,203 @@
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import bisect
+import os
+import orjson
+
+try:
+    import zstandard
+except ImportError:  # zstandard is only needed for compressed output
+    zstandard = None
+
+
+def require_zstandard() -> None:
+    """
+    Raises an ImportError explaining how to enable compressed output if zstandard is missing.
+    """
+    if zstandard is None:
+        raise ImportError("zstd compressed output needs zstandard; install it with `pip install zstandard`.")
+
+
+@dataclass(frozen=True)
+class FrameEntry:
+    """
+    Index entry of one zstd frame: the id of its first record, its position in the file and
+    its number of records.
+    """
+    first_id: int
+    offset: int
+    length: int
+    count: int
+
+
+def compress_frames(blob: bytes, frame_records: int, level: int = 3) -> Tuple[bytes, List[FrameEntry]]:
+    """
+    Compresses a JSONL blob into independent zstd frames of at most `frame_records` records.
+
+    Every frame can be decompressed on its own, so frames can be read in parallel and a record
+    is found by decompressing a single frame. Concatenated frames are still a valid zstd stream,
+    i.e. `zstd -d` restores the plain JSONL file.
+
+    Parameters:
+        blob (bytes): The JSONL blob, see `encode_jsonl`.
+        frame_records (int): Maximum number of records per frame.
+        level (int): The zstd compression level.
+
+    Returns:
+        Tuple[bytes, List[FrameEntry]]: The frames and their entries, with offsets relative to
+        the start of the returned bytes.
+    """
+    require_zstandard()
+    compressor = zstandard.ZstdCompressor(level=level)
+    lines = blob.splitlines(keepends=True)
+    chunks = []
+    frames = []
+    offset = 0
+    for start in range(0, len(lines), frame_records):
+        frame_lines = lines[start:start + frame_records]
+        chunk = compressor.compress(b"".join(frame_lines))
+        first_id = orjson.loads(frame_lines[0]).get("id")
+        frames.append(FrameEntry(first_id, offset, len(chunk), len(frame_lines)))
+        chunks.append(chunk)
+        offset += len(chunk)
+    return b"".join(chunks), frames
+
+
+class FrameIndex:
+    """
+    Append-only sidecar index of a zstd JSONL file, one JSON line per frame.
+    """
+
+    def __init__(self, path: str):
+        """
+        Opens (or creates) a frame index.
+
+        Parameters:
+            path (str): The index file, e.g. `<output>.zst.idx`.
+        """
+        self.path = path
+        self.entries: List[FrameEntry] = self.load()
+
+    def load(self) -> List[FrameEntry]:
+        """
+        Reads the entries. A truncated last line left by a crash is ignored.
+        """
+        entries = []
+        if not os.path.exists(self.path):
+            return entries
+        with open(self.path, "rb") as f:
+            for line in f:
+                if line.endswith(b"\n"):
+                    entries.append(FrameEntry(**orjson.loads(line)))
+        return entries
+
+    def add(self, base_offset: int, frames: List[FrameEntry]) -> None:
+        """
+        Appends the frames of a chunk written at `base_offset` of the data file.
+
+        Parameters:
+            base_offset (int): Offset of the chunk in the data file.
+            frames (List[FrameEntry]): The chunk's entries, see `compress_frames`.
+        """
+        entries = [FrameEntry(frame.first_id, base_offset + frame.offset, frame.length, frame.count) for frame in frames]
+        with open(self.path, "ab") as f:
+            f.write(b"".join(orjson.dumps(asdict(entry)) + b"\n" for entry in entries))
+        self.entries.extend(entries)
+
+    def truncate(self, end_offset: int) -> int:
+        """
+        Drops the entries of frames not entirely before `end_offset`, e.g. after the data file
+        was rolled back to its last commit, and rewrites the index.
+
+        Returns:
+            int: Number of dropped entries.
+        """
+        kept = [entry for entry in self.entries if entry.offset + entry.length <= end_offset]
+        dropped = len(self.entries) - len(kept)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"".join(orjson.dumps(asdict(entry)) + b"\n" for entry in kept))
+        os.replace(tmp_path, self.path)
+        self.entries = kept
+        return dropped
+
+    def locate(self, record_id: int) -> Optional[FrameEntry]:
+        """
+        Returns the frame holding a record id, None if no frame starts at or before it.
+        """
+        position = bisect.bisect_right([entry.first_id for entry in self.entries], record_id) - 1
+        return self.entries[position] if position >= 0 else None
+
+
+class ZstdJsonlReader:
+    """
+    Random-access reader of a zstd JSONL file written with a `FrameIndex`.
+    """
+
+    def __init__(self, path: str, index_path: Optional[str] = None):
+        """
+        Opens a compressed file.
+
+        Parameters:
+            path (str): The data file.
+            index_path (str, optional): The index, `<path>.idx` if None.
+        """
+        require_zstandard()
+        self.path = path
+        self.index = FrameIndex(index_path or f"{path}.idx")
+        self.decompressor = zstandard.ZstdDecompressor()
+
+    def read_frame(self, entry: FrameEntry) -> bytes:
+        """
+        Reads and decompresses one frame.
+
+        Returns:
+            bytes: The frame's JSONL lines.
+        """
+        with open(self.path, "rb") as f:
+            f.seek(entry.offset)
+            return self.decompressor.decompress(f.read(entry.length))
+
+    def get(self, record_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Returns the record with this id, decompressing only its frame; None if it is missing.
+        """
+        entry = self.index.locate(record_id)
+        if entry is None:
+            return None
+        for line in self.read_frame(entry).splitlines():
+            record = orjson.loads(line)
+            if record.get("id") == record_id:
+                return record
+        return None
+
+    def iter_records(self, start_id: int = 1) -> Iterator[Dict[str, Any]]:
+        """
+        Yields the records from `start_id` on, starting at the frame holding it.
+        """
+        entry = self.index.locate(start_id)
+        position = self.index.entries.index(entry) if entry is not None else 0
+        for entry in self.index.entries[position:]:
+            for line in self.read_frame(entry).splitlines():
+                record = orjson.loads(line)
+                if record.get("id", start_id) >= start_id:
+                    yield record
+
+
+def commit_compressed_shard(
+    frame_index: FrameIndex, run_manifest: Any, task: Any, length: int, frames: List[FrameEntry], end_offset: int
+) -> None:
+    """
+    `AsyncWriter` callback of a compressed shard: indexes its frames, then commits it to the run
+    manifest, so every committed record is reachable through the index.
+
+    Parameters:
+        frame_index (FrameIndex): The index of the data file.
+        run_manifest (RunManifest): The run manifest of the data file.
+        task (ShardTask): The shard.
+        length (int): Size of the shard's compressed bytes.
+        frames (List[FrameEntry]): The shard's frames, see `compress_frames`.
+        end_offset (int): Size of the data file after the shard.
+    """
+    frame_index.add(end_offset - length, frames)
+    run_manifest.commit(task, sum(frame.count for frame in frames), end_offset)